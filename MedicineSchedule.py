@@ -1,184 +1,255 @@
-import atexit
+import asyncio
 import re
 import threading
 import time
-from collections import deque
 from datetime import datetime, timedelta
 
-import requests
 from dateutil import parser
 
+from alerts import Alert, Step, alerts
+from async_core import core
+from audio_arbiter import PRIORITY_REMINDER, arbiter
+from audio_player import player
 from commandHandler import command_patterns
 from config import (
-    BASE_URL,
     DOSAGE_COUNT,
     DOSAGE_TIME,
     DUMMY_ID,
-    FE_USER_ID,
-    INDUCE_TIME,
-    MEAL_TIME,
     USER_ID,
+    USER_IDS,
 )
-from global_state import pending_alerts # 정해진 루틴이 있으므로 Queue 설정
-from gpio_controller import GPIOController
-from llmTts import conversation_and_check, post_taking_medicine
+from gpio_controller import SCEDULE_SWITCH, gpio
+from http_client import client
+from llmTts import conversation_and_check_async, post_taking_medicine_async
+from outbox import confirmations
 from RequestStt import upload_stt
-from RequestTts import text_to_voice
+from RequestTts import prewarm_tts, text_to_voice
+from schedule_store import SYNC_INTERVAL, store, sync_all
+from user_directory import directory
 from util import auto_save_mic, auto_save_speaker, wait_for_microphone
 
-gpio = GPIOController(refresh_callback=lambda: on_button_schedule())
-atexit.register(gpio.cleanup)
 
-scheduled_times_set = set() 
 ALARM_TOLERANCE_MINUTES = 1
 MAX_CONFIRMATION_WAIT = DOSAGE_TIME 
-
-# 사용자 이름 가져오는 함수
-def get_user_name(user_id):
-    try:
-        res = requests.get(f"{BASE_URL}/api/users")
-        if res.status_code == 200:
-            users = res.json().get("users_list", [])
-            for user in users:
-                if user["id"] == user_id:
-                    return user["name"]
-    except Exception as e:
-        print(f"이름 조회 실패: {e}")
-        gpio.set_mode("error")
-    return "사용자"
-
-USER_NAME = get_user_name(USER_ID)
+MAX_ALERT_SLEEP = 60 # 다음 알람이 멀어도 이 간격으로는 깨어나 시계 변경(NTP 동기화 등)을 반영
+MERGE_WINDOW_MINUTES = 1 # 이 시간 안에 겹치는 다른 사용자의 같은 스텝은 한 번에 안내
 
 # 복약 정보 함수
-def medicine_alert(sched_dt: datetime, dosage_mg, schedule_id):
-    alert = {
-        "schedule_id": schedule_id,
-        "scheduled_time": sched_dt.strftime("%H:%M"),
-        "dosage_mg": dosage_mg,
-        "retry_count": 0,
-        "sched_dt": sched_dt,
-        "wait_for_confirmation": False,
-        "confirmation_started_at": 0,
-        "steps": deque([
-            {"offset": -MEAL_TIME, "responsetype": "check_meal", "message": f"{USER_NAME}님 약 드시기 {MEAL_TIME}분 전입니다. 약 드시기 전에 식사 하셨나요?"},
-            # {"offset": -INDUCE_TIME, "responsetype": "induce_medicine", "message": f"{USER_NAME}님 요 며칠 약 챙겨드시기 어려우셨죠?"},
-            {"offset": 0, "responsetype": "taking_medicine_time"},
-            {"offset": DOSAGE_TIME, "responsetype": "check_medicine", "message": f"{USER_NAME}님 약 {dosage_mg}mg 드셨나요 ?"},
-        ])
-    }
-    pending_alerts.append(alert)
-    print(f"복약 응답 대기중... 현재 {len(pending_alerts)}건")
-
-# 스텝 처리
-def process_step(alert, step):
+def medicine_alert(sched_dt: datetime, dosage_mg, schedule_id, user_id=USER_ID):
+    add_alert(Alert(schedule_id, sched_dt, dosage_mg, user_id))
+
+# 알람을 목록에 넣고 상태를 저장하는 함수
+def add_alert(alert):
+    alerts.add(alert)
+    save_alert_state(alert)
+    prewarm_tts([m for m in (step.message(alert, directory.name(alert.user_id)) for step in alert.steps) if m]) # 알림 문구는 시간 전에 미리 받아둠
+    print(f"복약 응답 대기중... 현재 {len(alerts)}건")
+
+# 오늘 진행 중이던 알람을 저장소에서 복원하는 함수 (스케줄 등록보다 먼저 호출)
+def restore_alerts():
+    snapshots = store.load_alerts(datetime.now().date())
+    for state in snapshots:
+        try:
+            alert = Alert.from_snapshot(state)
+        except (KeyError, TypeError, ValueError) as e: # 형식이 다른 예전 스냅샷
+            print(f"알람 상태 복원 실패: {e}")
+            continue
+        if not alerts.seen(alert.key):
+            add_alert(alert)
+    if snapshots:
+        print(f"이전에 진행 중이던 알람 {len(snapshots)}건 복원")
+
+# 알람을 다음 스텝 시각 기준으로 다시 예약하는 함수
+# 스텝이 바뀔 때마다 불리므로 여기서 상태 스냅샷도 갱신함 (진행 중에 꺼지면 그 스텝부터 다시 실행)
+def schedule_alert(alert):
+    if alerts.reschedule(alert):
+        save_alert_state(alert)
+
+def save_alert_state(alert):
+    if alert.removed:
+        return
     try:
-        if step["responsetype"] == "taking_medicine_time": # 복약시간 
-            post_taking_medicine(DUMMY_ID, FE_USER_ID)
-            alert["wait_for_confirmation"] = True
-            alert["confirmation_started_at"] = datetime.now()
+        store.save_alert(alert.store_key(), alert.sched_dt.date(), alert.snapshot())
+    except Exception as e: # 저장에 실패해도 알람은 메모리에서 계속 진행
+        print(f"알람 상태 저장 실패: {e}")
+
+# 알람을 목록에서 빼는 함수 (힙에 남은 항목은 꺼낼 때 버려짐)
+def remove_alert(alert):
+    if alerts.remove(alert):
+        try:
+            store.delete_alert(alert.store_key())
+        except Exception as e:
+            print(f"알람 상태 삭제 실패: {e}")
+
+# 복약 재확인에 실패한 알람을 다시 예약하거나 (재시도 횟수 초과면) 제거하는 함수
+def retry_or_remove(alert):
+    alert.retry_count += 1
+    if alert.retry_count < DOSAGE_COUNT: # 재알림
+        print(f"복약 실패 → {DOSAGE_TIME}분 후 재시도 예정 ({alert.retry_count}/{DOSAGE_COUNT})")
+        alert.sched_dt = datetime.now()
+        alert.steps.appendleft(Step(DOSAGE_TIME, "check_medicine"))
+    else:
+        print("최대 복약 재시도 초과로 알림 제거")
+        remove_alert(alert)
+
+# 안내가 중단되어 끝내지 못한 스텝을 지금 시각에 다시 넣는 함수 (스피커가 비면 다시 실행됨)
+def requeue_step(alert, step):
+    offset = (datetime.now() - alert.sched_dt).total_seconds() / 60
+    alert.steps.appendleft(Step(offset, step.responsetype))
+
+# 안내부터 답 녹음까지 스피커와 마이크를 함께 잡고 진행하는 함수 (사용자 대화 중이면 끝날 때까지 기다렸다가 시작)
+# 반환값: (안내를 끝까지 했는지, 인식 결과) - 안내가 중단되면 녹음하지 않음
+def ask_and_listen(message):
+    with arbiter.session(("speaker", "mic"), PRIORITY_REMINDER, name="reminder", on_preempt=player.stop):
+        if not text_to_voice(message):
+            return False, None
+        return True, upload_stt()
+
+# 스텝 처리 코루틴 (스케줄러 thread를 막지 않도록 이벤트 루프에서 실행)
+# 마이크/스피커를 쓰는 부분은 중재자에서 차례를 기다려야 하므로 별도 thread에서 실행
+# group은 사용자가 모두 다른 같은 종류의 (알람, 스텝) 목록 - 여러 사용자의 알림 시각이 겹치면 한 번 묻고 한 번 녹음한 뒤
+# 서버에는 사용자별로 동시에 요청하고, 답변 음성은 첫 요청 것만 재생
+async def process_steps(group):
+    alert, step = group[0]
+    try:
+        if step.responsetype == "taking_medicine_time": # 복약시간 
+            await asyncio.gather(*(
+                post_taking_medicine_async(DUMMY_ID, a.user_id, play_audio=i == 0) for i, (a, _) in enumerate(group)
+            ))
+            for a, _ in group:
+                a.wait_for_confirmation = True
+                a.confirmation_started_at = datetime.now()
             return
 
-        print(step["message"])
-        text_to_voice(step["message"])
-
-        user_response = upload_stt() # 사용자 음성 녹음
+        # 문구는 스텝이 실행될 때 만듦
+        if len(group) == 1:
+            message = step.message(alert, directory.name(alert.user_id))
+        else:
+            message = step.merged_message([(a, directory.name(a.user_id)) for a, _ in group])
+        print(message)
+        # 사용자 음성 녹음 (겹친 알람 모두 이 녹음으로 판단)
+        asked, user_response = await asyncio.to_thread(ask_and_listen, message)
+        if not asked: # 더 높은 우선순위 작업에 스피커를 넘겨준 경우
+            print("안내가 중단되어 대화가 끝난 뒤 다시 안내합니다.")
+            for a, s in group:
+                requeue_step(a, s)
+            return
         if user_response:
-            result = conversation_and_check(
-                responsetype=step["responsetype"],
-                schedule_id=alert["schedule_id"],
-                user_id=FE_USER_ID
-            )
-            if step["responsetype"] == "check_medicine": # 복약여부 재체크
-                if result:
-                    handle_medicine_confirmation(alert)
-                else:
-                    alert["retry_count"] += 1
-                    if alert["retry_count"] < DOSAGE_COUNT: # 재알림
-                        print(f"복약 실패 → {DOSAGE_TIME}분 후 재시도 예정 ({alert['retry_count']}/{DOSAGE_COUNT})")
-                        alert["sched_dt"] = datetime.now()
-                        alert["steps"].appendleft({
-                            "offset": DOSAGE_TIME,
-                            "responsetype": "check_medicine",
-                            "message": f"{USER_NAME}님 약 {alert['dosage_mg']}mg 드셨나요 ?"
-                        })
+            results = await asyncio.gather(*(
+                conversation_and_check_async(
+                    responsetype=step.responsetype,
+                    schedule_id=a.schedule_id,
+                    user_id=a.user_id,
+                    play_audio=i == 0
+                ) for i, (a, _) in enumerate(group)
+            ))
+            if step.responsetype == "check_medicine": # 복약여부 재체크
+                confirmed = False
+                for (a, _), result in zip(group, results):
+                    if result:
+                        confirmed = await asyncio.to_thread(handle_medicine_confirmation, a, False) or confirmed
                     else:
-                        print("최대 복약 재시도 초과로 알림 제거")
-                        pending_alerts.remove(alert)
+                        retry_or_remove(a)
+                if confirmed:
+                    await asyncio.to_thread(text_to_voice, "복약 기록 완료")
         else:
-            text_to_voice("음성 인식에 실패했습니다.")
-            gpio.set_mode("error")
+            await asyncio.to_thread(text_to_voice, "음성 인식에 실패했습니다.")
+            gpio.flash("error")
     except Exception as e:
-        gpio.set_mode("error")
+        gpio.flash("error")
         print(f"스텝 처리 중 오류: {e}")
 
-# 복약 시간 처리 함수
+# 복약 시간 처리 함수 (시간이 된 알람만 꺼내서 처리)
+# 시간이 된 스텝이 있으면 MERGE_WINDOW_MINUTES 안에 오는 다른 사용자의 같은 종류 스텝만 앞당겨서 함께 처리
 def process_immediate_alert():
-    now = datetime.now()
-    
-    for alert in list(pending_alerts):
-        if not alert["steps"]:
-            continue
-
-        step = alert["steps"][0]
-        target_time = alert["sched_dt"] + timedelta(minutes=step["offset"])
-
-        if now > target_time + timedelta(minutes=ALARM_TOLERANCE_MINUTES): # 시간이 지나면 큐에서 해당 알람 제거
-            alert["steps"].popleft()
+    while True:
+        now = datetime.now()
+        alert = alerts.pop_due(now)
+        if alert is None:
+            return
+        responsetype = alert.steps[0].responsetype
+        users = {alert.user_id}
+        merge_until = now + timedelta(minutes=MERGE_WINDOW_MINUTES)
+
+        group = []
+        for alert in [alert] + alerts.pop_merge(merge_until, responsetype, users):
+            step = alert.steps.popleft()
+            target_time = alert.sched_dt + timedelta(minutes=step.offset)
+
+            if now > target_time + timedelta(minutes=ALARM_TOLERANCE_MINUTES): # 허용 시간이 지난 스텝은 건너뜀
+                schedule_alert(alert)
+                continue
+            group.append((alert, step))
+        if not group:
             continue
 
-        if now >= target_time:
-            alert["steps"].popleft()
-            process_step(alert, step)
+        # 스텝이 끝나면 다음 스텝 (또는 재시도 스텝) 기준으로 다시 예약 (그 전까지는 힙에 없으므로 중복 실행되지 않음)
+        future = core.submit(process_steps(group))
+        future.add_done_callback(lambda _, group=group: [schedule_alert(a) for a, _ in group])
 
 # 알람 무한루프 함수
 def input_loop():
     while True:
         process_immediate_alert()
-        time.sleep(0.5)
+        alerts.wait_next(MAX_ALERT_SLEEP)
 
-# 당일 복약 스케줄 가져오는 함수
-def get_today_schedule():
-    url = f"{BASE_URL}/api/user/histories?user_id={USER_ID}"
-    today_schedule = []
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            records = data.get("medication record", [])
-            today = datetime.now().date()
-            for r in records:
-                try:
-                    sched_dt = datetime.fromisoformat(r["scheduled_time"])
-                    if sched_dt.date() == today:
-                        today_schedule.append(r)
-                except Exception as parse_err:
-                    print(f"파싱 실패: {r['scheduled_time']} {parse_err}")
-                    gpio.set_mode("error")
-            return today_schedule
-        else:
-            print(f"GET 서버 응답 오류: {response.status_code} - {response.text}")
-            gpio.set_mode("error")
-            return []
-    except Exception as e:
-        print(f"GET 서버 요청 실패: {e}")
-        gpio.set_mode("error")
-        return []
+# 당일 복약 스케줄 가져오는 함수 (로컬 저장소에서 읽으므로 서버가 꺼져 있어도 동작)
+def get_today_schedule(user_id=USER_ID):
+    return store.records_for(user_id, datetime.now().date())
 
 # 스케줄 등록 함수
-def register_schedule(schedule_list):
+def register_schedule(schedule_list, user_id=USER_ID):
     now = datetime.now().replace(second=0, microsecond=0)
     schedule_list.sort(key=lambda r: datetime.fromisoformat(r["scheduled_time"]))
     for record in schedule_list:
         sched_dt = datetime.fromisoformat(record["scheduled_time"]).replace(second=0, microsecond=0)
-        unique_key = f"{record['id']}_{sched_dt.strftime('%Y-%m-%d %H:%M')}"
 
-        if unique_key in scheduled_times_set or sched_dt < now:
+        if alerts.seen((record["id"], sched_dt)) or sched_dt < now:
             continue
 
-        medicine_alert(sched_dt, record["dosage_mg"], record["id"])
-        scheduled_times_set.add(unique_key)
-
-    process_immediate_alert()
+        medicine_alert(sched_dt, record["dosage_mg"], record["id"], user_id)
+
+# 동기화로 바뀐 기록을 이미 등록된 알람에 반영하는 함수
+# 지워진(취소되거나 시각이 옮겨진) 복약은 알람을 빼고, 용량이 바뀐 복약은 진행 중인 알람에 그대로 반영하고,
+# 새로 생긴 오늘 복약은 등록함
+def apply_schedule_changes(user_id, changes):
+    updated, deleted = changes
+    for schedule_id, scheduled_time in deleted:
+        key = (schedule_id, datetime.fromisoformat(scheduled_time).replace(second=0, microsecond=0))
+        alert = alerts.get(key)
+        if alert is not None:
+            print(f"서버에서 삭제된 복약 알람 제거: {scheduled_time}")
+            remove_alert(alert)
+        alerts.forget(key)
+
+    today = datetime.now().date()
+    added = []
+    for record in updated:
+        sched_dt = datetime.fromisoformat(record["scheduled_time"]).replace(second=0, microsecond=0)
+        alert = alerts.get((record["id"], sched_dt))
+        if alert is not None:
+            alert.dosage_mg = record["dosage_mg"]
+            save_alert_state(alert)
+        elif sched_dt.date() == today:
+            added.append(record)
+    register_schedule(added, user_id)
+
+# 모든 사용자의 스케줄을 서버와 맞추고, 바뀐 기록을 오늘 알람에 반영하는 함수
+def sync_and_register():
+    for user_id, changes in sync_all(USER_IDS).items():
+        if changes:
+            apply_schedule_changes(user_id, changes)
+
+# 사용자별 오늘 스케줄 출력 함수
+def print_schedule(user_id, schedule_list):
+    name = directory.name(user_id)
+    if schedule_list:
+        print(f"{name}님 오늘 복약 스케줄!")
+        for r in sorted(schedule_list, key=lambda r: r["scheduled_time"]):
+            sched_time = parser.isoparse(r["scheduled_time"])
+            print(f"  - {sched_time.strftime('%H:%M')} | {r['dosage_mg']}mg")
+    else:
+        print(f"{name}님 오늘 복약 스케줄이 없습니다.")
 
 # 복약알람 자정 새로고침 함수
 def daily_refresh():
@@ -190,76 +261,80 @@ def daily_refresh():
             time.sleep(wait_seconds)
 
             print(f"[{datetime.now()}] 자정 이후 알람 새로고침")
-            scheduled_times_set.clear()
-            schedule_list = get_today_schedule()
-            register_schedule(schedule_list)
+            client.print_stats() # 하루 동안의 서버 응답 시간 요약
+            confirmations.print_stats()
+            alerts.clear_seen()
+            for user_id in USER_IDS: # 네트워크가 끊겨 있어도 저장된 스케줄로 먼저 등록
+                register_schedule(get_today_schedule(user_id), user_id)
+            sync_and_register()
 
     threading.Thread(target=refresh_loop, daemon=True).start() # 새로운 thread로 자정 판단 동시 진행
 
+# 주기적으로 서버와 스케줄을 맞추고, 바뀐 게 있으면 오늘 알람에 반영하는 함수
+def sync_loop():
+    while True:
+        sync_and_register()
+        time.sleep(SYNC_INTERVAL)
+
 # 복약 새로고침 함수 
 def refresh_schedules_now():
     text_to_voice(f"스케줄 새로고침")
-    schedule_list = get_today_schedule()
-    
-    if schedule_list:
-        print("오늘 복약 스케줄 !")
-        for r in sorted(schedule_list, key=lambda r: r["scheduled_time"]):
-            sched_time = parser.isoparse(r["scheduled_time"])
-            print(f"  - {sched_time.strftime('%H:%M')} | {r['dosage_mg']}mg")
-    else:
-        print("오늘 복약 스케줄이 없습니다.")
-
-    register_schedule(schedule_list)
+    sync_and_register()
+    for user_id in USER_IDS:
+        schedule_list = get_today_schedule(user_id)
+        print_schedule(user_id, schedule_list)
+        register_schedule(schedule_list, user_id)
 
 # 버튼 누를 때 작동하는 함수 
 def on_button_schedule():
     refresh_schedules_now() # 새로고침
     now = datetime.now()
 
-    for alert in list(pending_alerts):
-        if not alert["steps"]:
+    for alert in alerts.snapshot():
+        if not alert.steps:
             continue
 
-        if alert.get("wait_for_confirmation"): # 복약 처리 
-            elapsed = (now - alert["confirmation_started_at"]).total_seconds() / 60
+        if alert.wait_for_confirmation: # 복약 처리 
+            elapsed = (now - alert.confirmation_started_at).total_seconds() / 60
             if elapsed <= MAX_CONFIRMATION_WAIT:
                 print("복약 확인 처리")
                 handle_medicine_confirmation(alert)
                 return
 
+gpio.on_button(SCEDULE_SWITCH, on_button_schedule)
+
 # 오늘 복약 스케줄 함수 
+# 저장된 스케줄로 바로 알람을 시작하고, 서버 동기화는 백그라운드에서 진행
 def run_scheduler():
-    schedule_list = get_today_schedule()
-    if schedule_list:
-        print("오늘 복약 스케줄!")
-        for r in sorted(schedule_list, key=lambda r: r["scheduled_time"]):
-            sched_time = parser.isoparse(r["scheduled_time"])
-            print(f"  - {sched_time.strftime('%H:%M')} | {r['dosage_mg']}mg")
-    else:
-        print("오늘 복약 스케줄이 없습니다.")
-
-    register_schedule(schedule_list)
+    directory.ensure_loaded() # 알림 문구에 넣을 이름 (저장된 목록이 있으면 서버를 기다리지 않음)
+    restore_alerts() # 재시작 전에 진행 중이던 알람 (이미 시각이 지나 등록에서 빠지는 알람 포함)
+    for user_id in USER_IDS:
+        schedule_list = get_today_schedule(user_id)
+        print_schedule(user_id, schedule_list)
+        register_schedule(schedule_list, user_id)
+    confirmations.resume() # 지난 실행에서 못 보낸 복약 기록
     threading.Thread(target=input_loop, daemon=True).start()
+    threading.Thread(target=sync_loop, daemon=True).start()
     daily_refresh()
 
     while True:
         time.sleep(60)
 
-# 복약 기록 전송 함수 
-def handle_medicine_confirmation(alert):
+# 복약 기록 함수 (디스크에 저장되면 바로 안내하고, 서버 전송은 백그라운드에서 재시도)
+# announce=False면 안내하지 않음 (여러 사용자의 기록을 모아서 한 번만 안내하는 경우), 저장되면 True
+def handle_medicine_confirmation(alert, announce=True):
     taken_at = datetime.now().strftime("%y.%m.%d.%H.%M")
-    payload = {"schedule_id": alert["schedule_id"], "taken_at": taken_at}
+    payload = {"schedule_id": alert.schedule_id, "taken_at": taken_at}
     try:
-        res = requests.put(f"{BASE_URL}/api/user/histories", json=payload)
-        if res.status_code == 200:
-            text_to_voice("복약 기록 전송 성공")
-            pending_alerts.remove(alert)
-        else:
-            print(f"전송 실패: {res.status_code} - {res.text}")
-            gpio.set_mode("error")
+        confirmations.put(payload)
     except Exception as e:
-        print(f"전송 에러: {e}")
-        gpio.set_mode("error")
+        print(f"복약 기록 저장 에러: {e}")
+        gpio.flash("error")
+        return False
+    remove_alert(alert)
+    if announce:
+        text_to_voice("복약 기록 완료")
+    return True
 
 if __name__ == "__main__":
     if wait_for_microphone():
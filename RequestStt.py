@@ -1,93 +1,98 @@
-import audioop
-import os
-import subprocess
 import time
-import wave
 
-import requests
-
-from config import BASE_URL, WAV_PATH
-from global_state import mic_lock
-from gpio_controller import GPIOController
-from util import load_hw_device
-
-gpio = GPIOController(refresh_callback=lambda: None, skip_callback=lambda: None)
-
-SILENCE_THRESHOLD = 1600 # 입력되는 소음의 진폭
-SILENCE_DURATION = 3 # 말 종료 판단 시간
-CHUNK_SIZE = 1024
-RATE = 44100 # 음성 sampling frequency
-CHANNELS = 1
-
-def record_audio(): # 음성 녹음 함수
-    with mic_lock:
+import numpy as np
+
+import global_state
+from audio_arbiter import arbiter
+from audio_buffer import AudioBuffer
+from audio_capture import CAPTURE_RATE, CHANNELS, capture
+from audio_encoder import FORMATS, StreamEncoder, encode_buffer, reject_format, upload_format
+from config import DEBUG_AUDIO, WAV_PATH
+from gpio_controller import gpio
+from http_client import client
+from resampler import StreamResampler
+from vad import VoiceActivityDetector
+
+
+SPEECH_HANGOVER_MS = 600 # 말이 끝난 뒤 종료 판단까지 기다리는 시간
+NO_SPEECH_TIMEOUT = 3 # 말 시작을 기다리는 최대 시간 (초)
+RATE = 16000 # 업로드 sampling frequency (음성 인식에는 16kHz면 충분)
+READ_TIMEOUT = 2 # 안내 음성 반향 구간은 마이크 입력이 버려지므로 1초보다 넉넉하게 기다림
+
+STREAM_STT = True # 말하는 도중에 서버로 오디오를 보내는 스트리밍 모드 사용 여부
+_stream_supported = None # 서버 스트리밍 지원 여부 (None: 아직 모름)
+
+# 녹음하면서 오디오 조각을 하나씩 넘겨주는 제너레이터 (frames에도 함께 저장)
+# flush=False면 이미 쌓여있는 오디오부터 이어서 녹음, on_armed는 녹음 준비가 끝난 순간 호출
+# preroll은 녹음 시작 전의 16kHz 샘플 배열 목록 (말이 시작되면 그 앞부분으로 포함될 수 있음)
+def record_chunks(frames, flush=True, on_armed=None, preroll=None):
+    if not capture.start(): # 웨이크워드와 같은 마이크 스트림을 그대로 이어받음
+        raise RuntimeError("마이크 스트림을 열 수 없습니다.")
+    if flush:
+        capture.flush() # 안내 음성이 재생되는 동안 쌓인 오디오 버림
+
+    resampler = StreamResampler(CAPTURE_RATE, RATE) # 녹음하면서 바로 16kHz로 변환
+    vad = VoiceActivityDetector(RATE, hangover_ms=SPEECH_HANGOVER_MS, noise_floor=capture.noise_floor) # 앞뒤 무음은 업로드에서 제외
+    start_time = time.time()
+    max_recording_time = 20
+    for samples in preroll or ():
+        vad.prime(samples.tobytes())
+    if on_armed:
+        on_armed()
+
+    while True:
+        data = capture.read(timeout=READ_TIMEOUT)
+        if not data:
+            break
+
+        data = resampler.process(np.frombuffer(data, dtype=np.int16)).tobytes()
+        for chunk in vad.push(data):
+            frames.append(chunk)
+            yield chunk
+
+        if vad.ended: # 말이 끝나고 hangover 동안 조용한 경우
+            return
+
+        if not vad.triggered and vad.elapsed_ms > NO_SPEECH_TIMEOUT * 1000: # 정해진 시간동안 목소리 입력 안 된 경우
+            print("음성 입력이 없어 녹음 종료")
+            return
+
+        if time.time() - start_time > max_recording_time:
+            print("녹음 최대 시간 초과로 종료")
+            break
+
+    for chunk in vad.flush():
+        frames.append(chunk)
+        yield chunk
+
+# 녹음된 오디오를 메모리에 보관하는 함수 (디버깅 중일 때만 WAV 파일로도 저장)
+def store_recording(frames):
+    audio = AudioBuffer.from_frames(frames, RATE, CHANNELS)
+    global_state.last_recording = audio
+    if DEBUG_AUDIO:
+        audio.save(WAV_PATH)
+    return audio
+
+def record_audio(flush=True, on_armed=None, preroll=None): # 음성 녹음 함수
+    with arbiter.session("mic", name="stt"): # 웨이크워드 대화 중이면 이미 잡고 있는 마이크를 그대로 사용
         try:
             print("음성 녹음중...")
 
-            device = load_hw_device()       
-            if not device.startswith("plughw:"):
-                device = device.replace("hw:", "plughw:")
-
-            cmd = [
-                "arecord",
-                "-D", device,
-                "-f", "S16_LE",
-                "-r", str(RATE),
-                "-c", str(CHANNELS),
-                "-t", "raw"
-            ]
-
             frames = []
-            silence_start = None
-            start_time = time.time()
-            max_recording_time = 20
-
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-
-            while True:
-                data = process.stdout.read(CHUNK_SIZE)
-                if not data:
-                    break
-
-                frames.append(data)
-                rms = audioop.rms(data, 2)
-
-                if rms < SILENCE_THRESHOLD: # 목소리가 안 들리는 경우
-                    if silence_start is None:
-                        silence_start = time.time()
-                    elif time.time() - silence_start > SILENCE_DURATION: # 정해진 시간동안 목소리 입력 안 된 경우
-                        break
-                else:
-                    silence_start = None
-
-                if time.time() - start_time > max_recording_time:
-                    print("녹음 최대 시간 초과로 종료")
-                    break
-                
-            process.kill()        
-            try:
-                while process.stdout.read(CHUNK_SIZE):  # stdout 비우기
-                    pass
-            except Exception:
+            for _ in record_chunks(frames, flush, on_armed, preroll):
                 pass
-            process.wait()          
 
             if not frames:
                 print("녹음된 데이터가 없습니다.")
-                gpio.set_mode("error")
+                gpio.flash("error")
                 return False
             
-            with wave.open(WAV_PATH, 'wb') as wf:
-                wf.setnchannels(CHANNELS)
-                wf.setsampwidth(2)
-                wf.setframerate(RATE)
-                wf.writeframes(b''.join(frames))
-
+            store_recording(frames)
             return True
 
         except Exception as e:
             print(f"녹음 실패: {e}")
-            gpio.set_mode("error")
+            gpio.flash("error")
             return False
 
 # import speech_recognition as sr 구글 STT api 사용
@@ -98,39 +103,122 @@ def record_audio(): # 음성 녹음 함수
 
 # print(r.recognize_google(audio,language='ko-KR')) 
 
-def upload_stt(): # STT 함수 
-    url = f"{BASE_URL}/api/stt"
-    
-    if not record_audio():
-        print("녹음 실패")
-        gpio.set_mode("error")
+# 녹음과 동시에 chunked 요청으로 서버에 전송하는 함수 (STT, STT+의도 파악 공용)
+# 녹음 조각은 서버와 정한 포맷(opus/flac)으로 바로 인코딩해서 보냄
+# 반환값: (녹음 성공 여부, 서버 응답) - 전송이 실패해도 녹음은 끝까지 진행되어 메모리에 보관됨 (응답은 None)
+def stream_recording(endpoint, url, params=None, flush=True, on_armed=None, preroll=None):
+    with arbiter.session("mic", name="stt"):
+        print("음성 녹음중... (스트리밍)")
+        frames = []
+        chunks = record_chunks(frames, flush, on_armed, preroll)
+        encoder = StreamEncoder(upload_format())
+        body = encoder.encode(chunks)
+        response = None
+
+        try:
+            response = client.post(
+                endpoint,
+                url,
+                data=body, # 제너레이터를 넘기면 Transfer-Encoding: chunked로 전송
+                params={"rate": RATE, "channels": CHANNELS, **(params or {})},
+                headers={"Content-Type": encoder.content_type}
+            )
+        except Exception as e:
+            print(f"스트리밍 전송 실패 ({url}): {e}")
+
+        try:
+            for _ in chunks: # 전송이 중간에 끊겨도 녹음은 끝까지 진행
+                pass
+        except Exception as e:
+            print(f"녹음 실패: {e}")
+            gpio.flash("error")
+            return False, None
+        finally:
+            body.close()
+            encoder.close() # 인코더가 남아 있으면 종료
+
+        if response is not None and response.status_code == 415 and encoder.format != "wav":
+            reject_format(encoder.format) # 다음 업로드부터 다른 포맷 사용
+
+        if not frames:
+            print("녹음된 데이터가 없습니다.")
+            gpio.flash("error")
+            return False, None
+        store_recording(frames)
+    return True, response
+
+# 녹음과 동시에 STT 서버에 전송하는 함수
+# 성공하면 인식 결과, 서버가 스트리밍을 지원하지 않거나 전송이 실패하면 None (녹음은 메모리에 보관됨)
+def upload_stt_stream(flush=True, on_armed=None, preroll=None):
+    global _stream_supported
+    recorded, response = stream_recording("stt_stream", "/api/stt/stream", None, flush, on_armed, preroll)
+    if not recorded:
         return ""
-    
-    if not os.path.exists(WAV_PATH):
-        gpio.set_mode("error")
-        print("녹음 파일 없음")
+
+    if response is None:
+        return None
+
+    if response.status_code in (404, 405, 501): # 스트리밍 미지원 서버
+        print("서버가 STT 스트리밍을 지원하지 않아 일괄 업로드로 전환합니다.")
+        _stream_supported = False
+        return None
+
+    if response.status_code == 200:
+        _stream_supported = True
+        print(f"STT : {response.text.strip()}")
+        return response.text.strip()
+
+    print(f"STT 서버 응답 실패: {response.status_code}")
+    return None
+
+# 메모리에 있는 녹음을 한 번에 업로드하는 함수
+def upload_wav(audio=None):
+    url = "/api/stt"
+    audio = audio or global_state.last_recording
+
+    if audio is None:
+        gpio.flash("error")
+        print("녹음 데이터 없음")
         return ""
 
-    if os.path.getsize(WAV_PATH) < 2048:
-        print(f"녹음 파일이 너무 작습니다: {WAV_PATH}")
-        gpio.set_mode("error")
+    if len(audio) < 2048:
+        print(f"녹음이 너무 짧습니다: {len(audio)} bytes")
+        gpio.flash("error")
         return ""
 
     try:
-        with open(WAV_PATH, "rb") as f:
-            response = requests.post(url, files={"audio": f})
-            if response.status_code == 200:
-                print(f"STT : {response.text.strip()}")
-                return response.text.strip() # STT 결과 text 리턴
-            else:
-                print(f"STT 서버 응답 실패: {response.status_code}")
-                gpio.set_mode("error")
-                return ""
+        for _ in FORMATS: # 서버가 포맷을 거절(415)하면 다음 포맷으로 다시 보냄
+            file, fmt = encode_buffer(audio, upload_format())
+            response = client.post("stt", url, files={"audio": file})
+            if response.status_code != 415 or fmt == "wav":
+                break
+            reject_format(fmt)
+        if response.status_code == 200:
+            print(f"STT : {response.text.strip()}")
+            return response.text.strip() # STT 결과 text 리턴
+        else:
+            print(f"STT 서버 응답 실패: {response.status_code}")
+            gpio.flash("error")
+            return ""
     except Exception as e:
         print(f"STT 서버 요청 실패: {e}")
-        gpio.set_mode("error")
+        gpio.flash("error")
+        return ""
+
+def upload_stt(flush=True, on_armed=None, preroll=None): # STT 함수 
+    if STREAM_STT and _stream_supported is not False:
+        text = upload_stt_stream(flush, on_armed, preroll)
+        if text is not None:
+            return text
+        return upload_wav() # 스트리밍 실패 시 이미 녹음된 오디오로 기존 방식 업로드
+
+    if not record_audio(flush, on_armed, preroll):
+        print("녹음 실패")
+        gpio.flash("error")
         return ""
 
+    return upload_wav()
+
 if __name__ == "__main__":
     result = upload_stt()
     if result:
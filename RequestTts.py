@@ -1,11 +1,18 @@
-import requests
-from pydub import AudioSegment
+import asyncio
+import threading
 
-from config import BASE_URL
-from gpio_controller import GPIOController
-from util import safe_play
+from async_core import core
+from audio_arbiter import PRIORITY_REMINDER, arbiter
+from audio_player import player
+from config import DEBUG_AUDIO
+from gpio_controller import gpio
+from http_client import async_client, client
+from tts_cache import tts_cache
+from util import tee_chunks
 
-gpio = GPIOController(refresh_callback=lambda: None, skip_callback=lambda: None) # 시각적 LED 표시
+STREAM_CHUNK_SIZE = 4096 # 스트리밍 다운로드 조각 크기
+VOICE_SETTINGS = {} # TTS 요청에 함께 보내는 음성 설정 (캐시 키에도 포함)
+PREWARM_PHRASES = ["네?", "음성 인식에 실패했습니다.", "복약 기록 완료", "스케줄 새로고침"] # 시작할 때 미리 받아둘 고정 문구
 
 # api에서 진행되는 TTS 코드
 # from gtts import gTTS 구글 gTTS 라이브러리
@@ -18,27 +25,102 @@ gpio = GPIOController(refresh_callback=lambda: None, skip_callback=lambda: None)
 #     playsound(fileName)
 #     print("TTS complete")
 
-# TTS 수행 함수
-def text_to_voice(text):
-    url = f"{BASE_URL}/api/tts" # api에 요청
+# 재생 없이 TTS 음성(mp3)만 받아오는 코루틴
+async def fetch_tts_async(text):
+    url = "/api/tts"
+    try:
+        response = await async_client.post("tts", url, json={"text": text, **VOICE_SETTINGS})
+        try:
+            if response.status_code == 200:
+                return await response.read()
+            print(f"상태코드: {response.status_code}, 메시지: {await response.text()}")
+        finally:
+            response.close()
+    except Exception as e:
+        print(f"TTS 미리 받기 실패: {e}")
+    return None
+
+def fetch_tts(text):
+    return core.run(fetch_tts_async(text))
+
+# TTS 수행 함수 (스피커를 받을 때까지 기다렸다가 재생, 더 높은 우선순위 요청이 오면 중단됨)
+# 중단되어 끝까지 재생하지 못했으면 False (안내를 듣지 못한 사용자의 답을 녹음하지 않도록)
+def text_to_voice(text, priority=PRIORITY_REMINDER):
+    with arbiter.session("speaker", priority, name="tts", on_preempt=player.stop) as session:
+        _speak(text)
+        return not session.preempted
+
+def _speak(text):
+    url = "/api/tts" # api에 요청
     gpio.set_mode("llmtts")
     try:
-        payload = {"text": text}
-        response = requests.post(url, json=payload)
+        pcm = tts_cache.get_pcm(text, VOICE_SETTINGS)
+        if pcm: # 미리 디코딩해둔 고정 문구는 바로 재생
+            player.play_pcm([pcm])
+            gpio.set_mode("default")
+            return
+
+        cached = tts_cache.get(text, VOICE_SETTINGS)
+        if cached is not None: # 캐시에 있으면 네트워크 요청 없이 재생
+            player.play_mp3([cached])
+            gpio.set_mode("default")
+            return
+
+        payload = {"text": text, **VOICE_SETTINGS}
+        response = client.post("tts", url, json=payload, stream=True) # 응답 본문은 받는 대로 재생
 
         if response.status_code == 200:
-            with open("/home/pi/my_project/tts.mp3", "wb") as f:
-                f.write(response.content)
-            audio = AudioSegment.from_file("/home/pi/my_project/tts.mp3", format="mp3")
-            safe_play(audio)
+            chunks = tts_cache.collect(text, response.iter_content(chunk_size=STREAM_CHUNK_SIZE), VOICE_SETTINGS)
+            if DEBUG_AUDIO:
+                chunks = tee_chunks(chunks, "/home/pi/my_project/tts.mp3")
+            player.play_mp3(chunks) # 다운로드와 디코딩, 재생을 동시에 진행
         else:
             print(f"상태코드: {response.status_code}, 메시지: {response.text}")
 
     except Exception as e:
-        gpio.set_mode("error")
+        gpio.flash("error")
         print(f"예외 {e}")
 
     gpio.set_mode("default")
+
+# 메모리에 올려둔 고정 문구를 백그라운드로 재생하고 재생이 끝날 예상 시각을 돌려주는 함수
+# 스피커를 받은 뒤에 반환하며, 캐시에 없으면 재생하지 않고 None (호출한 쪽에서 text_to_voice로 대체)
+def play_cached_async(text, priority=PRIORITY_REMINDER):
+    pcm = tts_cache.get_pcm(text, VOICE_SETTINGS)
+    if not pcm:
+        return None
+    session = arbiter.acquire("speaker", priority, name="tts", on_preempt=player.stop)
+    end = player.estimate_end(len(pcm))
+
+    def play():
+        try:
+            player.play_pcm([pcm])
+        finally:
+            arbiter.release(session)
+
+    threading.Thread(target=play, daemon=True).start()
+    return end
+
+async def prewarm_phrase(text, pin):
+    data = tts_cache.get(text, VOICE_SETTINGS)
+    if data is None:
+        data = await fetch_tts_async(text)
+        if data is None:
+            return
+        tts_cache.put(text, data, VOICE_SETTINGS)
+    if pin and tts_cache.get_pcm(text, VOICE_SETTINGS) is None:
+        pcm = await player.decode_mp3_async(data)
+        if pcm:
+            tts_cache.set_pcm(text, pcm, VOICE_SETTINGS)
+
+# 자주 쓰는 문구를 백그라운드에서 미리 캐시에 받아두는 함수 (문구들을 동시에 요청, 기다리지 않고 반환)
+# pin=True면 디코딩한 PCM까지 메모리에 올려 네트워크/디코딩 없이 바로 재생
+def prewarm_tts(phrases, pin=False):
+    async def prewarm():
+        await asyncio.gather(*(prewarm_phrase(text, pin) for text in phrases))
+
+    return core.submit(prewarm())
+
 # 테스트 실행
 if __name__ == "__main__":
     print("TTS 테스트 시작") 
@@ -2,167 +2,148 @@ import time
 
 import numpy as np 
 import pvporcupine # wakeword 감지를 위한 라이브러리
-import pyaudio
-import requests
-from scipy.signal import resample
 
-import global_state
-from config import BASE_URL, DOSAGE_TIME, FE_USER_ID
-from global_state import mic_lock
-from gpio_controller import GPIOController
-from llmTts import post_intent
-from RequestStt import upload_stt
-from RequestTts import text_to_voice
-from util import load_mic_index, suppress_alsa_errors
+from async_core import core
+from audio_arbiter import PRIORITY_LISTEN, PRIORITY_USER, arbiter
+from audio_capture import CAPTURE_RATE, capture
+from config import DOSAGE_TIME, FE_USER_ID, STT_PREROLL_MS
+from gpio_controller import gpio
+from event_queue import events
+from llmTts import stt_and_intent
+from RequestTts import play_cached_async, text_to_voice
+from resampler import FrameAssembler, RingBuffer, StreamResampler
+from util import suppress_alsa_errors
 
-gpio = GPIOController(refresh_callback=lambda: None, skip_callback=lambda: None)
 
 KEYWORD_PATH = "웨이크워드 파일명"
 MODEL_PATH = "언어모델 파일명"
 MAX_CONFIRMATION_WAIT = DOSAGE_TIME
+ACK_TEXT = "네?"
+PREROLL_CAPACITY_MS = 2000 # 감지 직후 오디오를 보관하는 링 버퍼 길이 (STT_PREROLL_MS 최대값)
+INIT_RETRY_DELAY = 1
+ECHO_TAIL = 0.3 # 안내 음성이 끝난 뒤에도 스피커 버퍼/잔향이 마이크로 들어오는 시간 (초)
 
-# wakeword 감지를 알려주는 함수
+last_wake_to_armed = None # 마지막 웨이크워드 감지 -> 녹음 준비까지 걸린 시간(초)
+
+# wakeword 감지를 알려주는 함수 (응답을 기다리지 않고 백그라운드 큐로 전송)
 def post_wakeword(): 
-    url = f"{BASE_URL}/api/wake"
+    url = "/api/wake"
     params = {"user_id": FE_USER_ID}
+    events.post("wake", url, coalesce_key=f"wake_{FE_USER_ID}", params=params) # 아직 못 보낸 wake가 있으면 하나로 합침
 
-    try:
-        response = requests.post(url, params=params)
-        if response.status_code == 200:
-            print("서버에 wake 메시지 전송 완료")
-            return True
-        else:
-            print(f"서버 응답 실패: {response.status_code} - {response.text}")
-            gpio.set_mode("error")
-            return False
-    except Exception as e:
-        print(f"POST 요청 중 오류 발생: {e}")
-        gpio.set_mode("error")
-        return False
+# porcupine 인스턴스는 프로세스 동안 한 번만 생성
+_porcupine = None
+_resampler = StreamResampler(CAPTURE_RATE, 16000) # 44.1kHz -> porcupine 16kHz
+_frames = None
+_recent = RingBuffer(16000 * PREROLL_CAPACITY_MS // 1000) # 웨이크워드 감지 프레임 이후 16kHz 오디오 (녹음 pre-roll용)
 
-# wakeword를 감지하는 함수
-def listen_for_wakeword():
-    porcupine = None
-    pa = None
-    stream = None
-    global wakeword_detection
-    
-    try:
+def get_porcupine():
+    global _porcupine, _frames
+    if _porcupine is None:
         with suppress_alsa_errors():
-            porcupine = pvporcupine.create(
+            _porcupine = pvporcupine.create(
                 access_key="개인키",
                 keyword_paths=[KEYWORD_PATH],
                 model_path=MODEL_PATH
             )
+        _frames = FrameAssembler(_porcupine.frame_length)
+    return _porcupine
+
+# wakeword를 감지하는 함수
+def listen_for_wakeword():
+    try:
+        porcupine = get_porcupine()
 
-            mic_index = load_mic_index()
-            if mic_index is None:
-                print("저장된 마이크 인덱스를 찾을 수 없습니다.")
-                gpio.set_mode("error")
+        with suppress_alsa_errors():
+            if not capture.start(): # 마이크 스트림은 한 번 열어두고 계속 사용
+                gpio.flash("error")
                 return None
 
-            pa = pyaudio.PyAudio()
-            input_frame_length = int(porcupine.frame_length * 44100 / 16000) # 웨이크워드의 frequency에 맞게 변환
+    except Exception as e:
+        print(f"초기화 에러: {e}")
+        gpio.flash("error")
+        return None
 
+    while True:
+        # 마이크는 가장 낮은 우선순위로 잡고 있다가, 다른 작업이 요청하면 넘겨주고 끝날 때까지 기다림
+        with arbiter.session("mic", PRIORITY_LISTEN, name="wakeword") as session:
+            capture.flush() # 이전 대화 중 쌓인 오디오 버림
+            _resampler.reset()
+            _frames.reset()
+            _recent.reset()
             print("waiting wakeword...") 
 
-            while True:
-                # 마이크 중복 방지
-                if not mic_lock.acquire(timeout=0.1):
-                    time.sleep(0.2)
-                    continue
-
-                try:
-                    stream = pa.open(
-                        format=pyaudio.paInt16,
-                        channels=1,
-                        rate=44100,
-                        input=True,
-                        input_device_index=mic_index,
-                        frames_per_buffer=input_frame_length
-                    )
-
-                    data = stream.read(input_frame_length, exception_on_overflow=False)
-                    pcm_44100 = np.frombuffer(data, dtype=np.int16)
-                    pcm_16000 = resample(pcm_44100, porcupine.frame_length)
-                    pcm_16000 = np.round(pcm_16000).astype(np.int16)
-
-                    if np.isnan(pcm_16000).any() or np.isinf(pcm_16000).any():
-                        continue
-
-                    result = porcupine.process(pcm_16000)
-    
-                    if result >= 0:
-                        print("wakeword 살가이가 감지되었습니다.")
-                        global_state.wakeword_detection = True
-                        post_wakeword()
-                        gpio.set_mode("wakeword")
-
-                        # 자원 충돌 방지
-                        if stream:
-                            stream.stop_stream()
-                            stream.close()
-                            stream = None
-                        if pa:
-                            pa.terminate()
-                            pa = None
-                        if porcupine:
-                            porcupine.delete()
-                            porcupine = None
-                        mic_lock.release()
-                        time.sleep(1.5)
-
-                        text_to_voice("네?")
-                        user_text = upload_stt() # 사용자 음성 녹음
-
-                        if user_text:
-                            post_intent(FE_USER_ID) # 의도 파악 함수 실행
-                            
-                        gpio.set_mode("default") 
-                        return user_text
-
-                except Exception as e:
-                    print(f"wakeword 오류: {e}")
-                    gpio.set_mode("error")
-                    time.sleep(2)
-                    gpio.set_mode("default")  
-
-                finally:
-                    try:
-                        if stream:
-                            if stream.is_active():
-                                stream.stop_stream()
-                            stream.close()
-                            stream = None
-                        mic_lock.release()
-                    except:
-                        pass
-
-    except Exception as e:
-        print(f"초기화 에러: {e}")
-        gpio.set_mode("error")
-        time.sleep(2)
-        gpio.set_mode("default")
-
-    # 마이크 자원 반드시 해제
-    finally:
-        if stream:
-            try:
-                if stream.is_active():
-                    stream.stop_stream()
-                stream.close()
-            except:
-                pass
-        if pa:
-            try:
-                pa.terminate()
-            except:
-                pass
-        if porcupine:
-            try:
-                porcupine.delete()
-            except:
-                pass
+            if not wait_for_keyword(porcupine, session):
+                continue
+
+            arbiter.promote(session, PRIORITY_USER) # 마이크를 놓지 않은 채 사용자 대화로 전환
+            return handle_wakeword()
+
+# 웨이크워드가 들리면 True, 다른 작업에 마이크를 양보해야 하면 False
+def wait_for_keyword(porcupine, session):
+    while not session.preempted:
+        try:
+            data = capture.read()
+            if data is None:
+                continue
+
+            pcm_44100 = np.frombuffer(data, dtype=np.int16)
+            pcm_16000 = _resampler.process(pcm_44100) # 필터 상태를 유지하며 미리 할당된 버퍼에 변환
+
+            frames = _frames.push(pcm_16000)
+            for frame in frames:
+                if porcupine.process(frame) >= 0:
+                    # 감지 프레임까지는 웨이크워드 자체이므로 버리고, 같은 조각에서 그 뒤에 남은 오디오만 pre-roll로 보관
+                    for rest in frames:
+                        _recent.write(rest)
+                    _recent.write(_frames.pending())
+                    return True
+
+        except Exception as e:
+            print(f"wakeword 오류: {e}")
+            gpio.flash("error")
+    return False
+
+# 감지 이후 마이크 큐에 쌓인 오디오를 pre-roll에 이어 붙이는 함수 (안내 음성이 시작되기 전의 사용자 말)
+# 안내 음성 재생 중 오디오는 반향이 섞이므로 여기서 가져오지 않고 버림
+def keep_after_detection():
+    limit = 16000 * STT_PREROLL_MS // 1000
+    while len(_recent) < limit:
+        data = capture.read(timeout=0)
+        if data is None:
+            return
+        _recent.write(_resampler.process(np.frombuffer(data, dtype=np.int16)))
+
+# 웨이크워드 감지 후 안내 음성, 녹음, 의도 파악까지 진행하는 함수
+def handle_wakeword():
+    print("wakeword 살가이가 감지되었습니다.")
+    detected_at = time.time()
+    core.cancel_below(PRIORITY_USER) # 진행 중인 알림용 LLM 요청/재생은 기다리지 않고 취소
+    gpio.set_mode("wakeword")
+    post_wakeword()
+
+    # 캐시된 안내 음성을 재생하는 동안 바로 녹음을 시작하고, 그 구간의 마이크 입력(반향)만 버림
+    # 스피커를 요청하는 순간 진행 중인 낮은 우선순위 재생(알림 등)은 중단됨
+    # 이미 큐에 들어온 감지 직후 오디오는 음소거에 걸리지 않으므로 녹음이 그대로 이어 읽음
+    ack_end = play_cached_async(ACK_TEXT, PRIORITY_USER)
+    if ack_end is not None:
+        capture.mute_until(ack_end + ECHO_TAIL)
+    else: # 아직 캐시가 준비되지 않은 경우 기존처럼 재생이 끝난 뒤 녹음 (녹음 전에 큐를 비우므로 감지 직후 오디오를 먼저 옮겨둠)
+        keep_after_detection()
+        text_to_voice(ACK_TEXT, PRIORITY_USER)
+
+    def armed():
+        global last_wake_to_armed
+        last_wake_to_armed = time.time() - detected_at
+        print(f"웨이크워드 -> 녹음 준비: {last_wake_to_armed * 1000:.0f}ms")
+
+    # 사용자 음성 녹음 (같은 마이크 스트림에서 감지 직후 오디오부터 이어서 읽음)
+    # 녹음하면서 바로 업로드해서 인식 결과와 의도 파악 응답을 한 번에 받음
+    preroll = _recent.latest(len(_recent)) if STT_PREROLL_MS else None # 감지가 끝날 때까지 루프가 멈춰 있으므로 view 그대로 사용
+    user_text = stt_and_intent(FE_USER_ID, flush=ack_end is None, on_armed=armed, preroll=preroll)
+        
+    gpio.set_mode("default") 
+    return user_text
     
 
 # 웨이크 워드 인식 함수 무한 루프
@@ -171,14 +152,12 @@ def wakeWord_forever():
         gpio.set_mode("default")  
         result_text = listen_for_wakeword()
         
-        global_state.wakeword_detection = False
-        
         if result_text:
             return result_text
         print("\n'살가이' 감지 실패, 재시도 중...")
-        gpio.set_mode("error")
-        time.sleep(1)
-        gpio.set_mode("default")  
+        gpio.flash("error", 1)
+        if result_text is None: # 마이크/porcupine 초기화 실패면 잠시 쉬었다가 다시 시도
+            time.sleep(INIT_RETRY_DELAY)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,229 @@
+import heapq
+import itertools
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from config import DOSAGE_TIME, MEAL_TIME
+
+# 스텝 종류별 안내 문구 (스텝이 실행될 때만 만듦, taking_medicine_time은 더미 음성으로 서버가 안내)
+MESSAGES = {
+    "check_meal": "{name}님 약 드시기 {meal_time}분 전입니다. 약 드시기 전에 식사 하셨나요?",
+    # "induce_medicine": "{name}님 요 며칠 약 챙겨드시기 어려우셨죠?",
+    "check_medicine": "{name}님 약 {dosage_mg}mg 드셨나요 ?",
+}
+
+# 여러 사용자의 같은 스텝이 겹칠 때 한 번에 안내하는 문구 (사용자마다 부르는 말, 전체 문구)
+# 예: "홍길동님 약 10mg, 김철수님 약 20mg 드셨나요 ?"
+MERGED_MESSAGES = {
+    "check_meal": ("{name}님", "{people} 약 드시기 {meal_time}분 전입니다. 약 드시기 전에 식사 하셨나요?"),
+    "check_medicine": ("{name}님 약 {dosage_mg}mg", "{people} 드셨나요 ?"),
+}
+
+# 알람 하나의 기본 스텝 (예정 시각 기준 분, 종류)
+DEFAULT_STEPS = (
+    (-MEAL_TIME, "check_meal"),
+    # (-INDUCE_TIME, "induce_medicine"),
+    (0, "taking_medicine_time"),
+    (DOSAGE_TIME, "check_medicine"),
+)
+
+# 알람의 한 단계 (예정 시각 기준 offset분에 실행)
+class Step:
+    __slots__ = ("offset", "responsetype")
+
+    def __init__(self, offset, responsetype):
+        self.offset = offset
+        self.responsetype = responsetype
+
+    # 안내 문구 (없는 스텝이면 None)
+    def message(self, alert, name):
+        template = MESSAGES.get(self.responsetype)
+        if template is None:
+            return None
+        return template.format(name=name, meal_time=MEAL_TIME, dosage_mg=alert.dosage_mg)
+
+    # 여러 사용자에게 한 번에 묻는 안내 문구 (people: (알람, 이름) 목록, 없는 스텝이면 None)
+    def merged_message(self, people):
+        templates = MERGED_MESSAGES.get(self.responsetype)
+        if templates is None:
+            return None
+        person, template = templates
+        people = ", ".join(person.format(name=name, dosage_mg=alert.dosage_mg) for alert, name in people)
+        return template.format(people=people, meal_time=MEAL_TIME)
+
+# 복약 알람 하나 (스케줄 하나의 특정 시각)
+# key는 (스케줄 id, 원래 예정 시각)이고, 재시도하면 sched_dt만 바뀜
+class Alert:
+    __slots__ = (
+        "key", "schedule_id", "user_id", "dosage_mg", "sched_dt", "steps", "retry_count",
+        "wait_for_confirmation", "confirmation_started_at", "version", "removed",
+    )
+
+    def __init__(self, schedule_id, sched_dt, dosage_mg, user_id=None, steps=DEFAULT_STEPS):
+        self.key = (schedule_id, sched_dt)
+        self.schedule_id = schedule_id
+        self.user_id = user_id
+        self.dosage_mg = dosage_mg
+        self.sched_dt = sched_dt
+        self.steps = deque(Step(offset, responsetype) for offset, responsetype in steps)
+        self.retry_count = 0
+        self.wait_for_confirmation = False
+        self.confirmation_started_at = None
+        self.version = 0 # 힙에 다시 넣을 때마다 증가 (예전 항목은 꺼낼 때 버림)
+        self.removed = False
+
+    # 다음 스텝 실행 시각
+    def deadline(self):
+        return self.sched_dt + timedelta(minutes=self.steps[0].offset)
+
+    # 재시작해도 이어서 진행할 수 있도록 저장하는 상태 (문구는 저장하지 않음)
+    def snapshot(self):
+        started = self.confirmation_started_at
+        return {
+            "schedule_id": self.schedule_id,
+            "user_id": self.user_id,
+            "origin": self.key[1].isoformat(),
+            "dosage_mg": self.dosage_mg,
+            "sched_dt": self.sched_dt.isoformat(),
+            "retry_count": self.retry_count,
+            "wait": self.wait_for_confirmation,
+            "wait_at": started.isoformat() if started else None,
+            "steps": [(step.offset, step.responsetype) for step in self.steps],
+        }
+
+    @classmethod
+    def from_snapshot(cls, state):
+        alert = cls(state["schedule_id"], datetime.fromisoformat(state["origin"]), state["dosage_mg"],
+                    state.get("user_id"), state["steps"])
+        alert.sched_dt = datetime.fromisoformat(state["sched_dt"])
+        alert.retry_count = state["retry_count"]
+        alert.wait_for_confirmation = state["wait"]
+        alert.confirmation_started_at = datetime.fromisoformat(state["wait_at"]) if state["wait_at"] else None
+        return alert
+
+    # 저장소에서 쓰는 문자열 키
+    def store_key(self):
+        return f"{self.schedule_id}_{self.key[1].isoformat()}"
+
+# 진행 중인 알람 목록
+# key/사용자 id로 바로 찾고 (O(1)), 다음 스텝 시각 순서는 힙으로 관리 (O(log n))
+# 제거된 알람의 힙 항목은 꺼낼 때 버리고, 그런 항목이 너무 많아지면 힙을 다시 만듦
+class AlertRegistry:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self._by_key = {}
+        self._by_user = {} # 사용자 id -> {key: alert}
+        self._heap = [] # (다음 스텝 시각, 순번, 버전, alert) - 가장 이른 알람이 맨 앞
+        self._seq = itertools.count()
+        self._seen = set() # 오늘 한 번이라도 등록된 key (끝난 알람이 다시 등록되지 않도록)
+
+    def __len__(self):
+        return len(self._by_key)
+
+    def seen(self, key):
+        return key in self._seen
+
+    # 서버에서 지워진 알람은 등록 기록에서도 빼서 다시 생기면 등록되도록 함
+    def forget(self, key):
+        with self.cond:
+            self._seen.discard(key)
+
+    # 날짜가 바뀌면 등록 기록 초기화
+    def clear_seen(self):
+        with self.cond:
+            self._seen = set(self._by_key)
+
+    def get(self, key):
+        return self._by_key.get(key)
+
+    def for_user(self, user_id):
+        with self.cond:
+            return list(self._by_user.get(user_id, {}).values())
+
+    def snapshot(self):
+        with self.cond:
+            return list(self._by_key.values())
+
+    def add(self, alert):
+        with self.cond:
+            self._by_key[alert.key] = alert
+            self._by_user.setdefault(alert.user_id, {})[alert.key] = alert
+            self._seen.add(alert.key)
+            self._push(alert)
+
+    def _push(self, alert):
+        alert.version += 1
+        if alert.steps:
+            heapq.heappush(self._heap, (alert.deadline(), next(self._seq), alert.version, alert))
+        if len(self._heap) > 2 * len(self._by_key) + 64: # 버려질 항목이 쌓이면 정리
+            self._heap = [entry for entry in self._heap if entry[2] == entry[3].version and not entry[3].removed]
+            heapq.heapify(self._heap)
+        self.cond.notify() # 더 이른 알람이 들어왔을 수 있으므로 대기 중인 루프를 깨움
+
+    # 다음 스텝 기준으로 다시 예약 (제거된 알람이면 False)
+    def reschedule(self, alert):
+        with self.cond:
+            if alert.removed:
+                alert.version += 1
+                return False
+            self._push(alert)
+            return True
+
+    # 목록에서 빼는 함수 (처음 제거할 때만 True)
+    def remove(self, alert):
+        with self.cond:
+            alert.version += 1
+            if alert.removed:
+                return False
+            alert.removed = True
+            self._by_key.pop(alert.key, None)
+            group = self._by_user.get(alert.user_id)
+            if group is not None:
+                group.pop(alert.key, None)
+                if not group:
+                    del self._by_user[alert.user_id]
+            return True
+
+    # 시간이 된 알람을 하나 꺼내는 함수 (없으면 None)
+    def pop_due(self, now):
+        with self.cond:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, version, alert = heapq.heappop(self._heap)
+                if version == alert.version and alert.steps: # 다시 예약되었거나 제거된 알람은 버림
+                    return alert
+        return None
+
+    # until 전에 다음 스텝이 오는 알람 중, users에 없는 사용자의 같은 종류 스텝만 사용자마다 하나씩 꺼내는 함수
+    # (겹치는 알림을 한 번에 안내하기 위해 조금 앞당김, 나머지 알람은 그대로 둠)
+    # 꺼낸 알람의 사용자는 users에 추가됨
+    def pop_merge(self, until, responsetype, users):
+        taken = []
+        kept = []
+        with self.cond:
+            while self._heap and self._heap[0][0] <= until:
+                entry = heapq.heappop(self._heap)
+                _, _, version, alert = entry
+                if version != alert.version or not alert.steps: # 다시 예약되었거나 제거된 알람은 버림
+                    continue
+                if alert.user_id not in users and alert.steps[0].responsetype == responsetype:
+                    users.add(alert.user_id)
+                    taken.append(alert)
+                else:
+                    kept.append(entry)
+            for entry in kept:
+                heapq.heappush(self._heap, entry)
+        return taken
+
+    # 다음 알람 시각이나 새 알람 등록 때까지 잠드는 함수
+    def wait_next(self, max_sleep):
+        with self.cond:
+            if self._heap:
+                timeout = (self._heap[0][0] - datetime.now()).total_seconds()
+                if timeout <= 0:
+                    return
+                self.cond.wait(min(timeout, max_sleep))
+            else:
+                self.cond.wait(max_sleep)
+
+alerts = AlertRegistry()
@@ -0,0 +1,125 @@
+import asyncio
+import contextvars
+import threading
+from contextlib import contextmanager
+
+from audio_arbiter import PRIORITY_REMINDER
+
+# 작업 하나를 멈추라는 신호
+# 취소되면 등록된 콜백(소켓 끊기, 재생기 종료 등)을 즉시 실행해서 다른 thread에서 막혀 있는 작업도 바로 풀어줌
+class CancelToken:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.cancelled = False
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"취소 처리 오류: {e}")
+
+    # 취소될 때 실행할 콜백을 등록하는 함수 (이미 취소됐으면 바로 실행, 반환값을 부르면 등록 해제)
+    def add_callback(self, callback):
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    # with 블록 안에서만 취소 콜백을 등록해두는 함수
+    @contextmanager
+    def on_cancel(self, callback):
+        remove = self.add_callback(callback)
+        try:
+            yield self
+        finally:
+            remove()
+
+_current_token = contextvars.ContextVar("cancel_token", default=None)
+
+# 지금 실행 중인 작업의 취소 토큰 (asyncio.to_thread로 넘어간 thread에서도 그대로 보임, 없으면 취소되지 않는 토큰)
+def current_token():
+    return _current_token.get() or CancelToken()
+
+# 백그라운드 thread 하나에서 도는 asyncio 이벤트 루프
+# 기존 thread 코드(웨이크워드 루프, 스케줄러, 버튼)는 submit/run으로 코루틴을 넘기고,
+# 웨이크워드가 감지되면 cancel_below로 cancellable로 시작한 낮은 우선순위 작업(진행 중인 LLM 요청 등)을 바로 취소함
+class AsyncCore:
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+        self._tasks = {} # 실행 중인 task -> (우선순위, 취소 토큰)
+
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    # 코루틴을 루프에 넘기고 concurrent.futures.Future를 돌려주는 함수 (기다리지 않음)
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop())
+
+    # 코루틴을 실행하고 결과가 나올 때까지 기다리는 함수 (thread 코드용, 루프 안에서 부르면 안 됨)
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    # 웨이크워드로 취소될 수 있는 작업으로 실행하는 함수 (루프 안에서 await)
+    # 작업 안에서는 current_token()으로 취소 토큰을 받아 소켓/재생기 같은 자원을 등록할 수 있음
+    async def cancellable(self, coro, priority=PRIORITY_REMINDER):
+        token = CancelToken()
+
+        async def run():
+            _current_token.set(token) # task마다 context가 복사되므로 이 작업 안에서만 보임
+            return await coro
+
+        task = asyncio.ensure_future(run())
+        with self._lock:
+            self._tasks[task] = (priority, token)
+        try:
+            return await task
+        finally:
+            with self._lock:
+                self._tasks.pop(task, None)
+
+    # 주어진 우선순위보다 낮은 작업을 모두 취소하는 함수 (어느 thread에서 불러도 됨)
+    # 토큰 콜백은 부른 thread에서 바로 실행하므로 재생 중단/연결 끊기가 루프 차례를 기다리지 않음
+    def cancel_below(self, priority):
+        with self._lock:
+            targets = [(task, token) for task, (p, token) in self._tasks.items() if p < priority]
+        for task, token in targets:
+            token.cancel()
+            self.loop().call_soon_threadsafe(task.cancel)
+        return len(targets)
+
+# 비동기 반복자를 다른 thread에서 일반 반복자처럼 꺼내 쓰는 함수 (재생기처럼 동기 코드에 스트림을 넘길 때)
+def iterate_in_thread(async_iterable, loop):
+    iterator = async_iterable.__aiter__()
+
+    async def next_chunk():
+        try:
+            return await iterator.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    while True:
+        chunk = asyncio.run_coroutine_threadsafe(next_chunk(), loop).result()
+        if chunk is None:
+            return
+        yield chunk
+
+core = AsyncCore()
@@ -0,0 +1,123 @@
+import itertools
+import threading
+from contextlib import contextmanager
+
+# 우선순위 (높을수록 먼저)
+PRIORITY_LISTEN = 0 # 웨이크워드 대기 (다른 요청이 오면 바로 양보)
+PRIORITY_REMINDER = 1 # 복약 알림, 버튼 안내 등 기기가 먼저 시작하는 대화
+PRIORITY_USER = 2 # 웨이크워드 이후 사용자와의 대화
+
+# 마이크/스피커를 쓰는 동안 잡고 있는 권한
+class AudioSession:
+    def __init__(self, resources, priority, name, on_preempt, seq):
+        self.resources = resources
+        self.priority = priority
+        self.name = name
+        self.on_preempt = on_preempt # 더 높은 우선순위 요청이 왔을 때 호출 (예: 재생 중단)
+        self.seq = seq
+        self.owner = threading.get_ident()
+        self.preempted = False # True면 가능한 빨리 작업을 멈추고 반납해야 함
+
+# 마이크("mic")와 스피커("speaker")를 우선순위 순서로 나눠주는 중재자
+# 같은 우선순위는 요청 순서대로, 더 높은 우선순위 요청은 사용 중인 낮은 세션에 양보를 요청함
+class AudioArbiter:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._holders = {} # 자원 -> 사용 중인 세션
+        self._waiting = [] # 대기 중인 세션
+        self._seq = itertools.count()
+
+    # 대기 중인 요청보다 밀리지 않고, 자원이 모두 비어있고, 다른 thread가 더 높은 우선순위로 진행 중인 작업이 없으면 사용 가능
+    # (사용자 대화가 마이크만 잡고 있는 동안 알림이 스피커로 말을 걸어 녹음에 섞이지 않도록)
+    def _can_grant(self, session):
+        for resource in session.resources:
+            if resource in self._holders:
+                return False
+        for holder in self._holders.values():
+            if holder.priority > session.priority and holder.owner != session.owner:
+                return False
+        for other in self._waiting:
+            if other is session or not (other.resources & session.resources):
+                continue
+            if (other.priority, -other.seq) > (session.priority, -session.seq):
+                return False
+        return True
+
+    # 자원을 받을 때까지 기다리는 함수 (timeout이 지나면 None)
+    def acquire(self, resources, priority, name="", on_preempt=None, timeout=None):
+        if isinstance(resources, str):
+            resources = (resources,)
+        session = AudioSession(frozenset(resources), priority, name, on_preempt, next(self._seq))
+
+        with self._cond:
+            self._waiting.append(session)
+            victims = []
+            for resource in session.resources:
+                holder = self._holders.get(resource)
+                if holder is not None and holder.priority < priority and not holder.preempted:
+                    holder.preempted = True
+                    victims.append(holder)
+
+        for victim in victims: # 콜백 안에서 중재자를 다시 부를 수 있으므로 잠금 밖에서 호출
+            print(f"'{victim.name}' 작업을 '{name}' 요청으로 중단합니다.")
+            if victim.on_preempt:
+                try:
+                    victim.on_preempt()
+                except Exception as e:
+                    print(f"오디오 중단 처리 오류: {e}")
+
+        with self._cond:
+            granted = self._cond.wait_for(lambda: self._can_grant(session), timeout)
+            self._waiting.remove(session)
+            if not granted:
+                self._cond.notify_all()
+                return None
+            for resource in session.resources:
+                self._holders[resource] = session
+        return session
+
+    def release(self, session):
+        with self._cond:
+            for resource in session.resources:
+                if self._holders.get(resource) is session:
+                    del self._holders[resource]
+            self._cond.notify_all()
+
+    # 이미 잡고 있는 세션의 우선순위를 올리는 함수 (예: 웨이크워드 대기 -> 사용자 대화)
+    def promote(self, session, priority):
+        with self._cond:
+            session.priority = max(session.priority, priority)
+            session.preempted = False
+            self._cond.notify_all()
+
+    # 지금 thread가 잡고 있는 세션 중 resource를 포함한 것
+    def held(self, resource):
+        with self._cond:
+            session = self._holders.get(resource)
+            if session is not None and session.owner == threading.get_ident():
+                return session
+            return None
+
+    # 주어진 우선순위보다 높은 작업이 진행 중이거나 기다리고 있는지
+    def busy_above(self, priority):
+        with self._cond:
+            return any(s.priority > priority for s in [*self._holders.values(), *self._waiting])
+
+    # with 문용 함수 (같은 thread가 이미 잡고 있는 자원은 다시 요청하지 않음)
+    @contextmanager
+    def session(self, resources, priority=PRIORITY_REMINDER, name="", on_preempt=None):
+        if isinstance(resources, str):
+            resources = (resources,)
+        outer = [self.held(resource) for resource in resources]
+        needed = [resource for resource, held in zip(resources, outer) if held is None]
+        if not needed:
+            yield outer[0]
+            return
+
+        session = self.acquire(needed, priority, name, on_preempt)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+arbiter = AudioArbiter()
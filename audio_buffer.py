@@ -0,0 +1,49 @@
+import io
+import wave
+
+# 녹음 -> 업로드 -> 재생까지 파일 없이 메모리로 주고받는 PCM 오디오
+class AudioBuffer:
+    def __init__(self, pcm=b"", rate=16000, channels=1, sampwidth=2):
+        self.pcm = pcm
+        self.rate = rate
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.encoded = {} # 포맷별 업로드 파일 (같은 녹음을 여러 번 보낼 때 다시 인코딩하지 않음)
+
+    @classmethod
+    def from_frames(cls, frames, rate=16000, channels=1, sampwidth=2):
+        return cls(b"".join(frames), rate, channels, sampwidth)
+
+    @classmethod
+    def from_wav(cls, data):
+        with wave.open(io.BytesIO(data), "rb") as wf:
+            return cls(wf.readframes(wf.getnframes()), wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_wav(f.read())
+
+    def __len__(self):
+        return len(self.pcm)
+
+    def view(self):
+        return memoryview(self.pcm)
+
+    def duration(self):
+        return len(self.pcm) / (self.rate * self.channels * self.sampwidth)
+
+    # 업로드용 WAV 바이트로 변환하는 함수
+    def to_wav(self):
+        out = io.BytesIO()
+        with wave.open(out, "wb") as wf:
+            wf.setnchannels(self.channels)
+            wf.setsampwidth(self.sampwidth)
+            wf.setframerate(self.rate)
+            wf.writeframes(self.pcm)
+        return out.getvalue()
+
+    # 디버깅용으로 파일에 저장하는 함수
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_wav())
@@ -0,0 +1,129 @@
+import audioop
+import queue
+import threading
+import time
+
+import pyaudio
+
+from util import load_mic_index
+
+CAPTURE_RATE = 44100 # 마이크 sampling frequency
+CHANNELS = 1
+FRAMES_PER_BUFFER = int(512 * CAPTURE_RATE / 16000) # porcupine frame_length(512)에 맞춘 입력 길이
+MAX_QUEUED_CHUNKS = 64 # 약 2초 분량까지 보관
+
+# 프로세스 전체에서 하나만 열어두는 마이크 입력 스트림
+class AudioCapture:
+    def __init__(self, rate=CAPTURE_RATE, frames_per_buffer=FRAMES_PER_BUFFER, max_chunks=MAX_QUEUED_CHUNKS):
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self._chunks = queue.Queue(maxsize=max_chunks)
+        self._lock = threading.Lock()
+        self._pa = None
+        self._stream = None
+        self.frames_captured = 0 # 장치에서 받은 샘플 수
+        self.overflow_count = 0 # 장치 단에서 놓친 콜백 횟수
+        self.frames_discarded = 0 # 아무도 읽지 않아 버려진 샘플 수
+        self.noise_floor = None # 계속 추적하는 주변 소음 크기 (녹음 시작 시 VAD 기준값)
+        self.muted_until = 0 # 이 시각 전까지 들어온 오디오는 버림 (기기가 내는 안내 음성의 반향 제거)
+        self.frames_muted = 0
+
+    # 스트림을 한 번만 열고 콜백으로 계속 받아두는 함수
+    def start(self):
+        with self._lock:
+            if self._stream is not None:
+                return True
+
+            mic_index = load_mic_index()
+            if mic_index is None:
+                print("저장된 마이크 인덱스를 찾을 수 없습니다.")
+                return False
+
+            self._pa = pyaudio.PyAudio()
+            self._stream = self._pa.open(
+                format=pyaudio.paInt16,
+                channels=CHANNELS,
+                rate=self.rate,
+                input=True,
+                input_device_index=mic_index,
+                frames_per_buffer=self.frames_per_buffer,
+                stream_callback=self._callback
+            )
+            self._stream.start_stream()
+            return True
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        self.frames_captured += frame_count
+        if status & pyaudio.paInputOverflow:
+            self.overflow_count += 1
+
+        if self.muted_until and time.time() < self.muted_until: # 스피커 소리가 다시 들어오는 구간은 소음 추적/전달 모두 제외
+            self.frames_muted += frame_count
+            return (None, pyaudio.paContinue)
+
+        rms = audioop.rms(in_data, 2)
+        if self.noise_floor is None:
+            self.noise_floor = rms
+        else: # 조용해지면 빠르게, 시끄러워지면 천천히 따라감
+            self.noise_floor += (rms - self.noise_floor) * (0.3 if rms < self.noise_floor else 0.01)
+
+        try:
+            self._chunks.put_nowait(in_data)
+        except queue.Full: # 소비가 밀린 경우 가장 오래된 데이터부터 버림
+            try:
+                old = self._chunks.get_nowait()
+                self.frames_discarded += len(old) // 2
+            except queue.Empty:
+                pass
+            self._chunks.put_nowait(in_data)
+        return (None, pyaudio.paContinue)
+
+    # 다음 오디오 조각을 읽는 함수 (timeout 동안 데이터가 없으면 None)
+    def read(self, timeout=1.0):
+        try:
+            return self._chunks.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    # 주어진 시각까지 마이크 입력을 버리도록 설정하는 함수 (이미 더 늦게 설정돼 있으면 유지)
+    def mute_until(self, until):
+        self.muted_until = max(self.muted_until, until)
+
+    # 쌓여있던 오래된 오디오 버리는 함수
+    def flush(self):
+        while True:
+            try:
+                self._chunks.get_nowait()
+            except queue.Empty:
+                return
+
+    def is_active(self):
+        return self._stream is not None and self._stream.is_active()
+
+    def stop(self):
+        with self._lock:
+            if self._stream is not None:
+                try:
+                    if self._stream.is_active():
+                        self._stream.stop_stream()
+                    self._stream.close()
+                except Exception:
+                    pass
+                self._stream = None
+            if self._pa is not None:
+                try:
+                    self._pa.terminate()
+                except Exception:
+                    pass
+                self._pa = None
+        self.flush()
+
+    def stats(self):
+        return {
+            "frames_captured": self.frames_captured,
+            "overflow_count": self.overflow_count,
+            "frames_discarded": self.frames_discarded,
+            "frames_muted": self.frames_muted,
+        }
+
+capture = AudioCapture()
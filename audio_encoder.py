@@ -0,0 +1,205 @@
+import asyncio
+import os
+import subprocess
+import threading
+import time
+
+from config import UPLOAD_FORMATS
+from http_client import client
+
+RATE = 16000 # 업로드 오디오는 항상 16kHz mono int16
+READ_SIZE = 65536
+OPUS_BITRATE = 24 # kbps (음성 인식에는 충분)
+FORMAT_RETRY_DELAY = 300 # 포맷 확인 실패 후 다시 묻기까지 기다리는 시간 (초)
+
+# 포맷 이름 -> (인코더 명령, 스트리밍 Content-Type, 파일 업로드 Content-Type, 확장자)
+# wav는 인코딩 없이 스트리밍은 audio/L16, 파일 업로드는 WAV로 보냄
+FORMATS = {
+    "opus": (
+        ["opusenc", "--quiet", "--raw", "--raw-bits", "16", "--raw-rate", str(RATE), "--raw-chan", "1",
+         "--bitrate", str(OPUS_BITRATE), "-", "-"],
+        "audio/ogg; codecs=opus", "audio/ogg; codecs=opus", "ogg",
+    ),
+    "flac": (
+        ["flac", "--silent", "--force-raw-format", "--endian=little", "--sign=signed", "--channels=1",
+         "--bps=16", f"--sample-rate={RATE}", "-5", "-c", "-"],
+        "audio/flac", "audio/flac", "flac",
+    ),
+    "wav": (None, "audio/L16", "audio/wav", "wav"),
+}
+
+_lock = threading.Lock()
+_negotiated = None # 서버와 정한 업로드 포맷 (None: 아직 모름)
+_negotiating = False # 백그라운드에서 서버에 묻는 중
+_retry_at = 0 # 포맷 확인에 실패하면 이 시각까지 다시 묻지 않음
+_rejected = set() # 서버가 415로 거절했거나 인코더가 없는 포맷
+last_upload = None # 마지막 업로드의 포맷/크기/인코딩 시간
+
+# 업로드 한 번의 원본/전송 크기와 인코딩에 쓴 시간을 기록하고 출력하는 함수
+def report(fmt, bytes_in, bytes_out, encode_seconds):
+    global last_upload
+    last_upload = {"format": fmt, "bytes_in": bytes_in, "bytes_sent": bytes_out, "encode_ms": encode_seconds * 1000}
+    ratio = bytes_out / bytes_in * 100 if bytes_in else 0
+    print(f"[업로드] {fmt} {bytes_out}B (원본 PCM {bytes_in}B의 {ratio:.0f}%) | 인코딩 {encode_seconds * 1000:.1f}ms")
+
+# 이 기기에서 쓸 수 있는 포맷인지 (인코더 프로그램이 설치되어 있는지)
+def encoder_available(fmt):
+    command = FORMATS[fmt][0]
+    return command is None or any(
+        os.access(os.path.join(path, command[0]), os.X_OK) for path in os.environ.get("PATH", "").split(os.pathsep)
+    )
+
+# 서버가 받을 수 있는 포맷 중 UPLOAD_FORMATS 순서로 가장 앞선 포맷을 정하는 함수 (시작할 때 백그라운드에서 실행)
+# 서버가 포맷 목록을 알려주지 않으면 기존과 같은 wav, 서버에 연결되지 않으면 FORMAT_RETRY_DELAY 동안 wav로 보내고 다시 묻지 않음
+def negotiate():
+    global _negotiated, _negotiating, _retry_at
+    supported = ["wav"]
+    try:
+        response = client.get("formats", "/api/audio/formats")
+        if response.status_code == 200:
+            supported = response.json().get("formats", supported)
+    except Exception as e:
+        print(f"업로드 포맷 확인 실패, {FORMAT_RETRY_DELAY}초 동안 wav로 전송합니다: {e}")
+        with _lock:
+            _retry_at = time.time() + FORMAT_RETRY_DELAY
+            _negotiating = False
+        return "wav"
+
+    with _lock:
+        _negotiated = next(
+            (fmt for fmt in UPLOAD_FORMATS
+             if fmt in supported and fmt in FORMATS and fmt not in _rejected and encoder_available(fmt)),
+            "wav"
+        )
+        _negotiating = False
+        print(f"업로드 포맷: {_negotiated} (서버 지원: {', '.join(supported)})")
+        return _negotiated
+
+# 포맷을 아직 모르면 백그라운드에서 서버에 묻는 함수 (이미 묻는 중이거나 실패 후 대기 중이면 그대로 둠)
+def negotiate_in_background():
+    global _negotiating
+    with _lock:
+        if _negotiated is not None or _negotiating or time.time() < _retry_at:
+            return
+        _negotiating = True
+    threading.Thread(target=negotiate, daemon=True).start()
+
+# 업로드에 쓸 포맷 (녹음 중에 서버를 기다리지 않도록 정해지지 않았으면 wav를 돌려주고 백그라운드에서 확인)
+def upload_format():
+    with _lock:
+        if _negotiated is not None:
+            return _negotiated
+    negotiate_in_background()
+    return "wav"
+
+# 서버가 415로 거절한 포맷을 빼고 다음 포맷으로 바꾸는 함수 (바뀐 포맷을 돌려줌)
+def reject_format(fmt):
+    global _negotiated
+    with _lock:
+        _rejected.add(fmt)
+        _negotiated = next((f for f in UPLOAD_FORMATS if f in FORMATS and f not in _rejected and encoder_available(f)), "wav")
+        print(f"서버가 {fmt} 업로드를 거절해 {_negotiated}(으)로 전환합니다.")
+        return _negotiated
+
+def _start(fmt):
+    try:
+        return subprocess.Popen(FORMATS[fmt][0], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        with _lock:
+            _rejected.add(fmt)
+        print(f"{fmt} 인코더 실행 실패: {e}")
+        return None
+
+# 메모리에 있는 녹음(AudioBuffer)을 업로드용 파일로 만드는 함수
+# 반환값: ((파일명, 데이터, Content-Type), 실제 포맷) - 파일은 requests/aiohttp의 files 항목에 그대로 사용
+def encode_buffer(audio, fmt):
+    if fmt in audio.encoded:
+        return audio.encoded[fmt]
+    requested = fmt
+    command, _, content_type, ext = FORMATS[fmt]
+    start = time.time()
+    data = None
+    if command is not None:
+        proc = _start(fmt)
+        if proc is not None:
+            out, _ = proc.communicate(audio.pcm)
+            data = out if proc.returncode == 0 else None
+    if data is None: # wav이거나 인코딩이 실패하면 WAV로 보냄
+        fmt, content_type, ext = "wav", FORMATS["wav"][2], "wav"
+        data = audio.to_wav()
+    report(fmt, len(audio.pcm), len(data), time.time() - start)
+    audio.encoded[requested] = (f"audio.{ext}", data, content_type), fmt
+    return audio.encoded[requested]
+
+# encode_buffer를 이벤트 루프를 막지 않고 실행하는 함수 (포맷도 이때 정함)
+async def encode_buffer_async(audio):
+    return await asyncio.to_thread(lambda: encode_buffer(audio, upload_format()))
+
+# 녹음되는 PCM 조각을 받는 대로 인코딩해서 넘겨주는 스트리밍 인코더
+# 인코더 프로세스 하나에 표준입력으로 넣고 나온 만큼만 바로 꺼내므로 녹음과 전송이 멈추지 않음
+class StreamEncoder:
+    def __init__(self, fmt):
+        # 인코더는 요청 헤더(Content-Type)를 정하기 전에 띄워서, 실행에 실패하면 PCM 그대로 보내도록 바꿈
+        self.proc = _start(fmt) if FORMATS[fmt][0] is not None else None
+        if self.proc is None:
+            fmt = "wav"
+        self.format = fmt
+        self.content_type = FORMATS[fmt][1]
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.encode_seconds = 0 # 인코더에 쓰고 꺼내는 데 쓴 시간 + 마지막 조각 이후 남은 출력을 기다린 시간
+
+    def _drain(self):
+        out = bytearray()
+        while True:
+            try:
+                data = os.read(self.proc.stdout.fileno(), READ_SIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            out += data
+        self.bytes_out += len(out)
+        return bytes(out)
+
+    # PCM 조각 제너레이터를 인코딩된 조각 제너레이터로 바꾸는 함수
+    def encode(self, chunks):
+        proc = self.proc
+        if proc is None: # 인코딩 없이 PCM 그대로 전송
+            for chunk in chunks:
+                self.bytes_in += len(chunk)
+                self.bytes_out += len(chunk)
+                yield chunk
+            report(self.format, self.bytes_in, self.bytes_out, 0)
+            return
+
+        os.set_blocking(proc.stdout.fileno(), False)
+        try:
+            for chunk in chunks:
+                start = time.time()
+                self.bytes_in += len(chunk)
+                proc.stdin.write(chunk)
+                proc.stdin.flush()
+                out = self._drain()
+                self.encode_seconds += time.time() - start
+                if out:
+                    yield out
+
+            start = time.time()
+            proc.stdin.close()
+            os.set_blocking(proc.stdout.fileno(), True)
+            out = proc.stdout.read()
+            proc.wait()
+            self.bytes_out += len(out)
+            self.encode_seconds += time.time() - start
+            if out:
+                yield out
+            report(self.format, self.bytes_in, self.bytes_out, self.encode_seconds)
+        finally:
+            self.close()
+
+    # 전송이 중간에 끊겼거나 시작도 못 한 경우 인코더 종료
+    def close(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
@@ -0,0 +1,195 @@
+import asyncio
+import audioop
+import subprocess
+import threading
+import time
+
+from util import load_speaker_device
+
+DEVICE_RATE = 44100 # 스피커 출력 sampling frequency
+DEVICE_CHANNELS = 2 # 스피커가 mono를 지원하지 않을 수 있으므로 stereo로 출력
+SAMPWIDTH = 2
+READ_SIZE = 4096
+SLICE_SECONDS = 0.05 # 한 번에 aplay로 보내는 최대 길이 (stop() 후 이 안에 멈춤)
+
+# 한 번 띄운 aplay 프로세스에 PCM을 표준입력으로 계속 흘려보내는 재생기
+# mp3는 mpg123으로 장치 포맷의 PCM으로 디코딩해서 같은 aplay로 보냄 (장치는 한 번만 열림)
+class AudioPlayer:
+    def __init__(self, rate=DEVICE_RATE, channels=DEVICE_CHANNELS, command=None, decoder=None):
+        self.rate = rate
+        self.channels = channels
+        self.command = command # None이면 aplay (벤치마크에서 실제 장치 없이 돌릴 때 다른 명령으로 교체)
+        self.decoder = decoder # None이면 mpg123
+        self.byte_rate = rate * channels * SAMPWIDTH
+        self._proc = None
+        self._lock = threading.Lock()
+        self._play_until = 0 # 지금까지 보낸 오디오가 스피커에서 끝나는 시각
+        self._generation = 0 # stop()이 호출될 때마다 증가 (진행 중인 재생은 자신이 시작한 값과 다르면 중단)
+        self._interrupt = threading.Event()
+        self._decoder = None
+        self.last_first_sound = None # 마지막 재생의 요청 -> 첫 오디오 전달까지 걸린 시간(초)
+
+    def _ensure_process(self):
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = subprocess.Popen(
+                self.command or ["aplay", "-q", "-D", load_speaker_device(), "-t", "raw", "-f", "S16_LE",
+                                 "-r", str(self.rate), "-c", str(self.channels), "-"],
+                stdin=subprocess.PIPE,
+                stderr=subprocess.DEVNULL # 재생이 없는 동안의 underrun 메시지 무시
+            )
+        return self._proc
+
+    # generation 재생 중에 stop()이 불리면 aplay를 다시 띄우지 않고 False
+    def _write(self, data, generation):
+        for _ in range(2): # stop() 때문이 아니라 aplay가 죽어있으면 한 번 다시 띄움
+            if generation != self._generation:
+                return False
+            proc = self._ensure_process()
+            try:
+                proc.stdin.write(data)
+                proc.stdin.flush()
+                break
+            except (BrokenPipeError, OSError):
+                self._proc = None
+        else:
+            return False
+        now = time.time()
+        self._play_until = max(self._play_until, now) + len(data) / self.byte_rate
+        return True
+
+    # 지금 PCM을 보내면 재생이 끝날 예상 시각
+    def estimate_end(self, nbytes):
+        return max(self._play_until, time.time()) + nbytes / self.byte_rate
+
+    # 보낸 오디오가 스피커에서 다 나올 때까지 기다리는 함수 (stop()이 호출되면 바로 반환)
+    def wait(self):
+        remaining = self._play_until - time.time()
+        if remaining > 0:
+            self._interrupt.wait(remaining)
+
+    # 지금 재생 중인 소리를 바로 끊는 함수 (장치 버퍼에 남은 소리도 버리기 위해 aplay를 종료)
+    def stop(self):
+        self._generation += 1
+        self._interrupt.set()
+        for proc in (self._decoder, self._proc):
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+        self._play_until = time.time()
+
+    # PCM 조각들을 재생하는 함수 (원본이 장치 포맷과 같으면 변환 없이 그대로 전달, 중간에 끊기면 False)
+    def play_pcm(self, chunks, rate=DEVICE_RATE, channels=DEVICE_CHANNELS):
+        requested = time.time()
+        convert = rate != self.rate or channels != self.channels
+        frame_size = channels * SAMPWIDTH
+        remainder = b""
+        state = None
+        first = True
+        slice_size = int(self.rate * SLICE_SECONDS) * self.channels * SAMPWIDTH
+
+        with self._lock:
+            generation = self._generation
+            self._interrupt.clear()
+            for chunk in chunks:
+                if generation != self._generation:
+                    return False
+                if convert:
+                    chunk = remainder + chunk
+                    cut = len(chunk) - len(chunk) % frame_size
+                    chunk, remainder = chunk[:cut], chunk[cut:]
+                    if channels == 1 and self.channels == 2:
+                        chunk = audioop.tostereo(chunk, SAMPWIDTH, 1, 1)
+                    elif channels == 2 and self.channels == 1:
+                        chunk = audioop.tomono(chunk, SAMPWIDTH, 0.5, 0.5)
+                    if rate != self.rate:
+                        chunk, state = audioop.ratecv(chunk, SAMPWIDTH, self.channels, rate, self.rate, state)
+                if not chunk:
+                    continue
+                for start in range(0, len(chunk), slice_size): # 긴 조각(캐시된 문구 전체 등)도 나눠 보내 중간에 멈출 수 있게 함
+                    if not self._write(chunk[start:start + slice_size], generation):
+                        return False
+                if first:
+                    self.last_first_sound = time.time() - requested
+                    first = False
+            self.wait()
+            return generation == self._generation
+
+    # pydub AudioSegment 재생 함수 (set_channels/set_frame_rate 변환은 필요할 때만)
+    def play_segment(self, segment):
+        if segment.sample_width != SAMPWIDTH:
+            segment = segment.set_sample_width(SAMPWIDTH)
+        self.play_pcm([segment.raw_data], segment.frame_rate, segment.channels)
+
+    def _decoder_command(self):
+        if self.decoder:
+            return self.decoder
+        return ["mpg123", "-q", "-s", "-e", "s16", "-r", str(self.rate),
+                "--stereo" if self.channels == 2 else "--mono", "-"]
+
+    # mp3를 미리 장치 포맷의 PCM으로 디코딩해두는 함수 (즉시 재생해야 하는 고정 문구용)
+    def decode_mp3(self, data):
+        proc = subprocess.run(self._decoder_command(), input=data, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return proc.stdout if proc.returncode == 0 else None
+
+    # decode_mp3의 asyncio 버전 (이벤트 루프를 막지 않고 디코더 프로세스를 기다림)
+    async def decode_mp3_async(self, data):
+        proc = await asyncio.create_subprocess_exec(
+            *self._decoder_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            pcm, _ = await proc.communicate(data)
+        except asyncio.CancelledError:
+            proc.kill()
+            raise
+        return pcm if proc.returncode == 0 else None
+
+    # mp3 조각들을 받는 대로 디코딩해서 재생하는 함수 (첫 조각이 디코딩되면 바로 소리가 남, 실패/중단이면 False)
+    def play_mp3(self, chunks):
+        decoder = subprocess.Popen(
+            self._decoder_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self._decoder = decoder
+        received = [True]
+
+        # 다운로드가 끊겨도 디코더가 EOF를 받아 재생이 끝나도록 표준입력은 항상 닫음
+        def feed():
+            try:
+                for chunk in chunks:
+                    try:
+                        decoder.stdin.write(chunk)
+                    except BrokenPipeError: # 디코더가 먼저 끝난 경우 (중단 등)
+                        return
+            except Exception as e: # 연결 끊김, 읽기 timeout 등
+                print(f"mp3 데이터 수신 실패: {e}")
+                received[0] = False
+            finally:
+                try:
+                    decoder.stdin.close()
+                except OSError:
+                    pass
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        finished = self.play_pcm(iter(lambda: decoder.stdout.read1(READ_SIZE), b""), self.rate, self.channels)
+        if not finished: # 중단된 경우 남은 디코딩/다운로드를 기다리지 않음
+            decoder.kill()
+            decoder.wait()
+            return False
+        feeder.join()
+        return decoder.wait() == 0 and received[0]
+
+    def close(self):
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=2)
+            except Exception:
+                self._proc.kill()
+            self._proc = None
+
+player = AudioPlayer()
@@ -0,0 +1,398 @@
+import audioop
+import glob
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+import pyaudio
+from pydub import AudioSegment
+from scipy.signal import resample
+
+from async_core import core
+from audio_arbiter import PRIORITY_USER
+from audio_buffer import AudioBuffer
+from audio_encoder import FORMATS, encode_buffer, encoder_available
+from audio_capture import CAPTURE_RATE, FRAMES_PER_BUFFER, AudioCapture
+from audio_player import DEVICE_CHANNELS, DEVICE_RATE, AudioPlayer, player
+from gpio_controller import GPIO, RESET_SWITCH, SCEDULE_SWITCH, SKIP_SWITCH, gpio
+from http_client import client
+from llmTts import send_audio_and_get_response
+from resampler import FrameAssembler, StreamResampler
+from stub_server import start_stub_server
+from util import load_mic_index, load_speaker_device
+from vad import VoiceActivityDetector
+
+# 결과 출력 함수
+def report(name, audio_seconds, cpu_seconds, frames_dropped):
+    expected = int(audio_seconds * CAPTURE_RATE)
+    print(f"[{name}] 오디오 {audio_seconds:.1f}초 | "
+          f"CPU {cpu_seconds / audio_seconds * 1000:.1f}ms/초 | "
+          f"누락 프레임 {frames_dropped} ({frames_dropped / max(expected, 1) * 100:.1f}%)")
+
+# 기존 방식: 프레임마다 스트림을 새로 여는 경우
+def bench_capture_reopen(seconds):
+    pa = pyaudio.PyAudio()
+    mic_index = load_mic_index()
+    frames_read = 0
+    cpu_start = time.process_time()
+    start = time.time()
+
+    while time.time() - start < seconds:
+        stream = pa.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=CAPTURE_RATE,
+            input=True,
+            input_device_index=mic_index,
+            frames_per_buffer=FRAMES_PER_BUFFER
+        )
+        data = stream.read(FRAMES_PER_BUFFER, exception_on_overflow=False)
+        frames_read += len(data) // 2
+        stream.stop_stream()
+        stream.close()
+
+    elapsed = time.time() - start
+    cpu = time.process_time() - cpu_start
+    pa.terminate()
+    report("reopen", elapsed, cpu, max(int(elapsed * CAPTURE_RATE) - frames_read, 0))
+
+# 개선 방식: 한 번 열어둔 스트림에서 계속 읽는 경우
+def bench_capture_persistent(seconds):
+    capture = AudioCapture()
+    if not capture.start():
+        return
+    frames_read = 0
+    cpu_start = time.process_time()
+    start = time.time()
+
+    while time.time() - start < seconds:
+        data = capture.read()
+        if data:
+            frames_read += len(data) // 2
+
+    elapsed = time.time() - start
+    cpu = time.process_time() - cpu_start
+    stats = capture.stats()
+    capture.stop()
+    dropped = stats["overflow_count"] * FRAMES_PER_BUFFER + stats["frames_discarded"]
+    report("persistent", elapsed, cpu, dropped)
+
+# 프레임 하나 처리 시간과 임시 메모리 사용량 측정 함수
+def measure_frames(name, process, frames):
+    tracemalloc.start()
+    latencies = []
+    allocated = 0
+    for pcm in frames:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        process(pcm)
+        latencies.append(time.perf_counter() - t0)
+        allocated += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    latencies.sort()
+    print(f"[{name}] 프레임 {len(frames)}개 | "
+          f"중앙값 {latencies[len(latencies) // 2] * 1e6:.0f}us | "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f}us | "
+          f"프레임당 임시 메모리 {allocated / len(frames) / 1024:.1f}KB")
+
+# 기존 방식: 프레임마다 FFT resample + round + NaN 검사
+def resample_fft(pcm_44100):
+    pcm_16000 = resample(pcm_44100, 512)
+    pcm_16000 = np.round(pcm_16000).astype(np.int16)
+    if np.isnan(pcm_16000).any() or np.isinf(pcm_16000).any():
+        return None
+    return pcm_16000
+
+def bench_resample(count):
+    rng = np.random.default_rng(0)
+    frames = [(rng.standard_normal(FRAMES_PER_BUFFER) * 3000).astype(np.int16) for _ in range(count)]
+    measure_frames("scipy.resample", resample_fft, frames)
+
+    resampler = StreamResampler(CAPTURE_RATE, 16000)
+    assembler = FrameAssembler(512)
+    def resample_poly(pcm_44100):
+        for _ in assembler.push(resampler.process(pcm_44100)):
+            pass
+    measure_frames("polyphase", resample_poly, frames)
+
+VAD_RATE = 16000
+VAD_CHUNK = 512 # 녹음 시 한 조각 길이 (약 32ms)
+MAX_RECORDING_TIME = 20
+SYNTHETIC_SEED = 7
+SYNTHETIC_UTTERANCES = ( # 합성 발화 (앞 무음 초, 단어 수, 배경 소음 rms)
+    (0.5, 2, 150),
+    (0.8, 5, 150),
+    (0.3, 8, 400),
+    (1.0, 3, 800),
+)
+
+# WAV 파일을 16kHz mono int16 PCM으로 읽는 함수
+def load_fixture(path):
+    with wave.open(path, "rb") as wf:
+        pcm = wf.readframes(wf.getnframes())
+        if wf.getnchannels() == 2:
+            pcm = audioop.tomono(pcm, 2, 0.5, 0.5)
+        rate = wf.getframerate()
+    if rate != VAD_RATE:
+        pcm, _ = audioop.ratecv(pcm, 2, 1, rate, VAD_RATE, None)
+    return pcm
+
+# 파일 뒤에 마지막 0.5초(주변 소음)를 반복해서 붙여 최대 녹음 시간까지 조각을 넘겨주는 함수
+def fixture_chunks(pcm):
+    step = VAD_CHUNK * 2
+    tail = pcm[-VAD_RATE:] or b"\0" * step
+    stream = pcm
+    while len(stream) < MAX_RECORDING_TIME * VAD_RATE * 2:
+        stream += tail
+    for i in range(0, MAX_RECORDING_TIME * VAD_RATE * 2, step):
+        yield stream[i:i + step]
+
+# 기존 규칙: rms 1600 미만이 3초 이어지면 종료
+def end_by_fixed_rms(pcm):
+    silence = 0
+    for i, chunk in enumerate(fixture_chunks(pcm)):
+        if audioop.rms(chunk, 2) < 1600:
+            silence += len(chunk) / 2 / VAD_RATE
+            if silence > 3:
+                return (i + 1) * VAD_CHUNK / VAD_RATE
+        else:
+            silence = 0
+    return MAX_RECORDING_TIME
+
+# VAD 규칙: 소음 바닥 추적 + hangover 후 종료, 업로드 길이도 함께 반환
+def end_by_vad(pcm):
+    vad = VoiceActivityDetector(VAD_RATE)
+    kept = 0
+    for chunk in fixture_chunks(pcm):
+        kept += sum(len(c) for c in vad.push(chunk))
+        if vad.ended:
+            break
+    kept += sum(len(c) for c in vad.flush())
+    return vad.elapsed_ms / 1000, vad.speech_end_ms, kept / 2 / VAD_RATE
+
+# 녹음 파일이 없을 때 쓰는 합성 발화 (배경 소음 - 음절처럼 커졌다 작아지는 유성음과 짧은 쉼 - 배경 소음)
+# 반환값: [(이름, 16kHz mono int16 PCM, 실제 말 끝 시점(초))] - 같은 seed로 항상 같은 오디오
+def synthetic_fixtures():
+    rng = np.random.default_rng(SYNTHETIC_SEED)
+    fixtures = []
+    for lead, words, noise in SYNTHETIC_UTTERANCES:
+        parts = [rng.normal(0, noise, int(lead * VAD_RATE))]
+        for _ in range(words):
+            seconds = rng.uniform(0.2, 0.5)
+            t = np.arange(int(seconds * VAD_RATE)) / VAD_RATE
+            pitch = rng.uniform(110, 220)
+            voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6)) # 기본음 + 배음
+            envelope = np.sin(np.pi * t / seconds)
+            parts.append(voiced * envelope * rng.uniform(3000, 8000) + rng.normal(0, noise, len(t)))
+            parts.append(rng.normal(0, noise, int(rng.uniform(0.05, 0.2) * VAD_RATE))) # 단어 사이 쉼
+        speech_end = (sum(map(len, parts)) - len(parts[-1])) / VAD_RATE
+        parts.append(rng.normal(0, noise, 2 * VAD_RATE)) # 말 끝 이후 주변 소음
+        pcm = np.clip(np.concatenate(parts), -32768, 32767).astype(np.int16).tobytes()
+        fixtures.append((f"합성 {words}단어, 소음 rms {noise}", pcm, speech_end))
+    return fixtures
+
+# 폴더의 WAV 파일 (실제 말 끝 시점(초)은 같은 이름의 .txt 파일에서 읽고, 없으면 None)
+def folder_fixtures(folder):
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(folder, "*.wav"))):
+        label = os.path.splitext(path)[0] + ".txt"
+        speech_end = None
+        if os.path.exists(label):
+            with open(label) as f:
+                speech_end = float(f.read().strip())
+        fixtures.append((os.path.basename(path), load_fixture(path), speech_end))
+    return fixtures
+
+# 녹음(없으면 합성 발화)마다 말 끝 이후 종료 판단까지 걸린 시간 비교
+# 실제 말 끝 시점을 모르는 녹음은 VAD 추정값을 사용
+def bench_vad(folder):
+    fixed_latency, vad_latency = [], []
+    fixtures = folder_fixtures(folder)
+    if not fixtures:
+        print(f"WAV 파일이 없어 합성 발화로 측정합니다: {folder}")
+        fixtures = synthetic_fixtures()
+
+    for name, pcm, speech_end in fixtures:
+        vad_end, speech_end_ms, uploaded = end_by_vad(pcm)
+        if speech_end is None and speech_end_ms is not None:
+            speech_end = speech_end_ms / 1000
+        elif speech_end is None:
+            print(f"{name}: 말소리를 찾지 못해 제외")
+            continue
+
+        fixed_end = end_by_fixed_rms(pcm)
+        fixed_latency.append(fixed_end - speech_end)
+        vad_latency.append(vad_end - speech_end)
+        print(f"{name}: 말 끝 {speech_end:.2f}s | 기존 종료 {fixed_end:.2f}s | "
+              f"VAD 종료 {vad_end:.2f}s | 업로드 길이 {len(pcm) / 2 / VAD_RATE:.2f}s -> {uploaded:.2f}s")
+
+    if vad_latency:
+        print(f"[말 끝 -> 종료 판단 중앙값] 기존 {statistics.median(fixed_latency):.2f}s | "
+              f"VAD {statistics.median(vad_latency):.2f}s ({len(vad_latency)}개)")
+
+# 테스트용 사인파 AudioSegment 생성 함수
+def make_tone(seconds, rate, channels):
+    t = np.arange(int(seconds * rate)) / rate
+    pcm = (np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16)
+    if channels == 2:
+        pcm = np.repeat(pcm, 2)
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=rate, channels=channels)
+
+# 기존 방식: 변환 -> /tmp WAV 저장 -> aplay 실행 (프로세스가 뜨기까지를 첫 소리 시점으로 봄)
+def first_sound_tempfile(segment):
+    start = time.time()
+    if segment.channels == 1:
+        segment = segment.set_channels(2)
+    segment = segment.set_frame_rate(44100)
+    segment.export("/tmp/temp_audio.wav", format="wav")
+    proc = subprocess.Popen(["aplay", "-q", "-D", load_speaker_device(), "/tmp/temp_audio.wav"])
+    first = time.time() - start
+    proc.wait()
+    return first
+
+# 개선 방식: 상주 aplay에 표준입력으로 바로 전달
+def first_sound_player(player, segment):
+    player.play_segment(segment)
+    return player.last_first_sound
+
+def bench_playback(repeat):
+    player = AudioPlayer()
+    for rate, channels in ((DEVICE_RATE, DEVICE_CHANNELS), (24000, 1)):
+        segment = make_tone(1.0, rate, channels)
+        old = [first_sound_tempfile(segment) for _ in range(repeat)]
+        new = [first_sound_player(player, segment) for _ in range(repeat)]
+        print(f"[{rate}Hz/{channels}ch] 첫 소리까지 중앙값: 임시파일+aplay {statistics.median(old) * 1000:.1f}ms | "
+              f"상주 재생기 {statistics.median(new) * 1000:.1f}ms")
+    player.close()
+
+# 기존 방식: 모듈마다 만든 컨트롤러가 각자 스위치 3개를 100ms마다 폴링하던 구조 재현
+def bench_gpio_polling(seconds, controllers=6):
+    stop = time.time() + seconds
+
+    def monitor():
+        while time.time() < stop:
+            for pin in (SCEDULE_SWITCH, SKIP_SWITCH, RESET_SWITCH):
+                GPIO.input(pin)
+            time.sleep(0.1)
+
+    threads = [threading.Thread(target=monitor) for _ in range(controllers)]
+    cpu_start = time.process_time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.process_time() - cpu_start
+
+# 개선 방식: 인터럽트 기반 서비스 하나만 떠 있는 상태에서 대기
+def bench_gpio_events(seconds):
+    gpio.on_button(SKIP_SWITCH, lambda: None)
+    cpu_start = time.process_time()
+    time.sleep(seconds)
+    return time.process_time() - cpu_start
+
+def bench_gpio(seconds):
+    polling = bench_gpio_polling(seconds)
+    events = bench_gpio_events(seconds)
+    print(f"[gpio] 대기 {seconds:.0f}초 CPU: 폴링 thread 6개 {polling / seconds * 1000:.2f}ms/초 | "
+          f"엣지 인터럽트 {events / seconds * 1000:.2f}ms/초")
+
+# LLM 요청을 보내고 delay초 뒤 웨이크워드처럼 취소했을 때, 호출이 반환되고 재생기가 멈추기까지 걸린 시간
+def cancel_once(audio, delay):
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (send_audio_and_get_response(audio, "/api/FEtest", {}), done.set()), daemon=True)
+    thread.start()
+    time.sleep(delay)
+    start = time.time()
+    core.cancel_below(PRIORITY_USER)
+    stopped = None
+    while not done.is_set() and time.time() - start < 5:
+        if stopped is None and (player._proc is None or player._proc.poll() is not None):
+            stopped = time.time() - start
+        time.sleep(0.001)
+    returned = time.time() - start if done.is_set() else float("inf")
+    return returned, returned if stopped is None else stopped
+
+# fake=True면 스피커/mpg123 없이 PCM을 그대로 버리는 명령으로 재생 (CI나 개발 PC용)
+def bench_cancel(repeat, fake):
+    server = start_stub_server()
+    client.base_url = server.url
+    server.reply_seconds = 5
+    if fake:
+        player.command = ["sh", "-c", "cat > /dev/null"]
+        player.decoder = ["cat"]
+        server.reply_audio = make_tone(5.0, DEVICE_RATE, DEVICE_CHANNELS).raw_data
+    else:
+        server.reply_audio = make_tone(5.0, 24000, 1).export(format="mp3").read()
+    audio = AudioBuffer(make_tone(1.0, CAPTURE_RATE, 1).raw_data)
+
+    for stage, llm_delay, delay in (("요청 대기 중", 3, 0.5), ("재생 중", 0, 1.0)):
+        server.llm_delay = llm_delay
+        results = [cancel_once(audio, delay) for _ in range(repeat)]
+        returned = [r[0] * 1000 for r in results]
+        stopped = [r[1] * 1000 for r in results]
+        print(f"[{stage} 취소] 반환까지 중앙값 {statistics.median(returned):.1f}ms (최대 {max(returned):.1f}ms) | "
+              f"재생기 정지까지 중앙값 {statistics.median(stopped):.1f}ms (최대 {max(stopped):.1f}ms) | 목표 100ms")
+    print(f"중간에 끊긴 다운로드: {server.aborted_downloads}회")
+    server.shutdown()
+
+# 업로드 포맷별 전송 크기와 인코딩 시간 (fixtures 폴더의 녹음, 없으면 합성 발화)
+def bench_encode(folder):
+    fixtures = folder_fixtures(folder) or synthetic_fixtures()
+    clips = [AudioBuffer(pcm) for _, pcm, _ in fixtures]
+    for fmt in FORMATS:
+        if not encoder_available(fmt):
+            print(f"[{fmt}] 인코더가 설치되어 있지 않아 건너뜀")
+            continue
+        sizes, times = [], []
+        for clip in clips:
+            start = time.time()
+            file, _ = encode_buffer(clip, fmt)
+            times.append((time.time() - start) * 1000)
+            sizes.append(len(file[1]) / clip.duration() / 1000)
+        print(f"[{fmt}] 초당 {statistics.median(sizes):.1f}KB | 인코딩 중앙값 {statistics.median(times):.1f}ms ({len(clips)}개)")
+
+def run_capture(args):
+    seconds = float(args[0]) if args else 10
+    bench_capture_reopen(seconds)
+    bench_capture_persistent(seconds)
+
+def run_resample(args):
+    bench_resample(int(args[0]) if args else 2000)
+
+def run_vad(args):
+    bench_vad(args[0] if args else "fixtures")
+
+def run_playback(args):
+    bench_playback(int(args[0]) if args else 5)
+
+def run_gpio(args):
+    bench_gpio(float(args[0]) if args else 10)
+
+def run_encode(args):
+    bench_encode(args[0] if args else "fixtures")
+
+def run_cancel(args):
+    bench_cancel(int(args[0]) if args and args[0].isdigit() else 5, "--fake" in args)
+
+BENCHMARKS = {
+    "capture": run_capture,
+    "resample": run_resample,
+    "vad": run_vad,
+    "playback": run_playback,
+    "gpio": run_gpio,
+    "cancel": run_cancel,
+    "encode": run_encode,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"사용법: python benchmark.py [{'|'.join(BENCHMARKS)}] [인자...]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](sys.argv[2:])
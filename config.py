@@ -4,10 +4,14 @@ BASE_URL = "http://3.34.179.85:8000"
 # 사용자 ID
 USER_ID = 3
 FE_USER_ID = 3
+USER_IDS = [USER_ID] # 한 기기로 여러 명의 복약 알림을 관리할 때 (공용 공간) 사용자 ID 목록
 
 WAV_PATH = "/home/pi/my_project/stt.wav"
 LLM_VOICE_PATH = "/home/pi/my_project/llm_answer.mp3"
 DUMMY_PATH = "/home/pi/my_project/test.wav"
+DEBUG_AUDIO = False # True일 때만 녹음/응답 음성을 파일로 남김
+STT_PREROLL_MS = 1000 # 웨이크워드 감지 직후 ~ 녹음 시작 전 오디오를 녹음 앞에 붙이는 최대 길이 (바로 이어 말한 첫 단어 보존, 0이면 사용 안 함)
+UPLOAD_FORMATS = ("opus", "flac", "wav") # 업로드 포맷 선호 순서 (서버가 지원하고 인코더가 설치된 첫 포맷 사용)
 # 복약 리마인더 설정
 DOSAGE_TIME = 2
 DOSAGE_COUNT = 3
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import deque
+
+import requests
+
+from gpio_controller import gpio
+from http_client import client
+
+QUEUE_CAPACITY = 50 # 보관할 최대 이벤트 수 (넘치면 가장 오래된 것부터 버림)
+RETRY_DELAY = 1 # 전송 실패 후 첫 재시도 대기 시간 (초)
+MAX_RETRY_DELAY = 30
+
+# 응답을 기다릴 필요 없는 알림성 POST를 백그라운드에서 순서대로 보내는 큐
+# 같은 coalesce_key의 이벤트가 아직 대기 중이면 새 이벤트로 덮어써서 한 번만 보냄
+class EventQueue:
+    def __init__(self, capacity=QUEUE_CAPACITY):
+        self.capacity = capacity
+        self._events = deque()
+        self._cond = threading.Condition()
+        self._sending = None # 지금 전송 중인 이벤트 (덮어쓰기/버리기 대상에서 제외)
+        self._thread = None
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def post(self, endpoint, path, coalesce_key=None, **kwargs):
+        event = {"endpoint": endpoint, "path": path, "key": coalesce_key, "kwargs": kwargs}
+        with self._cond:
+            if coalesce_key is not None:
+                for i, pending in enumerate(self._events):
+                    if pending["key"] == coalesce_key and pending is not self._sending:
+                        self._events[i] = event
+                        self.coalesced += 1
+                        return
+            if len(self._events) >= self.capacity:
+                self._drop_oldest()
+            self._events.append(event)
+            self._cond.notify()
+        self._ensure_worker()
+
+    def _drop_oldest(self):
+        for i, pending in enumerate(self._events):
+            if pending is not self._sending:
+                del self._events[i]
+                self.dropped += 1
+                print(f"이벤트 큐가 가득 차 오래된 이벤트를 버립니다: {pending['path']}")
+                return
+
+    def _ensure_worker(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        delay = RETRY_DELAY
+        while True:
+            with self._cond:
+                while not self._events:
+                    self._cond.wait()
+                event = self._events[0] # 순서를 지키기 위해 맨 앞 이벤트가 성공해야 다음으로 넘어감
+                self._sending = event
+
+            try:
+                response = client.post(event["endpoint"], event["path"], retries=0, **event["kwargs"])
+                if response.status_code >= 500:
+                    raise requests.HTTPError(f"서버 오류 {response.status_code}")
+                if response.status_code != 200: # 다시 보내도 성공할 수 없는 요청
+                    print(f"이벤트 전송 거절: {event['path']} {response.status_code} - {response.text}")
+                else:
+                    self.sent += 1
+                delay = RETRY_DELAY
+            except requests.RequestException as e:
+                print(f"이벤트 전송 실패, {delay}초 후 재시도: {e}")
+                with self._cond:
+                    self._sending = None
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+            except Exception as e: # 요청을 만들거나 응답을 처리하다 난 오류는 다시 보내도 같으므로 버리고, thread는 계속 진행
+                print(f"이벤트 전송 중 오류, 이벤트를 버리고 {delay}초 후 계속합니다: {event['path']} {e}")
+                gpio.flash("error")
+                with self._cond:
+                    if self._events and self._events[0] is event:
+                        self._events.popleft()
+                        self.dropped += 1
+                    self._sending = None
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+
+            with self._cond:
+                if self._events and self._events[0] is event:
+                    self._events.popleft()
+                self._sending = None
+
+    def depth(self):
+        with self._cond:
+            return len(self._events)
+
+events = EventQueue()
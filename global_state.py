@@ -1,6 +1 @@
-from collections import deque
-import threading
-# 공통으로 사용할 전역 alert 큐
-pending_alerts = deque()
-mic_lock = threading.Lock()
-wakeword_detection = False 
+last_recording = None # 가장 최근 사용자 음성 (AudioBuffer)
@@ -1,4 +1,6 @@
+import atexit
 import os
+import queue
 import threading
 import time
  
@@ -8,7 +10,7 @@ try:
 except (ImportError, RuntimeError):
     RPI_AVAILABLE = False
     class GPIO:
-        BCM = OUT = IN = HIGH = LOW = PUD_UP = None
+        BCM = OUT = IN = HIGH = LOW = PUD_UP = FALLING = None
         @staticmethod
         def setmode(*args, **kwargs): pass
         @staticmethod
@@ -18,6 +20,8 @@ except (ImportError, RuntimeError):
         @staticmethod
         def input(*args): return 1
         @staticmethod
+        def add_event_detect(*args, **kwargs): pass
+        @staticmethod
         def cleanup(): pass
 
 # 핀 번호 설정
@@ -28,15 +32,43 @@ SCEDULE_SWITCH = 23
 SKIP_SWITCH = 24
 RESET_SWITCH = 25
 
+LED_PINS = (RED_LED, BLUE_LED, GREEN_LED)
+# 모드별 (우선순위, 패턴) - 패턴은 (켤 LED들, 유지 시간) 목록이며 유지 시간이 None이면 계속 유지, 아니면 반복
+LED_MODES = {
+    "default": (0, [((), None)]),
+    "wakeword": (1, [((BLUE_LED,), None)]),
+    "llmtts": (1, [((BLUE_LED,), 0.8), ((), 0.2)]), # 말하는 중에는 느리게 깜빡임
+    "thinking": (2, [((GREEN_LED,), 0.4), ((), 0.4)]),
+    "error": (3, [((RED_LED,), None)]),
+}
+FLASH_SECONDS = 2 # flash()로 잠깐 표시하는 상태의 기본 유지 시간
+
+DEBOUNCE_MS = 200 # 이 시간 안에 다시 들어온 엣지는 채터링으로 보고 무시
+RESET_HOLDOFF = 5 # 재시작 버튼 연속 입력 방지 (초)
+
+# 프로세스 전체에서 하나만 쓰는 GPIO 서비스
+# 버튼은 폴링 대신 엣지 인터럽트로 받고, 등록된 콜백은 전용 thread 하나에서 순서대로 한 번씩 실행
+# LED는 전용 thread가 현재 상태(우선순위가 가장 높은 것)의 패턴을 그리며, 값이 바뀐 핀만 씀
 class GPIOController:
-    def __init__(self, refresh_callback, skip_callback):
-        self.refresh_callback = refresh_callback
-        self.skip_callback = skip_callback
+    def __init__(self):
         self.initialized = False
-        self.last_reset_time = 0  
-        self.initialized = self._setup_gpio() 
+        self.last_reset_time = 0
+        self._led_cond = threading.Condition()
+        self._base_mode = "default" # set_mode로 정한 상태 (다음 set_mode까지 유지)
+        self._timed = {} # flash로 잠깐 띄운 상태 -> 끝나는 시각
+        self._shown_mode = None
+        self._shown_since = 0
+        self._pin_values = {} # 마지막으로 쓴 핀 값
+        self._closed = False
+        self._handlers = {} # 핀 번호 -> 콜백 목록
+        self._last_edge = {} # 핀 번호 -> 마지막으로 받아들인 눌림 시각
+        self._presses = queue.Queue()
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self.initialized = self._setup_gpio()
         if self.initialized:
-            self._start_switch_monitor()
+            threading.Thread(target=self._led_loop, daemon=True).start()
+            self.on_button(RESET_SWITCH, self._on_reset)
 
     def _setup_gpio(self):
         try:
@@ -53,54 +85,122 @@ class GPIOController:
             print(f"GPIO 설정 중 오류 발생: {e}")
             return False
 
-    def _start_switch_monitor(self):
-        def monitor():
-            while True:
-                try:
-                    if GPIO.input(SCEDULE_SWITCH) == GPIO.LOW:
-                        self.refresh_callback()
-                        time.sleep(1)
-
-                    if GPIO.input(SKIP_SWITCH) == GPIO.LOW:
-                        self.skip_callback()
-                        time.sleep(1)
-                    
-                    if GPIO.input(RESET_SWITCH) == GPIO.LOW:
-                        now = time.time()
-                        if now - self.last_reset_time > 5:
-                            self.last_reset_time = now
-                            restart_program() 
+    # 버튼 눌림에 실행할 콜백을 등록하는 함수 (같은 콜백은 한 번만 등록됨)
+    def on_button(self, pin, callback):
+        if not self.initialized:
+            return
+        with self._lock:
+            handlers = self._handlers.setdefault(pin, [])
+            if callback in handlers:
+                return
+            handlers.append(callback)
+            first = len(handlers) == 1
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+                self._dispatcher.start()
+        if first:
+            try:
+                GPIO.add_event_detect(pin, GPIO.FALLING, callback=self._on_edge, bouncetime=DEBOUNCE_MS)
+            except Exception as e:
+                print(f"스위치 인터럽트 설정 실패 ({pin}): {e}")
 
-                except Exception as e:
-                    print(f"스위치 모니터링 오류: {e}")
-                    self.set_mode("error")
-                    time.sleep(1) 
+    # RPi.GPIO 인터럽트 thread에서 호출됨 (여기서는 걸러서 큐에 넣기만 함)
+    def _on_edge(self, pin):
+        now = time.monotonic()
+        if now - self._last_edge.get(pin, 0) < DEBOUNCE_MS / 1000:
+            return
+        if GPIO.input(pin) != GPIO.LOW: # 떼는 순간의 잡음 엣지는 무시
+            return
+        self._last_edge[pin] = now
+        self._presses.put(pin)
 
-                time.sleep(0.1)
+    def _dispatch(self):
+        while True:
+            pin = self._presses.get()
+            with self._lock:
+                handlers = list(self._handlers.get(pin, ()))
+            for callback in handlers:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"스위치 처리 오류: {e}")
+                    self.flash("error")
 
-        threading.Thread(target=monitor, daemon=True).start()
+    def _on_reset(self):
+        now = time.time()
+        if now - self.last_reset_time > RESET_HOLDOFF:
+            self.last_reset_time = now
+            restart_program()
 
+    # 기본 LED 상태를 바꾸는 함수 (바로 반환, 실제 표시는 LED thread가 처리)
     def set_mode(self, mode):
-        if not self.initialized:
+        if mode not in LED_MODES:
+            print(f"알 수 없는 LED 모드: {mode}")
+            mode = "default"
+        with self._led_cond:
+            if self._base_mode != mode:
+                self._base_mode = mode
+                self._led_cond.notify()
+
+    # 정해진 시간 동안만 상태를 띄우는 함수 (우선순위가 높으면 기본 상태 위에 표시되고, 끝나면 저절로 돌아감)
+    def flash(self, mode, seconds=FLASH_SECONDS):
+        if mode not in LED_MODES:
+            print(f"알 수 없는 LED 모드: {mode}")
             return
-        GPIO.output(RED_LED, GPIO.LOW)
-        GPIO.output(BLUE_LED, GPIO.LOW)
-        GPIO.output(GREEN_LED, GPIO.LOW)
-        if mode == "default":
-            GPIO.output(BLUE_LED, GPIO.LOW)
-            GPIO.output(RED_LED, GPIO.LOW)
-            GPIO.output(GREEN_LED, GPIO.LOW)
-        elif mode == "wakeword":
-            GPIO.output(BLUE_LED, GPIO.HIGH)
-        elif mode == "llmtts":
-            GPIO.output(BLUE_LED, GPIO.HIGH)
-        elif mode == "error":
-            GPIO.output(RED_LED, GPIO.HIGH)
-        elif mode == "thinking" :
-            GPIO.output(GREEN_LED, GPIO.HIGH)
+        with self._led_cond:
+            self._timed[mode] = max(self._timed.get(mode, 0), time.monotonic() + seconds)
+            self._led_cond.notify()
+
+    # 지금 보여줄 모드 (만료된 flash는 정리)
+    def _current_mode(self, now):
+        for mode, until in list(self._timed.items()):
+            if until <= now:
+                del self._timed[mode]
+        return max([*self._timed, self._base_mode], key=lambda mode: LED_MODES[mode][0])
+
+    # 패턴에서 지금 켤 LED와 다음 단계까지 남은 시간을 구하는 함수
+    @staticmethod
+    def _pattern_step(pattern, elapsed):
+        if len(pattern) == 1:
+            return pattern[0][0], None
+        t = elapsed % sum(duration for _, duration in pattern)
+        for pins, duration in pattern:
+            if t < duration:
+                return pins, duration - t
+            t -= duration
+        return pattern[-1][0], pattern[-1][1]
+
+    def _write_leds(self, pins_on):
+        for pin in LED_PINS:
+            value = GPIO.HIGH if pin in pins_on else GPIO.LOW
+            if self._pin_values.get(pin, object()) != value:
+                GPIO.output(pin, value)
+                self._pin_values[pin] = value
+
+    def _led_loop(self):
+        with self._led_cond:
+            while not self._closed:
+                now = time.monotonic()
+                mode = self._current_mode(now)
+                if mode != self._shown_mode:
+                    self._shown_mode = mode
+                    self._shown_since = now
+                pins_on, step_left = self._pattern_step(LED_MODES[mode][1], now - self._shown_since)
+                try:
+                    self._write_leds(pins_on)
+                except Exception as e:
+                    print(f"LED 출력 오류: {e}")
+
+                waits = [until - now for until in self._timed.values()]
+                if step_left is not None:
+                    waits.append(step_left)
+                self._led_cond.wait(min(waits) if waits else None)
 
     def cleanup(self):
         if self.initialized:
+            with self._led_cond:
+                self._closed = True
+                self._led_cond.notify()
             GPIO.cleanup()
 
 def restart_program():
@@ -109,4 +209,6 @@ def restart_program():
         "/home/pi/my_project/env/bin/python",
         "/home/pi/my_project/main.py"
     ])
-    
+
+gpio = GPIOController()
+atexit.register(gpio.cleanup)
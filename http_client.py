@@ -0,0 +1,348 @@
+import asyncio
+import socket
+import threading
+import time
+import types
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+try:
+    import aiohttp
+except ImportError: # 없으면 비동기 요청도 기존 requests 클라이언트를 별도 thread에서 실행
+    aiohttp = None
+
+from async_core import current_token
+from config import BASE_URL
+
+# 엔드포인트별 (연결, 응답) 타임아웃 초
+TIMEOUTS = {
+    "wake": (2, 3),
+    "stt": (3, 15),
+    "stt_stream": (3, 30),
+    "stt_intent": (3, 30),
+    "tts": (3, 10),
+    "llm": (3, 30),
+    "llm_audio": (3, 15),
+    "users": (3, 5),
+    "histories": (3, 10),
+    "formats": (1, 2), # 백그라운드에서 묻고, 실패하면 wav로 보냄
+}
+DEFAULT_TIMEOUT = (3, 10)
+RETRIES = {"wake": 1, "tts": 2, "users": 2, "histories": 2, "formats": 0} # 재시도 횟수 (없으면 DEFAULT_RETRIES)
+DEFAULT_RETRIES = 1
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS") # 응답을 못 받고 다시 보내도 되는 요청
+BACKOFF = 0.3 # 재시도 대기 시간 (0.3, 0.6, 1.2 ...)
+BREAKER_THRESHOLD = 5 # 연속 실패가 이만큼 쌓이면 잠시 요청 차단
+BREAKER_COOLDOWN = 30 # 차단 후 다시 시도해보기까지 시간 (초)
+HISTOGRAM_BOUNDS_MS = (25, 50, 100, 200, 400, 800, 1600, 3200, 6400, 12800)
+
+# 서버가 계속 실패해서 요청을 보내지 않고 바로 실패시킬 때 발생하는 예외
+class CircuitOpenError(requests.RequestException):
+    pass
+
+# 엔드포인트 하나의 응답 시간 분포와 연속 실패 상태
+class EndpointStats:
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.open_until = 0
+
+    def record(self, elapsed_ms):
+        self.count += 1
+        for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    # 히스토그램에서 백분위 값을 구간 상한으로 근사하는 함수
+    def percentile(self, p):
+        if not self.count:
+            return None
+        target = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return HISTOGRAM_BOUNDS_MS[i] if i < len(HISTOGRAM_BOUNDS_MS) else float("inf")
+        return float("inf")
+
+# 서버에 요청이 전달되지 않은 실패인지 (연결 자체가 안 된 경우라 POST도 다시 보낼 수 있음)
+def _never_sent(error):
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+# 요청을 보내고 응답 헤더를 받을 때까지 지금 작업의 취소 토큰에 등록되는 연결
+# 취소되면 소켓을 shutdown해서 send/recv에서 막혀 있는 thread를 바로 풀어줌 (aiohttp가 없을 때 thread로 실행되는 요청용)
+# 응답을 받은 뒤 본문을 읽는 동안은 abort_response를 등록해서 끊음
+class AbortableConnectionMixin:
+    def request(self, *args, **kwargs):
+        self._unregister = current_token().add_callback(self.abort)
+        try:
+            return super().request(*args, **kwargs)
+        except BaseException:
+            self._unregister()
+            raise
+
+    def getresponse(self, *args, **kwargs):
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            self._unregister()
+
+    def abort(self):
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class AbortableHTTPConnection(AbortableConnectionMixin, HTTPConnection):
+    pass
+
+class AbortableHTTPSConnection(AbortableConnectionMixin, HTTPSConnection):
+    pass
+
+class AbortableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = AbortableHTTPConnection
+
+class AbortableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = AbortableHTTPSConnection
+
+# 백엔드 서버와 연결을 유지하며 타임아웃/재시도/차단을 적용하는 공용 클라이언트
+class BackendClient:
+    def __init__(self, base_url=BASE_URL):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        adapter.poolmanager.pool_classes_by_scheme = {"http": AbortableHTTPConnectionPool, "https": AbortableHTTPSConnectionPool}
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _endpoint(self, name):
+        with self._lock:
+            if name not in self._stats:
+                self._stats[name] = EndpointStats()
+            return self._stats[name]
+
+    def _failed(self, stats):
+        with self._lock:
+            stats.errors += 1
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= BREAKER_THRESHOLD:
+                stats.open_until = time.time() + BREAKER_COOLDOWN
+
+    # path가 http로 시작하면 그대로 사용, 아니면 BASE_URL 뒤에 붙임
+    def url(self, path):
+        return path if path.startswith("http") else f"{self.base_url}{path}"
+
+    def _check_breaker(self, endpoint, stats):
+        if stats.open_until > time.time():
+            raise CircuitOpenError(f"{endpoint} 요청 차단 중 (연속 실패 {stats.consecutive_failures}회)")
+
+    # 요청 함수
+    def request(self, method, endpoint, path, retries=None, timeout=None, **kwargs):
+        url = self.url(path)
+        stats = self._endpoint(endpoint)
+        if timeout is None:
+            timeout = TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        if retries is None:
+            retries = RETRIES.get(endpoint, DEFAULT_RETRIES)
+        if isinstance(kwargs.get("data"), types.GeneratorType): # 스트리밍 본문은 다시 보낼 수 없음
+            retries = 0
+
+        self._check_breaker(endpoint, stats)
+        token = current_token()
+        # POST(STT, LLM 등)는 서버에 도착한 뒤 실패하면 다시 보내지 않음 (서버에서 중복 처리되고 기다리는 시간만 늘어남)
+        idempotent = method in IDEMPOTENT_METHODS
+
+        for attempt in range(retries + 1):
+            start = time.time()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if token.cancelled: # 취소로 연결을 끊은 경우 (서버 실패로 세지 않고 다시 보내지 않음)
+                    raise
+                self._failed(stats)
+                if attempt < retries and (idempotent or _never_sent(e)):
+                    time.sleep(BACKOFF * 2 ** attempt)
+                    continue
+                raise
+
+            stats.record((time.time() - start) * 1000)
+            if response.status_code >= 500:
+                self._failed(stats)
+                if attempt < retries and idempotent and not token.cancelled:
+                    response.close()
+                    time.sleep(BACKOFF * 2 ** attempt)
+                    continue
+            else:
+                stats.consecutive_failures = 0
+            return response
+
+    def get(self, endpoint, path, **kwargs):
+        return self.request("GET", endpoint, path, **kwargs)
+
+    def post(self, endpoint, path, **kwargs):
+        return self.request("POST", endpoint, path, **kwargs)
+
+    def put(self, endpoint, path, **kwargs):
+        return self.request("PUT", endpoint, path, **kwargs)
+
+    # 엔드포인트별 요청 수, 실패 수, 응답 시간 백분위(ms) 요약
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "count": s.count,
+                    "errors": s.errors,
+                    "p50": s.percentile(50),
+                    "p90": s.percentile(90),
+                    "p99": s.percentile(99),
+                    "histogram": dict(zip([*HISTOGRAM_BOUNDS_MS, "inf"], s.buckets)),
+                }
+                for name, s in self._stats.items()
+            }
+
+    def print_stats(self):
+        for name, s in self.stats().items():
+            if not s["count"]:
+                print(f"[{name}] 응답 없음 (실패 {s['errors']})")
+                continue
+            print(f"[{name}] {s['count']}건 (실패 {s['errors']}) | p50 {s['p50']}ms | p90 {s['p90']}ms | p99 {s['p99']}ms")
+
+# 다른 thread에서 본문을 읽고 있는 requests 응답의 연결을 바로 끊는 함수
+# close()만으로는 이미 recv에서 막혀 있는 thread가 풀리지 않으므로 소켓을 shutdown함
+def abort_response(response):
+    try:
+        response.raw._fp.fp.raw._sock.shutdown(socket.SHUT_RDWR)
+    except (AttributeError, OSError):
+        pass
+    response.close()
+
+# 비동기 요청의 응답 (aiohttp 응답과 requests 응답을 같은 방식으로 다룸)
+class AsyncResponse:
+    def __init__(self, raw, unregister=None):
+        self._raw = raw
+        self._unregister = unregister # 취소 토큰에 등록한 연결 끊기 콜백 해제
+        self._aio = aiohttp is not None and isinstance(raw, aiohttp.ClientResponse)
+        self.status_code = raw.status if self._aio else raw.status_code
+
+    async def read(self):
+        if self._aio:
+            return await self._raw.read()
+        return await asyncio.to_thread(lambda: self._raw.content)
+
+    async def text(self):
+        if self._aio:
+            return await self._raw.text()
+        return await asyncio.to_thread(lambda: self._raw.text)
+
+    async def json(self):
+        if self._aio:
+            return await self._raw.json(content_type=None)
+        return await asyncio.to_thread(self._raw.json)
+
+    # 본문을 받는 대로 조각씩 넘겨주는 함수
+    async def iter_chunks(self, size):
+        if self._aio:
+            async for chunk in self._raw.content.iter_chunked(size):
+                yield chunk
+            return
+        chunks = self._raw.iter_content(chunk_size=size)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def close(self):
+        if self._unregister:
+            self._unregister()
+        self._raw.close()
+
+# asyncio용 백엔드 클라이언트 (타임아웃/차단/통계는 동기 클라이언트와 공유)
+# aiohttp가 있으면 취소 즉시 연결이 끊기고, 없으면 requests 요청을 thread로 돌리고 취소 토큰으로 소켓을 끊음
+# (응답 헤더를 기다리는 중에는 AbortableConnectionMixin이, 본문을 읽는 중에는 abort_response가 끊음)
+class AsyncBackendClient:
+    def __init__(self, sync_client):
+        self.sync = sync_client
+        self._session = None # aiohttp 세션 (이벤트 루프 안에서 처음 요청할 때 생성)
+
+    async def request(self, method, endpoint, path, timeout=None, retries=None, **kwargs):
+        if aiohttp is None:
+            token = current_token()
+
+            def send():
+                raw = self.sync.request(method, endpoint, path, retries=retries, timeout=timeout, **kwargs)
+                if token.cancelled: # 기다리던 쪽이 이미 취소된 뒤 도착한 응답은 바로 닫음
+                    abort_response(raw)
+                return raw
+
+            raw = await asyncio.to_thread(send)
+            return AsyncResponse(raw, token.add_callback(lambda: abort_response(raw)))
+
+        stats = self.sync._endpoint(endpoint)
+        self.sync._check_breaker(endpoint, stats)
+        connect, read = timeout or TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        if retries is None:
+            retries = RETRIES.get(endpoint, DEFAULT_RETRIES)
+        if isinstance(kwargs.get("data"), (types.GeneratorType, types.AsyncGeneratorType)): # 스트리밍 본문은 다시 보낼 수 없음
+            retries = 0
+        idempotent = method in IDEMPOTENT_METHODS # 재시도 기준은 동기 클라이언트와 같음
+        kwargs.pop("stream", None) # aiohttp 응답은 항상 스트리밍
+        files = kwargs.pop("files", None)
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=8))
+
+        for attempt in range(retries + 1):
+            if files: # FormData는 한 번 보내면 다시 쓸 수 없으므로 시도마다 만듦
+                form = aiohttp.FormData()
+                for field, (filename, data, content_type) in files.items():
+                    form.add_field(field, data, filename=filename, content_type=content_type)
+                kwargs["data"] = form
+
+            start = time.time()
+            try:
+                raw = await self._session.request(
+                    method, self.sync.url(path),
+                    timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+                    **kwargs
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.sync._failed(stats)
+                # 연결조차 못 한 경우는 서버에 도착하지 않았으므로 POST도 다시 보냄
+                if attempt < retries and (idempotent or isinstance(e, aiohttp.ClientConnectorError)):
+                    await asyncio.sleep(BACKOFF * 2 ** attempt)
+                    continue
+                raise requests.ConnectionError(f"{endpoint} 요청 실패: {e}") from e
+
+            stats.record((time.time() - start) * 1000)
+            if raw.status >= 500:
+                self.sync._failed(stats)
+                if attempt < retries and idempotent:
+                    raw.release()
+                    await asyncio.sleep(BACKOFF * 2 ** attempt)
+                    continue
+            else:
+                stats.consecutive_failures = 0
+            return AsyncResponse(raw)
+
+    async def get(self, endpoint, path, **kwargs):
+        return await self.request("GET", endpoint, path, **kwargs)
+
+    async def post(self, endpoint, path, **kwargs):
+        return await self.request("POST", endpoint, path, **kwargs)
+
+client = BackendClient()
+async_client = AsyncBackendClient(client)
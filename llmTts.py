@@ -1,160 +1,232 @@
+import asyncio
 import os
-import subprocess
-import time
  
-import requests
-
 import global_state
-from config import BASE_URL, DUMMY_ID, DUMMY_PATH, LLM_VOICE_PATH, WAV_PATH
-from global_state import mic_lock
-from gpio_controller import GPIOController
-from util import load_speaker_device
-
-gpio = GPIOController(refresh_callback=lambda: None, skip_callback=lambda: None)
-
-# 웨이크워드 감지 시 현재 처리 중인 작업을 중단하는 함수
-def wakeword_interrupt(result, expect_text,params=None): # 
-    if params and params.get("responsetype") == "intent": 
-        return None
-    
-    # 전역 웨이크워드 감지 플래그가 True인 경우 (웨이크워드가 감지됨)
-    if global_state.wakeword_detection:
+from async_core import core, current_token, iterate_in_thread
+from audio_arbiter import PRIORITY_REMINDER, PRIORITY_USER, arbiter
+from audio_buffer import AudioBuffer
+from audio_encoder import FORMATS, encode_buffer_async, reject_format
+from audio_player import player
+from config import DEBUG_AUDIO, DUMMY_ID, DUMMY_PATH, LLM_VOICE_PATH
+from gpio_controller import gpio
+from http_client import async_client
+from RequestStt import record_audio, stream_recording, upload_wav
+from RequestTts import STREAM_CHUNK_SIZE
+from util import tee_chunks
+
+# 더 높은 우선순위 작업(웨이크워드 이후 대화)이 이미 진행 중이면 시작하지 않고 돌려줄 값
+def wakeword_interrupt(result, expect_text, priority=PRIORITY_REMINDER):
+    if arbiter.busy_above(priority):
         print("웨이크워드 감지로 중단")
         return result if expect_text else bool(result)
     return None
     
-# 공통 LLM 응답 처리 함수
-def send_audio_and_get_response(audio_path, url, params, expect_text=True, play_audio=True):
+_dummy_audio = None
+_combined_supported = None # 서버의 STT+의도 파악 통합 엔드포인트 지원 여부 (None: 아직 모름)
+
+# 복약시간 알림용 더미 음성을 한 번만 읽어두는 함수
+def load_dummy_audio():
+    global _dummy_audio
+    if _dummy_audio is None:
+        try:
+            _dummy_audio = AudioBuffer.from_file(DUMMY_PATH)
+        except Exception as e:
+            print(f"더미 음성 로드 실패: {e}")
+    return _dummy_audio
+
+# 스피커를 받아 LLM 음성을 받는 대로 재생하는 함수 (asyncio.to_thread로 실행되어 작업의 취소 토큰을 그대로 봄)
+# 재생 중에 취소되면 토큰 콜백이 재생기를 바로 멈춤 (스피커를 잡고 있는 동안만 등록)
+def play_llm_audio(chunks, priority):
+    token = current_token()
+    with arbiter.session("speaker", priority, name="llm", on_preempt=player.stop) as session, token.on_cancel(player.stop):
+        if session.preempted or token.cancelled:
+            return False
+        gpio.set_mode("llmtts")
+        if player.play_mp3(chunks): # 다운로드되는 대로 디코딩해서 재생
+            gpio.set_mode("default")
+            return True
+        if session.preempted or token.cancelled:
+            print("웨이크워드 감지로 재생 중단")
+        else:
+            print("재생 실패")
+            gpio.flash("error")
+        return False
+
+# 공통 LLM 응답 처리 코루틴 (audio: 메모리에 있는 AudioBuffer)
+# 웨이크워드가 감지되면 core.cancel_below로 취소되며, 요청/다운로드/재생 중 어디서든 바로 멈춤
+# gate가 있으면 음성을 재생하기 전에 그 결과를 기다리고, 결과가 비어 있으면 재생하지 않음
+async def send_audio_and_get_response_async(audio, url, params, expect_text=True, play_audio=True, priority=PRIORITY_REMINDER, gate=None):
+    return await core.cancellable(_send_audio(audio, url, params, expect_text, play_audio, priority, gate), priority)
+
+async def _send_audio(audio, url, params, expect_text, play_audio, priority, gate):
     result = {}
 
     #  함수 시작 시 웨이크워드 중단 여부 확인
-    interrupted = wakeword_interrupt(result, expect_text,params)
+    interrupted = wakeword_interrupt(result, expect_text, priority)
     if interrupted is not None:
         return interrupted
 
-    # 오디오 파일 유효성 검사
-    if not os.path.exists(audio_path) or os.path.getsize(audio_path) < 1000: 
-        print(f"오디오 파일이 존재하지 않거나 너무 작습니다: {audio_path}")
-        gpio.set_mode("error")
-        time.sleep(2)
-        gpio.set_mode("default")
+    # 오디오 유효성 검사
+    if audio is None or len(audio) < 1000: 
+        print("오디오가 없거나 너무 짧습니다.")
+        gpio.flash("error")
         return {} if expect_text else False
     
-    files = {"audio": open(audio_path, "rb")}
+    response = None
     try:
-        # LLM API에 오디오 파일 전송 (POST 요청)
-        response = requests.post(url, files=files, params=params)
-
-        # 응답 수신 중 웨이크워드 중단 여부 다시 확인
-        interrupted = wakeword_interrupt(result, expect_text,params)
-        if interrupted is not None:
-            return interrupted 
+        # LLM API에 오디오 파일 전송 (POST 요청, 서버가 포맷을 거절(415)하면 다음 포맷으로 다시 보냄)
+        for _ in FORMATS:
+            file, fmt = await encode_buffer_async(audio)
+            response = await async_client.post("llm", url, files={"audio": file}, params=params)
+            if response.status_code != 415 or fmt == "wav":
+                break
+            response.close()
+            reject_format(fmt)
 
         #  LLM 응답 처리
         if response.status_code == 200:
-            result = response.json()
-            text = result.get("message", "")
-            with open("requirements.txt", "w") as f:
-                f.write(text.strip() + "\n")
-
-            audio_url = result.get("file_url", "")
-
-            # 음성 응답 재생 (play_audio가 True이고 audio_url이 있을 경우)
-            if play_audio and audio_url:
-                audio_data = requests.get(audio_url) 
-
-                # 음성 다운로드 중 웨이크워드 중단 여부 다시 확인
-                interrupted = wakeword_interrupt(result, expect_text,params)
-                if interrupted is not None:
-                    return interrupted
-                
-                if audio_data.status_code == 200:
-                    with open(LLM_VOICE_PATH, "wb") as f:
-                        f.write(audio_data.content)
-
-                    wait_count = 0
-                    
-                    # 마이크가 잠겨있는 동안 대기 (마이크 사용 중인 경우 재생 방지)
-                    while mic_lock.locked() and wait_count < 10:
-                        time.sleep(0.5)
-                        wait_count += 1
-
-                    print(f"LLM : {text}")
-                    gpio.set_mode("llmtts")
-
-                    #  음성 재생 직전 웨이크워드 중단 여부 마지막 확인
-                    interrupted = wakeword_interrupt(result, expect_text,params)
-                    if interrupted is not None:
-                        return interrupted
-                    
-                    speaker_device = load_speaker_device() # 스피커 설정 
-                    proc = subprocess.run(
-                        ["mpg123", "-o", "alsa", "-a", speaker_device, LLM_VOICE_PATH],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE
-                    )
-                    if proc.returncode != 0:
-                        print(f"재생 실패: return code {proc.returncode}")
-                        print(f"stderr: {proc.stderr.decode()}")
-                        gpio.set_mode("error")
-                        time.sleep(2)
-                    else:
-                        gpio.set_mode("default")  
-                else:
-                    print(f"음성 다운로드 실패: {audio_data.status_code}")
-                    gpio.set_mode("error")
-                    time.sleep(2)
+            result = await response.json()
+            if gate is not None and not await gate: # 음성 인식 결과가 없으면 답변을 재생하지 않음
+                gpio.set_mode("default")
             else:
-                gpio.set_mode("default")  
+                await play_reply(result, play_audio, priority)
         else:
-            print(f"LLM 응답 실패: {response.status_code} - {response.text}")
-            gpio.set_mode("error")
-            time.sleep(2)
+            print(f"LLM 응답 실패: {response.status_code} - {await response.text()}")
+            gpio.flash("error")
 
+    except asyncio.CancelledError: # 웨이크워드 감지로 취소됨
+        print("웨이크워드 감지로 중단") # 연결 끊기와 재생 중단은 취소 토큰 콜백에서 이미 처리됨
     except Exception as e:
         print(f"LLM 요청 예외: {e}")
-        gpio.set_mode("error")
-        time.sleep(2)
+        gpio.flash("error")
     finally:
-        files["audio"].close()
+        if response is not None:
+            response.close()
 
     return result if expect_text else bool(result)
 
+# LLM 응답(message, file_url)의 음성을 받아 재생하는 함수 (예외는 호출한 쪽에서 처리)
+async def play_reply(result, play_audio=True, priority=PRIORITY_REMINDER):
+    text = result.get("message", "")
+    if DEBUG_AUDIO:
+        with open(os.path.splitext(LLM_VOICE_PATH)[0] + ".txt", "w") as f:
+            f.write(text.strip() + "\n")
+
+    audio_url = result.get("file_url", "")
+
+    # 음성 응답 재생 (play_audio가 True이고 audio_url이 있을 경우)
+    if not (play_audio and audio_url):
+        gpio.set_mode("default")
+        return
+
+    audio_data = await async_client.get("llm_audio", audio_url, stream=True) # 본문은 재생하면서 받음
+    try:
+        if audio_data.status_code == 200:
+            chunks = iterate_in_thread(audio_data.iter_chunks(STREAM_CHUNK_SIZE), asyncio.get_running_loop())
+            if DEBUG_AUDIO:
+                chunks = tee_chunks(chunks, LLM_VOICE_PATH)
+            print(f"LLM : {text}")
+            await asyncio.to_thread(play_llm_audio, chunks, priority)
+        else:
+            print(f"음성 다운로드 실패: {audio_data.status_code}")
+            gpio.flash("error")
+    finally:
+        audio_data.close()
+
+# 기존 thread 코드용 동기 함수
+def send_audio_and_get_response(audio, url, params, expect_text=True, play_audio=True, priority=PRIORITY_REMINDER):
+    return core.run(send_audio_and_get_response_async(audio, url, params, expect_text, play_audio, priority))
+
 # 일반 대화 또는 복약 체크
-def conversation_and_check(responsetype="", schedule_id=None, user_id=None):
+# play_audio=False면 답변 음성은 재생하지 않음 (여러 사용자의 알림을 한 번에 물어본 경우 한 명분만 재생)
+async def conversation_and_check_async(responsetype="", schedule_id=None, user_id=None, play_audio=True):
     gpio.set_mode("thinking")
-    url = f"{BASE_URL}/api/FEtest"
+    url = "/api/FEtest"
     real_schedule_id = schedule_id if responsetype == "check_medicine" else DUMMY_ID
 
-    result = send_audio_and_get_response(WAV_PATH, url, {
+    result = await send_audio_and_get_response_async(global_state.last_recording, url, {
         "userId": user_id,
         "scheduleId": real_schedule_id,
         "responsetype": responsetype
-    }, expect_text=True)
+    }, expect_text=True, play_audio=play_audio)
 
     if responsetype == "check_medicine":
         return result.get("success", None) # 복용 성공 여부 받아오기
 
     return result.get("message", "")
 
+def conversation_and_check(responsetype="", schedule_id=None, user_id=None):
+    return core.run(conversation_and_check_async(responsetype, schedule_id, user_id))
 
 # 복약 시간 알림 
-def post_taking_medicine(schedule_id, user_id):
+async def post_taking_medicine_async(schedule_id, user_id, play_audio=True):
     gpio.set_mode("thinking")
-    url = f"{BASE_URL}/api/FEtest"
-    return send_audio_and_get_response(DUMMY_PATH, url, {
+    url = "/api/FEtest"
+    return await send_audio_and_get_response_async(load_dummy_audio(), url, {
         "userId": user_id,
         "scheduleId": schedule_id,
         "responsetype": "taking_medicine_time"
-    }, expect_text=False)
+    }, expect_text=False, play_audio=play_audio)
+
+def post_taking_medicine(schedule_id, user_id):
+    return core.run(post_taking_medicine_async(schedule_id, user_id))
+
+def intent_params(user_id):
+    return {"userId": user_id, "scheduleId": DUMMY_ID, "responsetype": "intent"}
 
 # 사용자의 음성 명령 의도를 판단하는 함수
 def post_intent(user_id):
     gpio.set_mode("thinking")
-    url = f"{BASE_URL}/api/FEtest"
-    return send_audio_and_get_response(WAV_PATH, url, {
-        "userId": user_id,
-        "scheduleId": DUMMY_ID,
-        "responsetype": "intent"
-    }, expect_text=True)
+    url = "/api/FEtest"
+    return send_audio_and_get_response(global_state.last_recording, url, intent_params(user_id), expect_text=True, priority=PRIORITY_USER)
+
+# 통합 엔드포인트의 응답 음성을 재생하는 코루틴 (웨이크워드 대화이므로 취소 대상은 아니지만 같은 방식으로 실행)
+async def _play_combined_reply(result):
+    try:
+        await play_reply(result, priority=PRIORITY_USER)
+    except asyncio.CancelledError:
+        print("웨이크워드 감지로 중단")
+    except Exception as e:
+        print(f"LLM 응답 재생 예외: {e}")
+        gpio.flash("error")
+
+# 통합 엔드포인트가 없는 서버용: 메모리에 있는 같은 녹음으로 STT와 의도 파악을 동시에 요청
+# 의도 파악 응답이 먼저 와도 인식 결과가 있을 때만 재생함
+async def _stt_and_intent_parallel(user_id):
+    audio = global_state.last_recording
+    await encode_buffer_async(audio) # 두 요청이 같은 인코딩 결과를 쓰도록 먼저 한 번만 인코딩
+    stt = asyncio.ensure_future(asyncio.to_thread(upload_wav, audio))
+    reply = send_audio_and_get_response_async(audio, "/api/FEtest", intent_params(user_id), priority=PRIORITY_USER, gate=stt)
+    text, _ = await asyncio.gather(stt, reply)
+    return text
+
+# 웨이크워드 이후 사용자 음성을 녹음해서 인식 결과와 의도 파악 응답을 한 번의 업로드로 받는 함수
+# 녹음하면서 /api/stt/intent로 보내고, 서버가 지원하지 않으면 STT와 의도 파악 요청을 병렬로 보냄
+# 반환값: 인식된 텍스트 (없으면 "")
+def stt_and_intent(user_id, flush=True, on_armed=None, preroll=None):
+    global _combined_supported
+    if _combined_supported is not False:
+        recorded, response = stream_recording("stt_intent", "/api/stt/intent", intent_params(user_id), flush, on_armed, preroll)
+        if not recorded:
+            return ""
+        gpio.set_mode("thinking")
+        if response is not None and response.status_code == 200:
+            _combined_supported = True
+            result = response.json()
+            text = result.get("transcript", "").strip()
+            print(f"STT : {text}")
+            if text:
+                core.run(core.cancellable(_play_combined_reply(result), PRIORITY_USER))
+            return text
+        if response is not None and response.status_code in (404, 405, 501):
+            print("서버가 STT+의도 파악 통합 요청을 지원하지 않아 병렬 요청으로 전환합니다.")
+            _combined_supported = False
+        elif response is not None:
+            print(f"STT+의도 파악 응답 실패: {response.status_code}")
+    else:
+        if not record_audio(flush, on_armed, preroll):
+            return ""
+        gpio.set_mode("thinking")
+
+    return core.run(_stt_and_intent_parallel(user_id)) # 이미 녹음된 오디오로 다시 요청
     
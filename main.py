@@ -1,10 +1,10 @@
-import atexit
 import threading
 import time
  
-from gpio_controller import GPIOController
+from audio_encoder import negotiate_in_background
+from gpio_controller import gpio
 from MedicineSchedule import handle_command, run_scheduler
-from RequestTts import text_to_voice
+from RequestTts import PREWARM_PHRASES, prewarm_tts, text_to_voice
 from util import (
     auto_save_mic,
     auto_save_speaker,
@@ -14,8 +14,6 @@ from util import (
 )
 from WakeWord import wakeWord_forever
 
-gpio = GPIOController(refresh_callback=lambda: None, skip_callback=lambda: None)
-atexit.register(gpio.cleanup)
 
 if __name__ == "__main__":
     
@@ -27,6 +25,8 @@ if __name__ == "__main__":
         print("마이크를 찾을 수 없습니다.")
      
     wait_for_network()
+    negotiate_in_background() # 업로드 포맷은 첫 녹음 전에 백그라운드에서 정함
+    prewarm_tts(PREWARM_PHRASES, pin=True) # "네?" 등 고정 문구는 미리 받아 바로 재생
     
     # initialize_settings()   
     
@@ -46,17 +46,13 @@ if __name__ == "__main__":
                     gpio.set_mode("default")  
                 except Exception as e:
                     print(f"명령 처리 중 오류 발생: {e}")
-                    gpio.set_mode("error") 
-                    time.sleep(2)
-                    gpio.set_mode("default") 
+                    gpio.flash("error")
             else:
                 gpio.set_mode("default") 
 
         except Exception as e:
             print(f"웨이크워드 감지 오류: {e}")
-            gpio.set_mode("error")
-            time.sleep(2)
-            gpio.set_mode("default")  
+            gpio.flash("error")
 
         time.sleep(0.5)
 
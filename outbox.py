@@ -0,0 +1,220 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+import requests
+
+from gpio_controller import gpio
+from http_client import client
+from schedule_store import STORE_PATH
+
+COMMIT_WINDOW = 0.05 # 이 시간 안에 들어온 기록은 한 번의 fsync로 함께 저장 (초)
+BATCH_SIZE = 20 # 서버에 한 번에 보내는 최대 기록 수
+RETRY_DELAY = 1 # 전송 실패 후 첫 재시도 대기 시간 (초)
+MAX_RETRY_DELAY = 60
+RETRYABLE_STATUS = (408, 429) # 4xx지만 나중에 다시 보내면 성공할 수 있는 응답 (5xx도 재시도)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+def _retryable(status):
+    return status >= 500 or status in RETRYABLE_STATUS
+
+# 서버에 꼭 전달되어야 하는 기록(복약 확인 등)을 디스크에 먼저 남기고 백그라운드에서 보내는 큐
+# put()은 기록이 디스크에 저장되면 바로 반환하고 (여러 기록을 모아 fsync 한 번), 전송은 묶음 단위로 재시도함
+# 기록마다 멱등 키를 붙여 보내므로 응답을 못 받고 다시 보내도 서버에는 한 번만 반영됨
+class Outbox:
+    def __init__(self, path, batch_path, db_path=STORE_PATH):
+        self.path = path # 기록 하나씩 보내는 PUT 경로
+        self.batch_path = batch_path # 여러 기록을 한 번에 보내는 POST 경로 (없는 서버면 하나씩 보냄)
+        self._batch_supported = None
+        self._lock = threading.Lock() # DB 연결 보호
+        self._cond = threading.Condition()
+        self._journal = [] # 아직 디스크에 쓰지 않은 (키, 기록, 시각)
+        self._written = 0 # 디스크에 쓴 put() 수
+        self._queued = 0 # put() 호출 수
+        self._writer = None
+        self._sender = None
+        self.sent = 0
+        self.rejected = 0
+        self.last_flush_ms = None # 마지막으로 보낸 기록의 저장 -> 서버 반영까지 걸린 시간
+        self.db_path = db_path
+        self._open_lock = threading.Lock()
+        self._conn = None # 처음 쓸 때 엶 (import만 해서는 파일을 만들지 않음)
+
+    @property
+    def _db(self):
+        if self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    self._conn = self._open()
+        return self._conn
+
+    def _open(self):
+        try:
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+        except sqlite3.Error as e:
+            print(f"전송 대기 기록 저장소를 열 수 없어 메모리에만 보관합니다: {e}")
+            db = sqlite3.connect(":memory:", check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=FULL") # commit마다 fsync
+        db.executescript(SCHEMA)
+        return db
+
+    # 기록을 디스크에 저장하고 멱등 키를 돌려주는 함수 (저장될 때까지만 기다림, 전송은 기다리지 않음)
+    def put(self, payload):
+        key = uuid.uuid4().hex
+        with self._cond:
+            self._journal.append((key, json.dumps(payload, ensure_ascii=False), time.time()))
+            self._queued += 1
+            ticket = self._queued
+            self._cond.notify_all()
+        self._ensure_workers()
+        with self._cond:
+            self._cond.wait_for(lambda: self._written >= ticket)
+        return key
+
+    def _ensure_workers(self):
+        with self._cond:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._send_loop, daemon=True)
+                self._sender.start()
+
+    # 잠깐 모은 기록을 한 트랜잭션으로 저장 (fsync 횟수를 줄임)
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._journal)
+            time.sleep(COMMIT_WINDOW)
+            with self._cond:
+                batch, self._journal = self._journal, []
+                written = self._written + len(batch)
+            while True:
+                try:
+                    with self._lock, self._db:
+                        self._db.executemany("INSERT INTO outbox (idempotency_key, payload, created_at) VALUES (?, ?, ?)", batch)
+                    break
+                except sqlite3.Error as e: # 디스크 오류 등 (저장될 때까지 put()이 기다림)
+                    print(f"전송 대기 기록 저장 실패, 다시 시도: {e}")
+                    time.sleep(RETRY_DELAY)
+            with self._cond:
+                self._written = written
+                self._cond.notify_all()
+
+    def _oldest(self, limit):
+        with self._lock:
+            return self._db.execute(
+                "SELECT seq, idempotency_key, payload, created_at FROM outbox ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+
+    def _delete(self, seqs):
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM outbox WHERE seq = ?", [(seq,) for seq in seqs])
+
+    # 묶음 전송 (서버가 지원하지 않거나, 묶음이 거절되어 하나씩 보내야 하면 None)
+    def _send_batch(self, rows):
+        response = client.post(
+            "histories", self.batch_path, retries=0,
+            json={"records": [{"idempotency_key": key, **json.loads(payload)} for _, key, payload, _ in rows]}
+        )
+        if response.status_code in (404, 405, 501):
+            print("서버가 묶음 전송을 지원하지 않아 하나씩 보냅니다.")
+            self._batch_supported = False
+            return None
+        if _retryable(response.status_code):
+            raise requests.HTTPError(f"서버 오류 {response.status_code}")
+        self._batch_supported = True
+        if response.status_code != 200: # 어느 기록이 문제인지 모르므로 이번 묶음만 하나씩 보내서 나머지 기록은 살림
+            print(f"묶음 전송 거절, 하나씩 다시 보냅니다: {response.status_code} - {response.text}")
+            return None
+        return [row[0] for row in rows]
+
+    # 하나씩 전송 (서버 오류가 나면 그때까지 보낸 것만 돌려주고, 하나도 못 보냈으면 예외)
+    def _send_each(self, rows):
+        done = []
+        for seq, key, payload, _ in rows:
+            response = client.put("histories", self.path, retries=0, json=json.loads(payload), headers={"Idempotency-Key": key})
+            if _retryable(response.status_code):
+                if done:
+                    return done
+                raise requests.HTTPError(f"서버 오류 {response.status_code}")
+            if response.status_code != 200:
+                print(f"기록 전송 거절: {response.status_code} - {response.text}")
+                self.rejected += 1
+            done.append(seq)
+        return done
+
+    # 어떤 오류가 나도 thread는 멈추지 않고 기다렸다가 다시 시도
+    def _send_loop(self):
+        delay = RETRY_DELAY
+        while True:
+            try:
+                rows = self._oldest(BATCH_SIZE)
+                if not rows:
+                    with self._cond:
+                        self._cond.wait(MAX_RETRY_DELAY) # 새 기록이 저장되면 깨어남
+                    continue
+
+                done = None
+                if self._batch_supported is not False:
+                    done = self._send_batch(rows)
+                if done is None:
+                    done = self._send_each(rows)
+                self._delete(done)
+            except requests.RequestException as e:
+                print(f"기록 전송 실패, {delay}초 후 재시도 (대기 {self.depth()}건): {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+            except Exception as e: # 응답 형식이나 저장소 오류 등
+                print(f"기록 전송 중 오류, {delay}초 후 재시도: {e}")
+                gpio.flash("error")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+
+            self.sent += len(done)
+            self.last_flush_ms = (time.time() - rows[len(done) - 1][3]) * 1000
+            delay = RETRY_DELAY
+
+    # 아직 서버에 반영되지 않은 기록 수 (디스크에 쓰는 중인 것 포함)
+    def depth(self):
+        with self._cond:
+            pending = len(self._journal)
+        with self._lock:
+            return pending + self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    # 시작할 때 이전 실행에서 못 보낸 기록이 있으면 전송 시작
+    def resume(self):
+        if self.depth():
+            print(f"이전에 보내지 못한 기록 {self.depth()}건 전송 시작")
+            self._ensure_workers()
+
+    def stats(self):
+        oldest = self._oldest(1)
+        return {
+            "depth": self.depth(),
+            "sent": self.sent,
+            "rejected": self.rejected,
+            "last_flush_ms": self.last_flush_ms,
+            "oldest_age_s": time.time() - oldest[0][3] if oldest else 0,
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        last = f"{s['last_flush_ms']:.0f}ms" if s["last_flush_ms"] is not None else "-"
+        print(f"[outbox] 대기 {s['depth']}건 (가장 오래된 것 {s['oldest_age_s']:.0f}초) | 전송 {s['sent']}건 | "
+              f"거절 {s['rejected']}건 | 마지막 반영까지 {last}")
+
+confirmations = Outbox("/api/user/histories", "/api/user/histories/batch")
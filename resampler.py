@@ -0,0 +1,148 @@
+from math import gcd
+
+import numpy as np
+
+# 프레임 사이에 필터 상태를 유지하는 polyphase FIR 리샘플러 (예: 44100Hz -> 16000Hz)
+class StreamResampler:
+    def __init__(self, in_rate, out_rate, max_frame=4096, taps_per_phase=None):
+        g = gcd(in_rate, out_rate)
+        self.up = out_rate // g
+        self.down = in_rate // g
+        self.max_frame = max_frame
+
+        # resample_poly와 같은 kaiser 창 저역통과 필터를 한 번만 계산
+        half_len = 10 * max(self.up, self.down)
+        if taps_per_phase is not None:
+            half_len = (taps_per_phase * self.up) // 2
+        n_taps = 2 * half_len + 1
+        cutoff = 0.5 / max(self.up, self.down)
+        n = np.arange(n_taps) - half_len
+        h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(n_taps, 5.0) * self.up
+
+        # 위상별 계수로 분해하고 입력 창과 바로 곱할 수 있도록 뒤집어 둠
+        self.taps = -(-n_taps // self.up)
+        padded = np.zeros(self.taps * self.up, dtype=np.float32)
+        padded[:n_taps] = h
+        coef = padded.reshape(self.taps, self.up).T[:, ::-1]
+
+        # 출력 위치에 따른 위상/입력 창 위치를 한 주기(up개)만큼 미리 계산
+        max_out = -(-max_frame * self.up // self.down) + 1
+        positions = np.arange(self.up + max_out)
+        self._coef_table = np.ascontiguousarray(coef[(positions * self.down) % self.up])
+        base = (positions * self.down) // self.up
+        self._index_table = base[:, None].astype(np.intp) + np.arange(self.taps, dtype=np.intp)
+
+        # 매 프레임 재사용할 버퍼 미리 할당
+        self._buf = np.zeros(self.taps - 1 + max_frame, dtype=np.float32)
+        self._windows = np.empty((max_out, self.taps), dtype=np.float32)
+        self._index = np.empty((max_out, self.taps), dtype=np.intp)
+        self._acc = np.empty(max_out, dtype=np.float32)
+        self._out = np.empty(max_out, dtype=np.int16)
+        self._consumed = 0 # 지금까지 받은 입력 샘플 수
+        self._next_out = 0 # 다음에 만들 출력 샘플 번호
+
+    # int16 입력 한 프레임을 리샘플링하고, 미리 할당된 int16 버퍼의 view를 돌려주는 함수
+    def process(self, pcm):
+        length = len(pcm)
+        if length > self.max_frame:
+            raise ValueError(f"프레임이 너무 깁니다: {length} > {self.max_frame}")
+
+        history = self.taps - 1
+        self._buf[history:history + length] = pcm
+
+        # 이번 프레임까지의 입력으로 계산 가능한 출력 개수
+        last_input = self._consumed + length - 1
+        last_out = ((last_input + 1) * self.up - 1) // self.down
+        count = last_out - self._next_out + 1
+
+        if count > 0:
+            cycle, phase = divmod(self._next_out, self.up)
+            index = self._index[:count]
+            np.add(self._index_table[phase:phase + count], cycle * self.down - self._consumed, out=index) # 출력마다 필요한 입력 창의 위치
+            np.take(self._buf, index, out=self._windows[:count], mode="clip") # clip 모드는 내부 복사 없이 바로 기록
+
+            acc = self._acc[:count]
+            np.einsum("ij,ij->i", self._windows[:count], self._coef_table[phase:phase + count], out=acc)
+            np.clip(acc, -32768, 32767, out=acc)
+            np.rint(acc, out=acc)
+            self._out[:count] = acc
+            self._next_out += count
+        else:
+            count = 0
+
+        # 다음 프레임을 위해 마지막 입력을 필터 상태로 남김
+        self._buf[:history] = self._buf[length:length + history]
+        self._consumed += length
+        return self._out[:count]
+
+    def reset(self):
+        self._buf[:] = 0
+        self._consumed = 0
+        self._next_out = 0
+
+
+# 리샘플 결과를 모아 고정 길이 프레임으로 잘라주는 버퍼 (porcupine frame_length 용)
+class FrameAssembler:
+    def __init__(self, frame_length, max_pending=4096):
+        self.frame_length = frame_length
+        self._pending = np.zeros(frame_length + max_pending, dtype=np.int16)
+        self._size = 0
+
+    # 샘플을 추가하고 완성된 프레임이 있으면 순서대로 돌려주는 함수
+    def push(self, samples):
+        n = len(samples)
+        self._pending[self._size:self._size + n] = samples
+        self._size += n
+        start = 0
+        while self._size - start >= self.frame_length:
+            yield self._pending[start:start + self.frame_length]
+            start += self.frame_length
+        if start:
+            remain = self._size - start
+            self._pending[:remain] = self._pending[start:self._size]
+            self._size = remain
+
+    # 아직 프레임이 되지 못한 남은 샘플 (다음 push 전까지만 유효한 view)
+    def pending(self):
+        return self._pending[:self._size]
+
+    def reset(self):
+        self._size = 0
+
+# 최근 오디오를 고정 크기로 계속 덮어쓰며 보관하는 링 버퍼 (메모리는 처음에 한 번만 할당)
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.int16)
+        self._pos = 0 # 다음에 쓸 위치
+        self._filled = 0
+
+    def write(self, samples):
+        n = len(samples)
+        if n >= self.capacity: # 용량보다 길면 마지막 부분만 보관
+            self._data[:] = samples[n - self.capacity:]
+            self._pos = 0
+            self._filled = self.capacity
+            return
+        first = min(n, self.capacity - self._pos)
+        self._data[self._pos:self._pos + first] = samples[:first]
+        self._data[:n - first] = samples[first:]
+        self._pos = (self._pos + n) % self.capacity
+        self._filled = min(self._filled + n, self.capacity)
+
+    def __len__(self):
+        return self._filled
+
+    # 가장 최근 샘플 n개를 복사 없이 오래된 순서의 view 목록으로 돌려주는 함수 (다음 write 전까지만 유효)
+    def latest(self, n):
+        n = min(n, self._filled)
+        if n == 0:
+            return []
+        start = self._pos - n
+        if start >= 0:
+            return [self._data[start:self._pos]]
+        return [self._data[start:], self._data[:self._pos]]
+
+    def reset(self):
+        self._pos = 0
+        self._filled = 0
@@ -0,0 +1,249 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from gpio_controller import gpio
+from http_client import client
+
+STORE_PATH = "/home/pi/my_project/schedule.db"
+SYNC_INTERVAL = 600 # 서버와 스케줄을 맞추는 간격 (초, 바뀐 게 없으면 304로 끝남)
+NO_CHANGES = ((), ()) # 바뀐 게 없을 때 동기화 결과 (바뀐 기록, 지워진 기록)
+_batch_sync_supported = None # 서버의 묶음 동기화 (/api/user/histories/sync) 지원 여부 (None: 아직 모름)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    user_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    scheduled_time TEXT NOT NULL,
+    day TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (user_id, id, scheduled_time)
+);
+CREATE INDEX IF NOT EXISTS schedules_by_day ON schedules (user_id, day, scheduled_time);
+CREATE TABLE IF NOT EXISTS alerts (
+    key TEXT PRIMARY KEY,
+    day TEXT NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id INTEGER PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    cursor TEXT,
+    synced_at REAL
+);
+"""
+
+# 서버의 복약 기록을 날짜별로 보관하는 로컬 SQLite 저장소
+# 알람은 항상 여기서 읽으므로 서버에 연결되지 않아도 마지막으로 받은 스케줄대로 동작함
+# 진행 중인 알람의 상태도 스텝이 바뀔 때마다 한 행씩 저장해서, 재시작하면 이어서 진행함
+class ScheduleStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._conn = None # 처음 쓸 때 엶 (import만 해서는 파일을 만들지 않음)
+
+    @property
+    def _db(self):
+        if self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    self._conn = self._open()
+        return self._conn
+
+    def _open(self):
+        try:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+        except sqlite3.Error as e:
+            print(f"스케줄 저장소를 열 수 없어 메모리에만 보관합니다: {e}")
+            db = sqlite3.connect(":memory:", check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL") # 전원이 꺼지면 마지막 몇 건은 빠질 수 있지만 쓰기마다 fsync하지 않음
+        db.executescript(SCHEMA)
+        return db
+
+    # 특정 날짜의 기록을 시간순으로 돌려주는 함수 (서버 응답과 같은 dict 형태)
+    def records_for(self, user_id, day):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT record FROM schedules WHERE user_id = ? AND day = ? ORDER BY scheduled_time",
+                (user_id, day.isoformat())
+            ).fetchall()
+        return [json.loads(row["record"]) for row in rows]
+
+    def sync_state(self, user_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM sync_state WHERE user_id = ?", (user_id,)).fetchone()
+        return dict(row) if row else {"etag": None, "last_modified": None, "cursor": None, "synced_at": None}
+
+    # 서버에서 받은 기록을 반영하는 함수 (full=True면 받은 목록이 전체이므로 없는 기록은 지움)
+    # 반환값: (새로 생기거나 바뀐 기록 목록, 지워진 (id, scheduled_time) 목록) - 진행 중인 알람에 반영할 때 사용
+    # 날짜 파싱은 새로 받은 기록에만 한 번씩
+    def apply(self, user_id, records, full, etag=None, last_modified=None, cursor=None):
+        rows = []
+        deleted = set()
+        for r in records:
+            try:
+                sched_dt = datetime.fromisoformat(r["scheduled_time"])
+            except (KeyError, TypeError, ValueError) as parse_err:
+                print(f"파싱 실패: {r.get('scheduled_time')} {parse_err}")
+                continue
+            key = (r["id"], r["scheduled_time"])
+            if r.get("deleted"):
+                deleted.add(key)
+            else:
+                rows.append((user_id, *key, sched_dt.date().isoformat(), json.dumps(r, ensure_ascii=False)))
+
+        with self._lock, self._db:
+            existing = {
+                (row["id"], row["scheduled_time"]): row["record"]
+                for row in self._db.execute("SELECT id, scheduled_time, record FROM schedules WHERE user_id = ?", (user_id,))
+            }
+            if full: # 서버 목록에서 사라진 기록 삭제
+                received = {row[1:3] for row in rows}
+                deleted |= {key for key in existing if key not in received}
+            deleted = [key for key in deleted if key in existing]
+            changed = [row for row in rows if existing.get(row[1:3]) != row[4]]
+            self._db.executemany(
+                "DELETE FROM schedules WHERE user_id = ? AND id = ? AND scheduled_time = ?",
+                [(user_id, *key) for key in deleted]
+            )
+            self._db.executemany("INSERT OR REPLACE INTO schedules (user_id, id, scheduled_time, day, record) VALUES (?, ?, ?, ?, ?)", changed)
+            self._db.execute(
+                "INSERT OR REPLACE INTO sync_state (user_id, etag, last_modified, cursor, synced_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, etag, last_modified, cursor, time.time())
+            )
+        return [json.loads(row[4]) for row in changed], deleted
+
+    # 알람 상태 스냅샷 저장/삭제 (state는 JSON으로 바꿀 수 있는 dict)
+    def save_alert(self, key, day, state):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO alerts (key, day, state) VALUES (?, ?, ?)",
+                (key, day.isoformat(), json.dumps(state, ensure_ascii=False, separators=(",", ":")))
+            )
+
+    def delete_alert(self, key):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM alerts WHERE key = ?", (key,))
+
+    # 해당 날짜의 알람 상태를 모두 읽고, 그 전 날짜의 알람은 지우는 함수
+    def load_alerts(self, day):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM alerts WHERE day < ?", (day.isoformat(),))
+            rows = self._db.execute("SELECT state FROM alerts WHERE day = ?", (day.isoformat(),)).fetchall()
+        return [json.loads(row["state"]) for row in rows]
+
+    # 사용자 목록 (id -> 이름) 저장/읽기 (서버에 연결되지 않아도 이름으로 안내하기 위해)
+    def save_users(self, names):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM users")
+            self._db.executemany("INSERT INTO users (id, name) VALUES (?, ?)", names.items())
+
+    def load_users(self):
+        with self._lock:
+            return {row["id"]: row["name"] for row in self._db.execute("SELECT id, name FROM users")}
+
+    def touch(self, user_id):
+        with self._lock, self._db:
+            self._db.execute("UPDATE sync_state SET synced_at = ? WHERE user_id = ?", (time.time(), user_id))
+
+store = ScheduleStore()
+
+# 서버의 복약 기록을 로컬 저장소에 맞추는 함수
+# 지난번 ETag/Last-Modified가 같으면 서버가 304만 보내고, 서버가 cursor를 주면 다음부터 그 이후 변경분만 받음
+# 반환값: store.apply와 같은 (바뀐 기록, 지워진 기록) (실패하면 None - 알람은 저장소에 남은 스케줄로 계속 동작)
+def sync_schedules(user_id):
+    url = "/api/user/histories"
+    state = store.sync_state(user_id)
+    params = {"user_id": user_id}
+    headers = {}
+    if state["etag"]:
+        headers["If-None-Match"] = state["etag"]
+    if state["last_modified"]:
+        headers["If-Modified-Since"] = state["last_modified"]
+    if state["cursor"]:
+        params["since"] = state["cursor"]
+
+    try:
+        response = client.get("histories", url, params=params, headers=headers)
+    except requests.RequestException as e:
+        print(f"스케줄 동기화 실패, 저장된 스케줄 사용: {e}")
+        gpio.flash("error")
+        return None
+
+    if response.status_code == 304:
+        store.touch(user_id)
+        return NO_CHANGES
+    if response.status_code != 200:
+        print(f"GET 서버 응답 오류: {response.status_code} - {response.text}")
+        gpio.flash("error")
+        return None
+
+    return _apply_sync(user_id, state, response.json(), response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+# 서버 응답(기록 목록)을 저장소에 반영하고 (바뀐 기록, 지워진 기록)을 돌려주는 함수
+def _apply_sync(user_id, state, data, etag, last_modified=None):
+    cursor = data.get("cursor")
+    changes = store.apply(
+        user_id,
+        data.get("medication record", []),
+        full=not (state["cursor"] and cursor), # since를 보냈고 서버가 cursor로 답한 경우만 변경분
+        etag=etag,
+        last_modified=last_modified,
+        cursor=cursor
+    )
+    updated, deleted = changes
+    if updated or deleted:
+        print(f"스케줄 동기화 (사용자 {user_id}): {len(updated)}건 변경, {len(deleted)}건 삭제")
+    return changes
+
+# 여러 사용자의 스케줄을 요청 한 번으로 맞추는 함수 (사용자별 ETag/cursor를 함께 보내고, 바뀐 사용자만 기록을 받음)
+# 서버가 묶음 동기화를 지원하지 않으면 사용자마다 sync_schedules로 요청
+# 반환값: {사용자 id: (바뀐 기록, 지워진 기록) 또는 None}
+def sync_all(user_ids):
+    global _batch_sync_supported
+    if len(user_ids) == 1 or _batch_sync_supported is False:
+        return {user_id: sync_schedules(user_id) for user_id in user_ids}
+
+    states = {user_id: store.sync_state(user_id) for user_id in user_ids}
+    try:
+        response = client.post("histories", "/api/user/histories/sync", json={"users": [
+            {"user_id": user_id, "etag": state["etag"], "since": state["cursor"]} for user_id, state in states.items()
+        ]})
+    except requests.RequestException as e:
+        print(f"스케줄 동기화 실패, 저장된 스케줄 사용: {e}")
+        gpio.flash("error")
+        return dict.fromkeys(user_ids)
+
+    if response.status_code in (404, 405, 501):
+        print("서버가 묶음 동기화를 지원하지 않아 사용자별로 요청합니다.")
+        _batch_sync_supported = False
+        return {user_id: sync_schedules(user_id) for user_id in user_ids}
+    if response.status_code != 200:
+        print(f"POST 서버 응답 오류: {response.status_code} - {response.text}")
+        gpio.flash("error")
+        return dict.fromkeys(user_ids)
+    _batch_sync_supported = True
+
+    results = dict.fromkeys(user_ids)
+    for data in response.json().get("users", []):
+        user_id = data.get("user_id")
+        if user_id not in states:
+            continue
+        if data.get("status") == 304:
+            store.touch(user_id)
+            results[user_id] = NO_CHANGES
+        else:
+            results[user_id] = _apply_sync(user_id, states[user_id], data, data.get("etag"))
+    return results
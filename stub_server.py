@@ -0,0 +1,257 @@
+import json
+import select
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STUB_TRANSCRIPT = "오늘 약 먹었어"
+STUB_TTS_AUDIO = b"\xff\xfb" + b"\0" * 8190 # mp3처럼 보이는 더미 데이터
+STUB_LLM_REPLY = "네, 확인했어요."
+UPLOAD_TYPES = {"audio/ogg": "opus", "audio/flac": "flac", "audio/wav": "wav", "audio/L16": "wav"}
+REPLY_CHUNKS = 50 # 답변 음성을 나눠 보내는 횟수
+
+# 로컬 테스트용 백엔드 대체 서버
+# 실제 서버 없이 RequestStt 등의 요청 흐름을 확인할 때 사용
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # Content-Length 또는 chunked 방식의 요청 본문을 읽는 함수
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+                self.server.chunks_received += 1
+            return bytes(body)
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def send_body(self, status, body, content_type="text/plain; charset=utf-8"):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, data):
+        self.send_body(status, json.dumps(data, ensure_ascii=False), "application/json")
+
+    # 업로드된 오디오의 포맷 (chunked 스트림은 Content-Type 헤더, multipart는 파일 부분의 Content-Type)
+    def upload_format(self, body):
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/"):
+            for mime, fmt in UPLOAD_TYPES.items():
+                if f"Content-Type: {mime}".encode() in body:
+                    return fmt
+            return None
+        return UPLOAD_TYPES.get(content_type.split(";")[0].strip())
+
+    # LLM 처리 시간 흉내 (기다리는 동안 클라이언트가 연결을 끊으면 aborted_requests를 세고 True)
+    def think(self):
+        end = time.time() + self.server.llm_delay
+        while time.time() < end:
+            readable, _, _ = select.select([self.connection], [], [], max(min(end - time.time(), 0.01), 0))
+            if readable and not self.connection.recv(1, socket.MSG_PEEK):
+                self.server.aborted_requests += 1
+                self.close_connection = True
+                return True
+        return False
+
+    def llm_reply(self):
+        return {"message": STUB_LLM_REPLY, "file_url": f"{self.server.url}/audio/reply.mp3", "success": True}
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = self.read_body()
+        self.server.requests.append(("POST", url.path, params, len(body)))
+
+        fmt = self.upload_format(body)
+        self.server.uploads.append((url.path, fmt, len(body)))
+        if url.path.startswith("/api/stt") or url.path == "/api/FEtest":
+            if fmt not in self.server.formats:
+                self.send_body(415, f"unsupported audio format: {fmt}")
+                return
+
+        if url.path == "/api/stt/stream" and self.server.streaming:
+            self.send_body(200, STUB_TRANSCRIPT)
+        elif url.path == "/api/stt":
+            self.send_body(200, STUB_TRANSCRIPT)
+        elif url.path == "/api/stt/intent" and self.server.combined:
+            if self.think():
+                return
+            self.send_json(200, {"transcript": STUB_TRANSCRIPT, **self.llm_reply()})
+        elif url.path == "/api/tts":
+            self.send_body(200, self.server.tts_audio, "audio/mpeg")
+        elif url.path == "/api/wake":
+            self.send_json(200, {"status": "ok"})
+        elif url.path == "/api/user/histories/batch" and self.server.batch:
+            if self.confirmation_failed():
+                return
+            records = json.loads(body)["records"]
+            if any(record.get("schedule_id") in self.server.invalid_schedules for record in records):
+                self.send_body(422, "invalid schedule") # 묶음 중 하나라도 잘못되면 전체 거절
+                return
+            for record in records:
+                self.server.confirmed.setdefault(record.pop("idempotency_key"), record)
+            self.send_json(200, {"status": "ok"})
+        elif url.path == "/api/user/histories/sync" and self.server.batch_sync:
+            users = []
+            for user in json.loads(body)["users"]: # 사용자별 ETag가 같으면 304만
+                etag, data = self.user_histories(user["user_id"], user.get("since"))
+                if user.get("etag") == etag:
+                    users.append({"user_id": user["user_id"], "status": 304})
+                else:
+                    users.append({"user_id": user["user_id"], "status": 200, "etag": etag, **data})
+            self.send_json(200, {"users": users})
+        elif url.path == "/api/FEtest":
+            if self.think():
+                return
+            self.send_json(200, self.llm_reply())
+        else:
+            self.send_body(404, "not found")
+
+    # 복약 기록 (같은 Idempotency-Key로 다시 오면 처음 것만 반영)
+    def do_PUT(self):
+        url = urlparse(self.path)
+        body = self.read_body()
+        self.server.requests.append(("PUT", url.path, {}, len(body)))
+        if url.path != "/api/user/histories":
+            self.send_body(404, "not found")
+            return
+        if self.confirmation_failed():
+            return
+        record = json.loads(body)
+        if record.get("schedule_id") in self.server.invalid_schedules:
+            self.send_body(422, "invalid schedule")
+            return
+        self.server.confirmed.setdefault(self.headers.get("Idempotency-Key"), record)
+        self.send_json(200, {"status": "ok"})
+
+    # fail_confirmations가 남아 있으면 fail_status(기본 503)로 응답 (재전송 확인용)
+    def confirmation_failed(self):
+        if self.server.fail_confirmations > 0:
+            self.server.fail_confirmations -= 1
+            self.send_body(self.server.fail_status, "unavailable")
+            return True
+        return False
+
+    # 한 사용자의 복약 기록 (ETag, since 이후에 추가/변경된 기록 목록을 담은 응답 본문)
+    # server.histories는 추가/변경 순서대로 쌓인 기록 목록이고 cursor는 그 목록에서의 위치
+    # user_id가 없는 기록은 모든 사용자의 기록으로 취급
+    def user_histories(self, user_id, since):
+        records = self.server.histories
+        etag = f'"{sum(1 for r in records if r.get("user_id", user_id) == user_id)}"'
+        since = int(since or 0) if self.server.delta_sync else 0
+        latest = {}
+        for r in records[since:]: # 같은 기록이 여러 번 바뀌었으면 마지막 것만
+            if r.get("user_id", user_id) == user_id:
+                latest[(r["id"], r["scheduled_time"])] = r
+        body = {"medication record": list(latest.values())}
+        if self.server.delta_sync:
+            body["cursor"] = str(len(records))
+        return etag, body
+
+    # 복약 기록 목록 (ETag가 같으면 304, since를 주면 그 이후에 추가/변경된 기록만)
+    def send_histories(self, query):
+        user_id = int(query["user_id"][0]) if "user_id" in query else None
+        etag, body = self.user_histories(user_id, query.get("since", [None])[0])
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # 답변 음성을 reply_seconds 동안 나눠서 보냄 (재생하면서 받는 경우와 중간에 끊는 경우 확인용)
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.requests.append(("GET", url.path, {}, 0))
+        if url.path == "/api/audio/formats" and self.server.advertise_formats:
+            self.send_json(200, {"formats": self.server.formats})
+            return
+        if url.path == "/api/user/histories":
+            self.send_histories(parse_qs(url.query))
+            return
+        if url.path == "/api/users":
+            self.send_json(200, {"users_list": [{"id": k, "name": v} for k, v in self.server.users.items()]})
+            return
+        if url.path != "/audio/reply.mp3":
+            self.send_body(404, "not found")
+            return
+        if self.server.fail_downloads > 0:
+            self.server.fail_downloads -= 1
+            self.send_body(503, "unavailable")
+            return
+
+        audio = self.server.reply_audio
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(audio)))
+        self.end_headers()
+        step = max(len(audio) // REPLY_CHUNKS, 1)
+        try:
+            for start in range(0, len(audio), step):
+                self.wfile.write(audio[start:start + step])
+                self.wfile.flush()
+                time.sleep(self.server.reply_seconds / REPLY_CHUNKS)
+        except (BrokenPipeError, ConnectionResetError): # 클라이언트가 중간에 끊은 경우
+            self.server.aborted_downloads += 1
+
+# 별도 thread에서 stub 서버를 띄우고 서버 객체를 돌려주는 함수 (port=0이면 빈 포트 자동 선택)
+def start_stub_server(port=0, streaming=True, combined=True, verbose=False):
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.streaming = streaming # False면 /api/stt/stream 미지원 서버처럼 동작
+    server.combined = combined # False면 /api/stt/intent 미지원 서버처럼 동작 (STT와 의도 파악을 따로 요청)
+    server.verbose = verbose
+    server.formats = ["opus", "flac", "wav"] # 받을 수 있는 업로드 포맷 (나머지는 415)
+    server.advertise_formats = True # False면 /api/audio/formats가 없는 예전 서버처럼 동작
+    server.uploads = [] # (경로, 업로드 포맷, 본문 크기)
+    server.histories = [] # /api/user/histories 기록 (추가/변경할 때마다 뒤에 붙임)
+    server.confirmed = {} # 멱등 키 -> 반영된 복약 기록
+    server.batch = True # False면 /api/user/histories/batch가 없는 예전 서버처럼 동작
+    server.fail_confirmations = 0 # 이 횟수만큼 복약 기록 요청에 fail_status로 응답
+    server.fail_status = 503
+    server.invalid_schedules = set() # 이 스케줄 id의 복약 기록은 422로 거절
+    server.delta_sync = True # False면 since/cursor 없이 항상 전체 목록을 주는 예전 서버처럼 동작
+    server.batch_sync = True # False면 /api/user/histories/sync가 없는 예전 서버처럼 동작
+    server.users = {3: "홍길동"} # /api/users 사용자 id -> 이름
+    server.requests = []
+    server.chunks_received = 0
+    server.tts_audio = STUB_TTS_AUDIO
+    server.llm_delay = 0 # /api/FEtest 응답 지연 (초)
+    server.reply_audio = STUB_TTS_AUDIO # /audio/reply.mp3 본문
+    server.reply_seconds = 0 # 답변 음성을 다 보내는 데 걸리는 시간
+    server.aborted_downloads = 0
+    server.fail_downloads = 0 # 이 횟수만큼 답변 음성 다운로드에 503으로 응답 (재시도 확인용)
+    server.aborted_requests = 0 # 응답을 기다리던 중 클라이언트가 끊은 요청 수
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    server = start_stub_server(port, verbose=True)
+    print(f"stub 서버 실행 중: {server.url}")
+    threading.Event().wait()
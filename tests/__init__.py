@@ -0,0 +1,15 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+import outbox
+import schedule_store
+import tts_cache
+
+# 개발 PC에서 테스트해도 기기 경로(/home/pi/my_project)에 파일이 생기지 않도록 저장소와 캐시는 임시 폴더에 둠
+_tmp = tempfile.mkdtemp(prefix="salgai-test-")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+schedule_store.store.path = os.path.join(_tmp, "schedule.db")
+outbox.confirmations.db_path = schedule_store.store.path
+tts_cache.tts_cache.directory = os.path.join(_tmp, "tts_cache")
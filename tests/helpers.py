@@ -0,0 +1,31 @@
+import time
+
+import numpy as np
+
+from audio_capture import CAPTURE_RATE, FRAMES_PER_BUFFER, capture
+
+# 마이크 대신 capture 큐에 넣을 발화 (무음 - 사인파 - 무음, 44.1kHz int16 조각 목록)
+def speech_chunks(lead=0.3, speech=0.6, tail=0.9, amplitude=8000):
+    t = np.arange(int(CAPTURE_RATE * speech)) / CAPTURE_RATE
+    pcm = np.concatenate([
+        np.zeros(int(CAPTURE_RATE * lead)),
+        amplitude * np.sin(2 * np.pi * 440 * t),
+        np.zeros(int(CAPTURE_RATE * tail)),
+    ]).astype(np.int16)
+    return [pcm[i:i + FRAMES_PER_BUFFER].tobytes() for i in range(0, len(pcm), FRAMES_PER_BUFFER)]
+
+# 녹음 함수가 읽어가도록 마이크 큐를 채우는 함수 (스트림은 열지 않음)
+def feed_mic(chunks):
+    capture.flush()
+    capture.noise_floor = None
+    for chunk in chunks:
+        capture._chunks.put_nowait(chunk)
+
+# condition이 참이 될 때까지 timeout초 동안 기다리는 함수
+def wait_until(condition, timeout):
+    start = time.time()
+    while time.time() - start < timeout:
+        if condition():
+            return True
+        time.sleep(0.001)
+    return condition()
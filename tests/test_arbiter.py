@@ -0,0 +1,45 @@
+import threading
+import unittest
+
+from audio_arbiter import PRIORITY_LISTEN, PRIORITY_REMINDER, PRIORITY_USER, AudioArbiter
+
+# 사용자 대화가 마이크만 잡고 있어도 알림이 스피커를 받아 말을 걸지 않는지 확인
+class ArbiterTest(unittest.TestCase):
+    def setUp(self):
+        self.arbiter = AudioArbiter()
+
+    def hold(self, resources, priority):
+        ready, done = threading.Event(), threading.Event()
+        def run():
+            session = self.arbiter.acquire(resources, priority)
+            ready.set()
+            done.wait()
+            self.arbiter.release(session)
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return done
+
+    def test_reminder_waits_for_user_dialog(self):
+        done = self.hold("mic", PRIORITY_USER)
+        self.assertIsNone(self.arbiter.acquire("speaker", PRIORITY_REMINDER, timeout=0.1))
+        done.set()
+        session = self.arbiter.acquire("speaker", PRIORITY_REMINDER, timeout=1)
+        self.assertIsNotNone(session)
+        self.arbiter.release(session)
+
+    def test_reminder_takes_mic_from_wakeword_listener(self):
+        done = self.hold("mic", PRIORITY_LISTEN)
+        session = self.arbiter.acquire("speaker", PRIORITY_REMINDER, timeout=0.1)
+        self.assertIsNotNone(session)
+        self.arbiter.release(session)
+        done.set()
+
+    def test_dialog_thread_uses_speaker_while_holding_mic(self):
+        mic = self.arbiter.acquire("mic", PRIORITY_USER)
+        session = self.arbiter.acquire("speaker", PRIORITY_REMINDER, timeout=0.1) # 같은 대화 안의 안내
+        self.assertIsNotNone(session)
+        self.arbiter.release(session)
+        self.arbiter.release(mic)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from unittest import mock
+
+import http_client
+from async_core import core
+from http_client import async_client, client
+from stub_server import STUB_TTS_AUDIO, start_stub_server
+
+# aiohttp 경로(없으면 requests 경로)에서도 동기 클라이언트와 같은 재시도 정책을 따르는지 확인
+class AsyncClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+        client.base_url = cls.server.url
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.server.requests.clear()
+        patcher = mock.patch.object(http_client, "BACKOFF", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, method, path, **kwargs):
+        async def run():
+            response = await async_client.request(method, "llm_audio", path, **kwargs)
+            try:
+                return response.status_code, await response.read()
+            finally:
+                response.close()
+        return core.run(run())
+
+    def attempts(self, path):
+        return sum(1 for _, p, _, _ in self.server.requests if p == path)
+
+    def test_get_is_retried_after_server_error(self):
+        self.server.fail_downloads = 1
+        self.assertEqual(self.fetch("GET", "/audio/reply.mp3"), (200, STUB_TTS_AUDIO))
+        self.assertEqual(self.attempts("/audio/reply.mp3"), 2)
+
+    def test_post_is_not_retried_after_server_error(self):
+        self.server.fail_confirmations = 1
+        status, _ = self.fetch("POST", "/api/user/histories/batch", json={"records": []})
+        self.assertEqual(status, 503)
+        self.assertEqual(self.attempts("/api/user/histories/batch"), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+import audio_encoder
+from http_client import client
+from tests.helpers import wait_until
+
+# 업로드 포맷 확인이 녹음을 막지 않고, 실패하면 한동안 다시 묻지 않는지 확인
+class UploadFormatTest(unittest.TestCase):
+    def setUp(self):
+        audio_encoder._negotiated = None
+        audio_encoder._negotiating = False
+        audio_encoder._retry_at = 0
+        audio_encoder._rejected.clear()
+
+    def test_does_not_wait_for_server(self):
+        reply = threading.Event()
+        def slow_get(*args, **kwargs):
+            reply.wait(2)
+            raise requests.ConnectTimeout("timed out")
+        with mock.patch.object(client, "get", side_effect=slow_get) as get:
+            start = time.time()
+            self.assertEqual(audio_encoder.upload_format(), "wav")
+            self.assertEqual(audio_encoder.upload_format(), "wav")
+            self.assertLess(time.time() - start, 0.1)
+            reply.set()
+            self.assertTrue(wait_until(lambda: not audio_encoder._negotiating, 1))
+        self.assertEqual(get.call_count, 1) # 묻는 중에는 다시 묻지 않음
+
+    def test_failure_is_cached(self):
+        with mock.patch.object(client, "get", side_effect=requests.ConnectionError("unreachable")) as get:
+            audio_encoder.negotiate_in_background()
+            self.assertTrue(wait_until(lambda: get.call_count == 1 and not audio_encoder._negotiating, 1))
+            for _ in range(3):
+                self.assertEqual(audio_encoder.upload_format(), "wav")
+            time.sleep(0.05)
+            self.assertEqual(get.call_count, 1)
+            audio_encoder._retry_at = time.time() # 대기 시간이 지나면 다시 물어봄
+            audio_encoder.upload_format()
+            self.assertTrue(wait_until(lambda: get.call_count == 2, 1))
+
+if __name__ == "__main__":
+    unittest.main()
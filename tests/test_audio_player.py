@@ -0,0 +1,40 @@
+import threading
+import time
+import unittest
+
+import requests
+
+from audio_player import DEVICE_CHANNELS, DEVICE_RATE, SAMPWIDTH, AudioPlayer
+
+# 재생 중 stop()이 불리면 남은 소리를 다시 띄운 aplay로 보내지 않고 바로 멈추는지 확인
+class AudioPlayerTest(unittest.TestCase):
+    def test_stop_does_not_replay_cached_phrase(self):
+        player = AudioPlayer(command=["sleep", "5"]) # 장치처럼 바로 다 받아가지 않는 재생기 (파이프가 차면 쓰기가 멈춤)
+        pcm = b"\0" * (DEVICE_RATE * DEVICE_CHANNELS * SAMPWIDTH * 2) # 한 조각으로 넘기는 2초짜리 고정 문구
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(finished=player.play_pcm([pcm]), at=time.time()))
+        thread.start()
+        time.sleep(0.3)
+        proc = player._proc
+        stopped_at = time.time()
+        player.stop()
+        thread.join(2)
+        self.assertFalse(result["finished"])
+        self.assertLess(result["at"] - stopped_at, 0.1)
+        self.assertIn(player._proc, (None, proc)) # 멈춘 뒤 aplay를 다시 띄우지 않음
+        player.stop()
+    def test_dropped_download_ends_playback(self):
+        player = AudioPlayer(command=["sh", "-c", "cat > /dev/null"], decoder=["cat"])
+        def download():
+            yield b"\0" * 4096
+            raise requests.ConnectionError("connection reset") # 받는 중에 끊긴 연결
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(finished=player.play_mp3(download())), daemon=True)
+        thread.start()
+        thread.join(2)
+        self.assertFalse(thread.is_alive(), "다운로드가 끊긴 뒤 재생이 끝나지 않음")
+        self.assertFalse(result["finished"])
+        player.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import threading
+import time
+import unittest
+
+from async_core import core
+from audio_arbiter import PRIORITY_USER
+from audio_buffer import AudioBuffer
+from audio_player import DEVICE_CHANNELS, DEVICE_RATE, player
+from http_client import client
+from llmTts import send_audio_and_get_response
+from stub_server import start_stub_server
+from tests.helpers import wait_until
+
+STOP_BOUND = 0.1 # 웨이크워드로 취소한 뒤 멈출 때까지 허용하는 시간 (초)
+
+# 가짜 서버와 가짜 재생기(PCM을 버리는 명령)로 LLM 요청/재생 중 취소에 걸리는 시간 확인
+class CancelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+        client.base_url = cls.server.url
+        player.command = ["sh", "-c", "cat > /dev/null"]
+        player.decoder = ["cat"] # 답변 음성은 장치 포맷의 PCM이므로 디코딩 없이 그대로 전달
+        cls.server.reply_audio = b"\0" * (DEVICE_RATE * DEVICE_CHANNELS * 2 * 5)
+        cls.audio = AudioBuffer(b"\0\1" * 16000)
+
+    @classmethod
+    def tearDownClass(cls):
+        player.stop()
+        player.command = None
+        player.decoder = None
+        cls.server.shutdown()
+
+    def start_request(self):
+        done = threading.Event()
+
+        def run():
+            send_audio_and_get_response(self.audio, "/api/FEtest", {})
+            done.set()
+
+        threading.Thread(target=run, daemon=True).start()
+        return done
+
+    def llm_requests(self):
+        return sum(1 for _, path, _, _ in self.server.requests if path == "/api/FEtest")
+
+    def test_cancel_while_waiting_for_reply(self):
+        self.server.llm_delay = 3
+        self.server.reply_seconds = 0
+        requests_before = self.llm_requests()
+        aborted_before = self.server.aborted_requests
+        done = self.start_request()
+        self.assertTrue(wait_until(lambda: self.llm_requests() > requests_before, 2))
+        time.sleep(0.2)
+
+        start = time.time()
+        core.cancel_below(PRIORITY_USER)
+        self.assertTrue(done.wait(STOP_BOUND), "취소 후 호출이 반환되지 않음")
+        # 응답을 기다리던 연결도 끊겨야 함 (서버가 응답을 다 만들 때까지 요청이 남아 있지 않음)
+        self.assertTrue(wait_until(lambda: self.server.aborted_requests > aborted_before, STOP_BOUND),
+                        "응답 대기 중인 연결이 끊기지 않음")
+        self.assertLess(time.time() - start, STOP_BOUND * 2)
+        time.sleep(0.5)
+        self.assertEqual(self.llm_requests(), requests_before + 1, "취소된 요청을 다시 보냄")
+
+    def test_cancel_during_playback(self):
+        self.server.llm_delay = 0
+        self.server.reply_seconds = 5
+        aborted_before = self.server.aborted_downloads
+        done = self.start_request()
+        self.assertTrue(wait_until(lambda: player._proc is not None and player._proc.poll() is None, 2), "재생이 시작되지 않음")
+        time.sleep(0.5)
+
+        core.cancel_below(PRIORITY_USER)
+        self.assertTrue(done.wait(STOP_BOUND), "취소 후 호출이 반환되지 않음")
+        self.assertTrue(wait_until(lambda: player._proc is None or player._proc.poll() is not None, STOP_BOUND),
+                        "재생기가 멈추지 않음")
+        self.assertTrue(wait_until(lambda: self.server.aborted_downloads > aborted_before, 1), "다운로드가 끊기지 않음")
+
+if __name__ == "__main__":
+    unittest.main()
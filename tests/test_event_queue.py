@@ -0,0 +1,36 @@
+import unittest
+from unittest import mock
+
+import event_queue
+from event_queue import EventQueue
+from http_client import client
+from stub_server import start_stub_server
+from tests.helpers import wait_until
+
+# 예상하지 못한 오류가 나도 전송 thread가 살아서 다음 이벤트를 보내는지 확인
+class EventQueueTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+        client.base_url = cls.server.url
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        patcher = mock.patch.object(event_queue, "RETRY_DELAY", 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_worker_survives_unexpected_errors(self):
+        queue = EventQueue()
+        queue.post("wake", "/api/wake", json={"bad": {1, 2}}) # JSON으로 바꿀 수 없는 본문
+        queue.post("wake", "/api/wake", params={"user_id": 1})
+        self.assertTrue(wait_until(lambda: queue.depth() == 0, 2))
+        self.assertTrue(queue._thread.is_alive())
+        self.assertEqual(queue.sent, 1)
+        self.assertEqual(queue.dropped, 1)
+
+if __name__ == "__main__":
+    unittest.main()
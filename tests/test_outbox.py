@@ -0,0 +1,67 @@
+import sqlite3
+import threading
+import unittest
+from unittest import mock
+
+import outbox
+from http_client import client
+from outbox import Outbox
+from stub_server import start_stub_server
+from tests.helpers import wait_until
+
+# 복약 기록 큐가 거절/재시도/저장소 오류에서 다른 기록을 잃지 않는지 확인
+class OutboxTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+        client.base_url = cls.server.url
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.server.confirmed.clear()
+        self.server.invalid_schedules = set()
+        self.server.fail_confirmations = 0
+        self.server.fail_status = 503
+        patcher = mock.patch.object(outbox, "RETRY_DELAY", 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.outbox = Outbox("/api/user/histories", "/api/user/histories/batch", db_path=":memory:")
+
+    def confirmed_ids(self):
+        return sorted(record["schedule_id"] for record in self.server.confirmed.values())
+
+    def test_invalid_record_does_not_drop_the_batch(self):
+        self.server.invalid_schedules = {2}
+        queued = threading.Event()
+        oldest = self.outbox._oldest
+        with mock.patch.object(self.outbox, "_oldest", side_effect=lambda limit: queued.wait() and oldest(limit)):
+            for schedule_id in (1, 2, 3): # 셋이 한 묶음으로 나가도록 모두 저장한 뒤 전송 시작
+                self.outbox.put({"schedule_id": schedule_id, "taken_at": "26.01.01.09.00"})
+            queued.set()
+            self.assertTrue(wait_until(lambda: self.outbox.depth() == 0, 5))
+        self.assertEqual(self.confirmed_ids(), [1, 3])
+        self.assertEqual(self.outbox.rejected, 1)
+
+    def test_rate_limited_records_are_retried(self):
+        for status in (429, 408):
+            self.server.confirmed.clear()
+            self.server.fail_status = status
+            self.server.fail_confirmations = 2
+            self.outbox.put({"schedule_id": status, "taken_at": "26.01.01.09.00"})
+            self.assertTrue(wait_until(lambda: self.outbox.depth() == 0, 5))
+            self.assertEqual(self.confirmed_ids(), [status])
+        self.assertEqual(self.outbox.rejected, 0)
+
+    def test_sender_survives_store_errors(self):
+        with mock.patch.object(self.outbox, "_oldest", side_effect=sqlite3.OperationalError("disk I/O error")) as failing:
+            self.outbox._ensure_workers()
+            self.assertTrue(wait_until(lambda: failing.call_count >= 1, 2))
+        self.outbox.put({"schedule_id": 7, "taken_at": "26.01.01.09.00"})
+        self.assertTrue(wait_until(lambda: self.outbox.depth() == 0, 5))
+        self.assertEqual(self.confirmed_ids(), [7])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+
+import audio_encoder
+import llmTts
+from audio_capture import capture
+from audio_player import player
+from http_client import client
+from stub_server import STUB_TRANSCRIPT, start_stub_server
+from tests.helpers import feed_mic, speech_chunks
+
+# 웨이크워드 이후 한 번의 업로드로 인식 결과와 의도 파악 응답을 받는 경로와,
+# 통합 엔드포인트가 없는 서버에서 같은 녹음으로 두 요청을 병렬로 보내는 경로 확인
+class SttIntentTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+        client.base_url = cls.server.url
+        player.command = ["sh", "-c", "cat > /dev/null"]
+        player.decoder = ["cat"]
+        cls.server.reply_audio = b"\0" * 4096
+
+    @classmethod
+    def tearDownClass(cls):
+        player.stop()
+        player.command = None
+        player.decoder = None
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.server.requests.clear()
+        self.server.aborted_downloads = 0
+        llmTts._combined_supported = None
+        audio_encoder._negotiated = None
+        audio_encoder._rejected.clear()
+        audio_encoder.negotiate()
+        patcher = mock.patch.object(capture, "start", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        feed_mic(speech_chunks())
+
+    def posted(self):
+        return [(path, params.get("responsetype")) for method, path, params, _ in self.server.requests if method == "POST"]
+
+    def reply_downloads(self):
+        return sum(1 for _, path, _, _ in self.server.requests if path == "/audio/reply.mp3")
+
+    def test_one_upload_for_transcript_and_intent(self):
+        self.server.combined = True
+        self.assertEqual(llmTts.stt_and_intent(3, flush=False), STUB_TRANSCRIPT)
+        self.assertEqual(self.posted(), [("/api/stt/intent", "intent")])
+        self.assertTrue(llmTts._combined_supported)
+        self.assertEqual(self.reply_downloads(), 1)
+
+    def test_parallel_requests_without_combined_endpoint(self):
+        self.server.combined = False
+        self.assertEqual(llmTts.stt_and_intent(3, flush=False), STUB_TRANSCRIPT)
+        posted = self.posted()
+        self.assertEqual(posted[0], ("/api/stt/intent", "intent"))
+        self.assertCountEqual(posted[1:], [("/api/stt", None), ("/api/FEtest", "intent")]) # 녹음은 한 번, 요청은 동시에
+        self.assertIs(llmTts._combined_supported, False)
+        self.assertEqual(self.reply_downloads(), 1)
+
+        # 다음부터는 통합 엔드포인트를 건너뜀
+        self.server.requests.clear()
+        feed_mic(speech_chunks())
+        self.assertEqual(llmTts.stt_and_intent(3, flush=False), STUB_TRANSCRIPT)
+        self.assertCountEqual(self.posted(), [("/api/stt", None), ("/api/FEtest", "intent")])
+
+if __name__ == "__main__":
+    unittest.main()
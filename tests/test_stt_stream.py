@@ -0,0 +1,53 @@
+import unittest
+from unittest import mock
+
+import audio_encoder
+import global_state
+import RequestStt
+from audio_capture import capture
+from http_client import client
+from stub_server import STUB_TRANSCRIPT, start_stub_server
+from tests.helpers import feed_mic, speech_chunks
+
+# 녹음하면서 /api/stt/stream으로 보내는 경로와, 스트리밍을 지원하지 않는 서버에서 일괄 업로드로 넘어가는 경로 확인
+class StreamingSttTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+        client.base_url = cls.server.url
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.server.requests.clear()
+        RequestStt._stream_supported = None
+        audio_encoder._negotiated = None
+        audio_encoder._rejected.clear()
+        audio_encoder.negotiate()
+        global_state.last_recording = None
+        patcher = mock.patch.object(capture, "start", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        feed_mic(speech_chunks())
+
+    def posted(self):
+        return [path for method, path, _, _ in self.server.requests if method == "POST"]
+
+    def test_streams_while_recording(self):
+        self.server.streaming = True
+        self.assertEqual(RequestStt.upload_stt(flush=False), STUB_TRANSCRIPT)
+        self.assertEqual(self.posted(), ["/api/stt/stream"])
+        self.assertGreater(self.server.chunks_received, 1)
+        self.assertTrue(RequestStt._stream_supported)
+        self.assertGreater(len(global_state.last_recording), 0)
+
+    def test_falls_back_to_one_shot_upload(self):
+        self.server.streaming = False
+        self.assertEqual(RequestStt.upload_stt(flush=False), STUB_TRANSCRIPT)
+        self.assertEqual(self.posted(), ["/api/stt/stream", "/api/stt"]) # 이미 녹음된 오디오를 다시 녹음하지 않고 업로드
+        self.assertIs(RequestStt._stream_supported, False)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import os
+import tempfile
+import unittest
+
+from tts_cache import TtsCache
+
+# 다시 시작한 뒤에도 최근에 재생한 문구가 먼저 지워지지 않는지 확인
+class TtsCacheTest(unittest.TestCase):
+    def test_hits_survive_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TtsCache(directory, max_bytes=10)
+            cache.put("약 드셨나요?", b"aaaa")
+            cache.put("네?", b"bbbb")
+            for age, text in ((200, "약 드셨나요?"), (100, "네?")): # 먼저 저장한 문구가 더 오래됨
+                path = cache._path(cache.key(text))
+                os.utime(path, (os.path.getmtime(path) - age,) * 2)
+            self.assertEqual(cache.get("약 드셨나요?"), b"aaaa")
+
+            restarted = TtsCache(directory, max_bytes=10)
+            restarted.put("안녕하세요", b"cccc")
+            self.assertIsNotNone(restarted.get("약 드셨나요?"))
+            self.assertIsNone(restarted.get("네?"))
+    def test_directory_is_created_on_first_write(self):
+        with tempfile.TemporaryDirectory() as parent:
+            directory = os.path.join(parent, "tts_cache")
+            cache = TtsCache(directory)
+            self.assertFalse(os.path.exists(directory))
+            cache.put("네?", b"aaaa")
+            self.assertEqual(cache.get("네?"), b"aaaa")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+CACHE_DIR = "/home/pi/my_project/tts_cache"
+CACHE_MAX_BYTES = 20 * 1024 * 1024 # 디스크에 보관할 최대 크기
+
+# 문장(+음성 설정) 내용으로 키를 만드는 TTS 음성 캐시
+# mp3는 디스크에 LRU로 보관하고, 자주 쓰는 고정 문구는 디코딩된 PCM까지 메모리에 올려둠
+class TtsCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files = OrderedDict() # key -> 파일 크기 (뒤로 갈수록 최근 사용)
+        self._total = 0
+        self._pcm = {} # key -> 바로 재생 가능한 PCM (고정 문구)
+        self._load_index()
+
+    # 디스크에 있는 캐시 목록을 오래된 순서로 읽어오는 함수 (폴더는 처음 저장할 때 만듦)
+    def _load_index(self):
+        if not os.path.isdir(self.directory):
+            return
+        try:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(".mp3"):
+                    stat = os.stat(os.path.join(self.directory, name))
+                    entries.append((stat.st_mtime, name[:-4], stat.st_size))
+            for _, key, size in sorted(entries):
+                self._files[key] = size
+                self._total += size
+        except OSError as e:
+            print(f"TTS 캐시 폴더를 읽을 수 없습니다: {e}")
+
+    @staticmethod
+    def key(text, voice=None):
+        raw = json.dumps({"text": text, "voice": voice or {}}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".mp3")
+
+    def get_pcm(self, text, voice=None):
+        return self._pcm.get(self.key(text, voice))
+
+    def set_pcm(self, text, pcm, voice=None):
+        self._pcm[self.key(text, voice)] = pcm
+
+    # 캐시된 mp3 바이트를 돌려주는 함수 (없으면 None)
+    def get(self, text, voice=None):
+        key = self.key(text, voice)
+        with self._lock:
+            if key not in self._files:
+                return None
+            self._files.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path) # 다시 시작해도 _load_index가 mtime으로 최근 사용 순서를 복원하도록
+            return data
+        except OSError:
+            with self._lock:
+                self._total -= self._files.pop(key, 0)
+            return None
+
+    # mp3를 저장하고 용량을 넘으면 오래 안 쓴 것부터 지우는 함수
+    def put(self, text, data, voice=None):
+        if not data:
+            return
+        key = self.key(text, voice)
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path) # 중간에 꺼져도 깨진 파일이 남지 않도록 교체
+        except OSError as e:
+            print(f"TTS 캐시 저장 실패: {e}")
+            return
+
+        with self._lock:
+            self._total += len(data) - self._files.pop(key, 0)
+            self._files[key] = len(data)
+            while self._total > self.max_bytes and len(self._files) > 1:
+                old_key, size = self._files.popitem(last=False)
+                self._total -= size
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    # 스트리밍으로 받는 조각을 그대로 넘기고, 끝까지 받으면 캐시에 저장하는 함수
+    def collect(self, text, chunks, voice=None):
+        data = bytearray()
+        for chunk in chunks:
+            data += chunk
+            yield chunk
+        self.put(text, bytes(data), voice)
+
+tts_cache = TtsCache()
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from http_client import client
+from schedule_store import store
+
+DEFAULT_NAME = "사용자"
+REFRESH_INTERVAL = 3600 # 사용자 목록을 다시 받는 간격 (초)
+
+# 사용자 id -> 이름 캐시
+# 알림 문구를 만들 때마다 /api/users 전체 목록을 받아 훑지 않도록 한 번 받은 목록을 dict로 보관하고,
+# 저장소에도 남겨서 시작할 때 서버에 연결되지 않아도 이름으로 안내함
+class UserDirectory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = None # 처음 쓸 때 저장소에서 읽음
+        self._fetched_at = 0
+        self._refreshing = False
+
+    def _cached(self):
+        with self._lock:
+            if self._names is None:
+                try:
+                    self._names = store.load_users()
+                except Exception as e:
+                    print(f"저장된 사용자 목록 읽기 실패: {e}")
+                    self._names = {}
+            return self._names
+
+    # 서버에서 사용자 목록을 받아 캐시와 저장소를 갱신하는 함수 (실패하면 False, 캐시는 그대로)
+    def refresh(self):
+        try:
+            res = client.get("users", "/api/users")
+            if res.status_code != 200:
+                print(f"GET 서버 응답 오류: {res.status_code} - {res.text}")
+                return False
+            names = {user["id"]: user["name"] for user in res.json().get("users_list", [])}
+        except Exception as e:
+            print(f"이름 조회 실패: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._fetched_at = time.time() # 실패해도 REFRESH_INTERVAL 동안은 다시 묻지 않음
+                self._refreshing = False
+
+        with self._lock:
+            self._names = names
+        try:
+            store.save_users(names)
+        except Exception as e:
+            print(f"사용자 목록 저장 실패: {e}")
+        return True
+
+    # 저장된 목록이 없을 때만 (처음 설치한 경우) 서버에서 받을 때까지 기다림
+    def ensure_loaded(self):
+        if not self._cached():
+            self.refresh()
+
+    # 사용자 이름 (서버에 묻지 않고 캐시에서 바로 돌려줌, 목록이 오래되었으면 백그라운드에서 갱신)
+    def name(self, user_id):
+        names = self._cached()
+        with self._lock:
+            stale = time.time() - self._fetched_at > REFRESH_INTERVAL and not self._refreshing
+            if stale:
+                self._refreshing = True
+        if stale:
+            threading.Thread(target=self.refresh, daemon=True).start()
+        return names.get(user_id, DEFAULT_NAME)
+
+directory = UserDirectory()
@@ -1,4 +1,3 @@
-import contextlib
 import json
 import os
 import re
@@ -14,23 +13,12 @@ MIC_CONFIG_PATH = "/home/pi/my_project/.mic_config"
 SPEAKER_CONFIG_PATH = "/home/pi/my_project/.speaker_config"
 
 
-@contextlib.contextmanager
-def safe_play(audio_segment):
-    speaker_device = load_speaker_device()
-
-    # 스피커가 mono 지원 안 할 수도 있으므로 stereo로 변경
-    if audio_segment.channels == 1:
-        audio_segment = audio_segment.set_channels(2)
-
-    audio_segment = audio_segment.set_frame_rate(44100)
-
-    temp_path = "/tmp/temp_audio.wav"
-    audio_segment.export(temp_path, format="wav")
-
-    try:
-        subprocess.run(["aplay", "-D", speaker_device, temp_path], check=True)
-    except Exception as e:
-        print(f"에러 {e}")
+# 스트리밍으로 받는 조각을 그대로 넘기면서 파일에도 저장하는 함수 (디버깅용)
+def tee_chunks(chunks, path):
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
 
 # 마이크 찾는 함수
 def auto_save_mic():
@@ -158,9 +146,13 @@ BASE_URL = "http://3.34.179.85:8000"
 
 # 사용자 ID
 USER_ID = {user_id}
+USER_IDS = [USER_ID]
 
 WAV_PATH = "/home/pi/my_project/stt.wav"
 LLM_VOICE_PATH = "/home/pi/my_project/llm_answer.mp3"
+DEBUG_AUDIO = False
+STT_PREROLL_MS = 1000
+UPLOAD_FORMATS = ("opus", "flac", "wav")
 
 # 복약 리마인더 설정
 DOSAGE_TIME = {dosage_time}
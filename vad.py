@@ -0,0 +1,135 @@
+import audioop
+
+SNR_RATIO = 3.0 # 소음 대비 몇 배 이상이면 말소리로 판단
+MIN_SPEECH_RMS = 300 # 아주 조용한 방에서도 이 값 이하는 말소리로 보지 않음
+NOISY_ZCR = 0.35 # 영교차율이 이보다 높고 에너지가 약하면 잡음(치찰음/히스)으로 판단
+ONSET_MS = 60 # 말 시작으로 판단할 연속 발화 길이
+HANGOVER_MS = 600 # 말이 끝난 뒤 이만큼 조용하면 발화 종료
+LEAD_MS = 200 # 앞쪽에 남겨둘 무음 길이
+TAIL_MS = 200 # 뒤쪽에 남겨둘 무음 길이
+PRE_TRIGGER_MS = 3000 # 말 시작 전 보관하는 최대 길이 (시작 위치를 거슬러 찾을 때 사용)
+
+# 소음 바닥을 계속 추적하는 에너지 + 영교차율 기반 음성 구간 검출기
+# push()는 업로드에 포함할 조각만 돌려주므로 앞뒤 무음은 자동으로 잘림
+class VoiceActivityDetector:
+    def __init__(self, rate=16000, hangover_ms=HANGOVER_MS, lead_ms=LEAD_MS, tail_ms=TAIL_MS, onset_ms=ONSET_MS, noise_floor=None):
+        self.rate = rate
+        self.hangover_ms = hangover_ms
+        self.lead_ms = lead_ms
+        self.tail_ms = min(tail_ms, hangover_ms)
+        self.onset_ms = onset_ms
+
+        self.noise_floor = noise_floor # 마이크 스트림에서 추적 중인 소음 크기가 있으면 그 값에서 시작
+        self.triggered = False # 말이 시작되었는지
+        self.ended = False # 발화가 끝났는지
+        self.elapsed_ms = 0 # 지금까지 처리한 오디오 길이
+        self.speech_end_ms = None # 마지막 말소리 조각이 끝난 시점
+        self._speech_run_ms = 0
+        self._silence_ms = 0
+        self._held = [] # 아직 내보내지 않은 (조각, 길이ms, rms) 목록
+
+    def threshold(self):
+        return max(self.noise_floor * SNR_RATIO, MIN_SPEECH_RMS)
+
+    # 조각 하나의 rms와 말소리 여부를 구하고 소음 바닥을 갱신하는 함수
+    def measure(self, data):
+        samples = len(data) // 2
+        if samples == 0:
+            return 0, False
+        rms = audioop.rms(data, 2)
+        zcr = audioop.cross(data, 2) / samples
+
+        if self.noise_floor is None: # 첫 조각은 주변 소음으로 가정 (말로 시작했다면 쉬는 순간 바로 내려감)
+            self.noise_floor = max(rms, 1)
+
+        threshold = self.threshold()
+        speech = rms > threshold and not (zcr > NOISY_ZCR and rms < threshold * 2)
+
+        if rms < self.noise_floor: # 조용해지면 빠르게 따라감
+            self.noise_floor += (rms - self.noise_floor) * 0.3
+        elif speech or self.triggered: # 말하는 중에는 아주 천천히 올려서 소음이 커진 방에서 갇히지 않도록 함
+            self.noise_floor += (rms - self.noise_floor) * 0.005
+        else:
+            self.noise_floor += (rms - self.noise_floor) * 0.05
+        self.noise_floor = max(self.noise_floor, 1)
+        return rms, speech
+
+    # 녹음 시작 전에 이미 지나간 오디오(pre-roll)를 앞쪽 후보로 넣어두는 함수
+    # 말 시작 판단과 소음 추적에는 쓰지 않고, 말이 시작되면 시작 위치를 거슬러 찾을 때만 사용
+    def prime(self, data):
+        if not data or self.triggered:
+            return
+        chunk_ms = len(data) / 2 / self.rate * 1000
+        self._held.append((data, chunk_ms, audioop.rms(data, 2)))
+        self._keep_recent(PRE_TRIGGER_MS)
+
+    # 오디오 조각을 넣고, 업로드에 포함할 조각 목록을 돌려주는 함수
+    def push(self, data):
+        if self.ended:
+            return []
+
+        chunk_ms = len(data) / 2 / self.rate * 1000
+        self.elapsed_ms += chunk_ms
+        rms, speech = self.measure(data)
+        self._held.append((data, chunk_ms, rms))
+
+        if not self.triggered:
+            self._speech_run_ms = self._speech_run_ms + chunk_ms if speech else 0
+            if self._speech_run_ms >= self.onset_ms:
+                self.triggered = True
+                self.speech_end_ms = self.elapsed_ms
+                self._trim_leading()
+                return self._release()
+            self._keep_recent(PRE_TRIGGER_MS)
+            return []
+
+        if speech:
+            self._silence_ms = 0
+            self.speech_end_ms = self.elapsed_ms
+            return self._release() # 중간의 짧은 쉼은 그대로 포함
+
+        self._silence_ms += chunk_ms
+        if self._silence_ms >= self.hangover_ms:
+            self.ended = True
+            return self.flush()
+        return []
+
+    # 발화가 끝났을 때 뒤쪽 여유 구간만 남기고 돌려주는 함수
+    def flush(self):
+        if not self.triggered:
+            self._held = []
+            return []
+        tail = []
+        kept_ms = 0
+        for data, chunk_ms, _ in self._held:
+            if kept_ms >= self.tail_ms:
+                break
+            tail.append(data)
+            kept_ms += chunk_ms
+        self._held = []
+        return tail
+
+    def _release(self):
+        chunks = [data for data, _, _ in self._held]
+        self._held = []
+        return chunks
+
+    # 말 시작이 확정되면 현재 소음 기준으로 첫 말소리 위치를 거슬러 찾고 앞쪽 여유만 남기는 함수
+    def _trim_leading(self):
+        threshold = self.threshold()
+        start = len(self._held) - 1
+        for i, (_, _, rms) in enumerate(self._held):
+            if rms > threshold:
+                start = i
+                break
+        lead = 0
+        while start > 0 and lead < self.lead_ms:
+            start -= 1
+            lead += self._held[start][1]
+        del self._held[:start]
+
+    # 보관 중인 조각을 최근 limit_ms 만큼만 남기는 함수
+    def _keep_recent(self, limit_ms):
+        total = sum(chunk_ms for _, chunk_ms, _ in self._held)
+        while self._held and total - self._held[0][1] >= limit_ms:
+            total -= self._held.pop(0)[1]